@@ -0,0 +1,150 @@
+"""Closed-loop load test comparing how many requests a single server process keeps in flight.
+
+Runs ``--concurrency`` clients against each target for ``--duration`` seconds per level.
+Each client sends its next request as soon as the last one returns. For every target and
+level it reports throughput, latency percentiles, errors and the mean number of requests
+in flight (Little's law: total latency / wall time). Under WSGI that number stops at the
+thread count and latency grows instead; under ASGI it should keep up with the clients.
+Start one process of each, then point the test at both:
+
+    uvicorn fun_things.asgi:application --port 8001 --workers 1
+    gunicorn fun_things.wsgi:application --bind 127.0.0.1:8002 --workers 1 --threads 8
+
+    python experiments/20261018_asgi_load/loadtest.py \
+        --target asgi=http://127.0.0.1:8001 --target wsgi=http://127.0.0.1:8002 \
+        --endpoints details activity favorites --activity-ids 1 2 3 --token "$FIREBASE_ID_TOKEN" \
+        --concurrency 1 8 32 128 256 --duration 10
+
+``favorites`` and ``preference`` need a Firebase ID token; without ``--token`` they are skipped.
+``preference`` upvotes the given activities, so only point it at a throwaway database.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import subprocess
+import time
+
+import httpx
+
+
+def endpoint_requests(args):
+    """Returns {endpoint: callable(client, rng) -> awaitable response} for the chosen endpoints."""
+    auth = {"Authorization": f"Bearer {args.token}"} if args.token else None
+    requests = {
+        "details": lambda client, rng: client.get(f"/core/get-activity-details/{rng.choice(args.activity_ids)}/"),
+        "activity": lambda client, rng: client.get(
+            "/core/get-activity/",
+            params={"latitude": args.latitude + rng.uniform(-1, 1), "longitude": args.longitude + rng.uniform(-1, 1)},
+            headers=auth,
+        ),
+    }
+    if auth:
+        requests["favorites"] = lambda client, rng: client.get(
+            "/core/get-user-favorites/", params={"view": "card", "limit": 20}, headers=auth
+        )
+        requests["preference"] = lambda client, rng: client.post(
+            "/core/update-preference/",
+            json={"activity_id": rng.choice(args.activity_ids), "action": "upvote"}, headers=auth,
+        )
+    return {name: requests[name] for name in args.endpoints if name in requests}
+
+
+async def run_level(base_url, send, concurrency, duration, seed):
+    """Drives ``concurrency`` closed-loop clients for ``duration`` seconds; returns latencies and errors."""
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def worker(worker_id):
+            nonlocal errors
+            rng = random.Random(seed + worker_id)
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await send(client, rng)
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - started)
+                errors += not ok
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        wall = time.perf_counter() - started
+    return latencies, errors, wall
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def summarize(latencies, errors, wall) -> dict:
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"requests": 0}
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / wall, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "mean_in_flight": round(sum(latencies) / wall, 1),
+    }
+
+
+async def main_async(args):
+    requests = endpoint_requests(args)
+    report = {"commit": args.commit, "args": vars(args), "results": []}
+    for (name, base_url), (endpoint, send), concurrency in itertools.product(
+        args.targets, requests.items(), args.concurrency
+    ):
+        await run_level(base_url, send, min(concurrency, 4), args.warmup, args.seed)  # Warm caches and connections
+        result = summarize(*await run_level(base_url, send, concurrency, args.duration, args.seed))
+        result.update(target=name, endpoint=endpoint, concurrency=concurrency)
+        report["results"].append(result)
+        print(
+            f"{name:>6} {endpoint:<10} c={concurrency:<4} {result.get('rps', 0):>8} req/s "
+            f"p50 {result.get('p50_ms', '-'):>7} ms  p99 {result.get('p99_ms', '-'):>7} ms  "
+            f"in flight {result.get('mean_in_flight', 0):>6}  errors {result.get('errors', 0)}"
+        )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", action="append", required=True, help="name=base URL, repeatable")
+    parser.add_argument(
+        "--endpoints", nargs="+", choices=["details", "activity", "favorites", "preference"],
+        default=["details", "activity", "favorites"],
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128, 256])
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per target, endpoint and level")
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--activity-ids", type=int, nargs="+", default=[1])
+    parser.add_argument("--latitude", type=float, default=44.4)
+    parser.add_argument("--longitude", type=float, default=-110.6)
+    parser.add_argument("--token", help="Firebase ID token for the authenticated endpoints")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="asgi_load.json")
+    args = parser.parse_args()
+    args.targets = [tuple(target.split("=", 1)) for target in args.target]
+
+    try:
+        args.commit = subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except Exception:
+        args.commit = "unknown"
+
+    report = asyncio.run(main_async(args))
+    report["args"].pop("token", None)  # Don't write credentials into the report
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
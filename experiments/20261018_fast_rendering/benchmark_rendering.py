@@ -0,0 +1,112 @@
+"""Compares DRF + JsonResponse against the core.rendering fast path for activity lists.
+
+Renders lists of unsaved NPSThingToDo instances (no database needed) through both
+paths and reports the median time per list and per activity, plus the speedup, as JSON
+so runs can be diffed between commits. The DRF path is what views used before:
+``JsonResponse({"activities": NPSThingToDoSerializer(activities, many=True).data})``.
+
+    python experiments/20261018_fast_rendering/benchmark_rendering.py --sizes 1 10 100 1000 10000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "fun_things.settings")
+
+import django
+django.setup()
+
+from django.contrib.gis.geos import Point
+from django.http import JsonResponse
+
+from fun_things.core.models import NPSThingToDo
+from fun_things.core.rendering import FastJsonResponse, render_activity
+from fun_things.core.serializers import NPSThingToDoSerializer
+
+WORDS = "hike trail river kayak museum history sunset canyon rim rapids bird wildlife camp lake".split()
+
+
+def make_activities(count: int, seed: int) -> list[NPSThingToDo]:
+    rng = random.Random(seed)
+    return [
+        NPSThingToDo(
+            id=i + 1,
+            nps_id=f"bench-{i}",
+            title=" ".join(rng.choices(WORDS, k=4)).title(),
+            description=" ".join(rng.choices(WORDS, k=rng.randint(40, 200))),
+            url=f"https://www.nps.gov/thingstodo/bench-{i}.htm",
+            image_url=f"https://www.nps.gov/common/uploads/bench-{i}.jpg",
+            location=Point(rng.uniform(-124, -67), rng.uniform(25, 49)) if rng.random() > 0.05 else None,
+            favorites_count=rng.randint(0, 50),
+            thumbs_up_count=rng.randint(0, 50),
+            thumbs_down_count=rng.randint(0, 50),
+        )
+        for i in range(count)
+    ]
+
+
+def drf_path(activities):
+    return JsonResponse({"activities": NPSThingToDoSerializer(activities, many=True).data}).content
+
+
+def fast_path(activities):
+    return FastJsonResponse({"activities": [render_activity(activity) for activity in activities]}).content
+
+
+def time_path(path, activities, repeats: int) -> float:
+    """Median seconds per call over ``repeats`` calls, after one warm-up call."""
+    path(activities)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        path(activities)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 10000])
+    parser.add_argument("--repeats", type=int, default=0, help="Calls per measurement; 0 scales with list size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="rendering_bench.json")
+    args = parser.parse_args()
+
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except Exception:
+        commit = "unknown"
+    report = {"commit": commit, "results": []}
+
+    for size in args.sizes:
+        activities = make_activities(size, args.seed)
+        # The paths must agree on the document before their speed means anything
+        assert json.loads(drf_path(activities)) == json.loads(fast_path(activities))
+        repeats = args.repeats or max(5, min(1000, 20000 // size))
+        drf = time_path(drf_path, activities, repeats)
+        fast = time_path(fast_path, activities, repeats)
+        result = {
+            "activities": size,
+            "repeats": repeats,
+            "drf_ms": round(drf * 1000, 3),
+            "fast_ms": round(fast * 1000, 3),
+            "drf_us_per_activity": round(drf / size * 1e6, 2),
+            "fast_us_per_activity": round(fast / size * 1e6, 2),
+            "speedup": round(drf / fast, 1),
+        }
+        report["results"].append(result)
+        print(f"{size:>6} activities  drf {result['drf_ms']:>9} ms  fast {result['fast_ms']:>9} ms  {result['speedup']:>5}x")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Measures cold-start import time of the WSGI and ASGI apps with ``python -X importtime``.
+
+Each run starts a fresh interpreter that imports the app module and then the URLconf,
+which is what a worker does before serving its first request (views are only imported
+through the URLconf). Reports the median wall time over the runs and the modules with
+the largest cumulative import time, as JSON so runs can be diffed between commits:
+
+    python experiments/20261018_import_time/benchmark_importtime.py --runs 10 --output importtime.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+TARGETS = {
+    "wsgi": "import fun_things.wsgi, fun_things.urls",
+    "asgi": "import fun_things.asgi, fun_things.urls",
+}
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|\s+(\S+)")
+# Prints wall time around the imports so interpreter start-up itself is excluded
+WRAPPER = "import time; started = time.perf_counter(); {code}; print(time.perf_counter() - started)"
+
+
+def run_once(code: str) -> tuple[float, dict]:
+    """Returns (wall seconds, {module: (self us, cumulative us)}) for one fresh interpreter."""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE="fun_things.settings", PYTHONPATH=ROOT)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", WRAPPER.format(code=code)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            modules[match.group(3)] = (int(match.group(1)), int(match.group(2)))
+    return float(result.stdout.strip().splitlines()[-1]), modules
+
+
+def summarize(runs, top: int, baseline: set) -> dict:
+    walls = [wall for wall, _ in runs]
+    # Median of each module's timings over the runs that imported it, ignoring what
+    # interpreter start-up (site, encodings, ...) imports before the app does
+    cumulative = {}
+    self_time = {}
+    for _, modules in runs:
+        for name, (self_us, cumulative_us) in modules.items():
+            if name in baseline:
+                continue
+            cumulative.setdefault(name, []).append(cumulative_us)
+            self_time.setdefault(name, []).append(self_us)
+
+    def ranked(timings):
+        return [
+            {"module": name, "ms": round(statistics.median(values) / 1000, 2)}
+            for name, values in sorted(timings.items(), key=lambda item: -statistics.median(item[1]))[:top]
+        ]
+
+    return {
+        "wall_ms_median": round(statistics.median(walls) * 1000, 1),
+        "wall_ms_min": round(min(walls) * 1000, 1),
+        "modules_imported": round(statistics.median(len(set(modules) - baseline) for _, modules in runs)),
+        "top_cumulative": ranked(cumulative),
+        "top_self": ranked(self_time),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--targets", nargs="+", choices=sorted(TARGETS), default=sorted(TARGETS))
+    parser.add_argument("--output", default="importtime.json")
+    args = parser.parse_args()
+
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        commit = "unknown"
+
+    baseline = set(run_once("pass")[1])
+    report = {"commit": commit, "runs": args.runs, "results": {}}
+    for target in args.targets:
+        runs = [run_once(TARGETS[target]) for _ in range(args.runs)]
+        report["results"][target] = summary = summarize(runs, args.top, baseline)
+        print(f"{target}: {summary['wall_ms_median']} ms median, {summary['modules_imported']} modules")
+        for entry in summary["top_cumulative"][:5]:
+            print(f"    {entry['ms']:8.1f} ms  {entry['module']}")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
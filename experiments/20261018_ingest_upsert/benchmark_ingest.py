@@ -0,0 +1,121 @@
+"""Compares per-row exists()+create() ingestion with NPSScraper.store_page's bulk upsert.
+
+Runs inside a throwaway test database with a stub LLM client, so only database round
+trips are measured. Each page is stored twice: once into an empty table (all inserts)
+and once more (all updates, the steady state of a re-sync):
+
+    python experiments/20261018_ingest_upsert/benchmark_ingest.py --items 5000 --page-size 50
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "fun_things.settings")
+
+import django
+django.setup()
+
+from django.contrib.gis.geos import Point
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment
+
+from fun_things.core.models import NPSThingToDo
+from fun_things.core.utils import NPSScraper, RewriteCache
+
+
+class EchoChatClient:
+    """Stands in for the OpenAI client, returning the prompt's description unchanged."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, max_tokens):
+        original = messages[-1]["content"].split("---")[1].strip()
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=original))])
+
+
+def synthetic_pages(rng: random.Random, items: int, page_size: int) -> list[list[dict]]:
+    things = [
+        {
+            "id": f"bench-{i}",
+            "title": f"Activity {i}",
+            "longDescription": f"<p>Description of activity {i}</p>",
+            "url": f"https://example.com/{i}",
+            "images": [{"url": f"https://example.com/{i}.jpg"}],
+            "latitude": str(rng.uniform(25, 49)),
+            "longitude": str(rng.uniform(-124, -67)),
+        }
+        for i in range(items)
+    ]
+    return [things[start:start + page_size] for start in range(0, items, page_size)]
+
+
+def legacy_store_page(scraper: NPSScraper, things_to_do):
+    """The previous store_page: one exists() and one INSERT per item."""
+    for thing in things_to_do:
+        if NPSThingToDo.objects.filter(nps_id=thing["id"]).exists():
+            continue
+        description = scraper.clean_description(scraper.rewrite_description(thing["longDescription"]))
+        NPSThingToDo.objects.create(
+            nps_id=thing["id"],
+            title=thing["title"],
+            description=description,
+            url=thing["url"],
+            image_url=thing["images"][0]["url"],
+            location=Point(float(thing["longitude"]), float(thing["latitude"])),
+            passes_qc=True,
+        )
+
+
+def measure(label: str, store, pages):
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        for page in pages:
+            store(page)
+        elapsed = time.perf_counter() - started
+    items = sum(len(page) for page in pages)
+    print(f"{label:<22} {elapsed:8.2f}s {items / elapsed:10.0f} items/s {len(queries.captured_queries):8d} queries")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    pages = synthetic_pages(random.Random(args.seed), args.items, args.page_size)
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    # Keep the content index store_page appends to away from the real recommender_data
+    data_dir = tempfile.mkdtemp(prefix="ingestbench-")
+    try:
+        with override_settings(
+            RECOMMENDER_DATA_DIR=data_dir, SYNC_CHECKPOINT_PATH=os.path.join(data_dir, "checkpoint.json")
+        ):
+            for name, make_store in (
+                ("legacy", lambda scraper: lambda page: legacy_store_page(scraper, page)),
+                ("bulk upsert", lambda scraper: scraper.store_page),
+            ):
+                NPSThingToDo.objects.all().delete()
+                # A fresh cache per run so both paths pay for the same (stubbed) rewrites
+                scraper = NPSScraper(
+                    llm_client=EchoChatClient(),
+                    rewrite_cache=RewriteCache(":memory:"),
+                    llm_requests_per_minute=10 ** 9,  # Don't let the LLM rate limit dominate the timings
+                )
+                store = make_store(scraper)
+                measure(f"{name} (insert)", store, pages)
+                measure(f"{name} (re-sync)", store, pages)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""Benchmarks every BaseRecommender subclass against synthetic catalogs.
+
+Runs inside a throwaway test database (the real one is never touched), growing the
+catalog through each requested size and writing one JSON report per run so results can
+be diffed between commits:
+
+    python experiments/20261018_recommender_benchmark/benchmark_recs.py \
+        --sizes 10000 100000 1000000 --calls 500 --output bench.json
+"""
+import argparse
+import inspect
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "fun_things.settings")
+
+import django
+django.setup()
+
+from django.contrib.gis.geos import Point
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment
+
+from fun_things.core import recommenders
+from fun_things.core.collaborative import build_interaction_matrix, compute_item_neighbors, neighbors_path
+from fun_things.core.content import ContentIndex
+from fun_things.core.models import CustomUser, NPSThingToDo
+from fun_things.core.signals import refresh_after_bulk_write
+
+# Rough centres of activity clusters (national parks and metro areas) as (lat, lon, spread in degrees)
+CLUSTERS = [
+    (44.43, -110.59, 1.5), (36.11, -112.11, 1.2), (37.87, -119.54, 1.0), (47.87, -123.9, 1.0),
+    (25.29, -80.9, 0.8), (35.61, -83.49, 1.0), (40.34, -105.68, 1.2), (38.73, -109.59, 0.9),
+    (61.21, -149.9, 3.0), (19.42, -155.28, 0.6), (40.71, -74.0, 0.7), (34.05, -118.24, 0.8),
+    (41.88, -87.63, 0.6), (29.76, -95.37, 0.7), (47.61, -122.33, 0.5), (39.74, -104.99, 0.5),
+]
+WORDS = (
+    "hike trail river kayak museum history sunset canyon rim rapids bird wildlife camp lake "
+    "fish boat ranger tour cave geyser summit waterfall meadow forest beach dunes stargazing "
+    "bike horseback picnic overlook glacier volcano fort lighthouse garden archaeology"
+).split()
+
+
+def random_location(rng: random.Random) -> tuple[float, float]:
+    """Draws a point from a random cluster, with 10% uniform background noise."""
+    if rng.random() < 0.1:
+        return rng.uniform(25, 49), rng.uniform(-124, -67)
+    lat, lon, spread = rng.choice(CLUSTERS)
+    return lat + rng.gauss(0, spread), lon + rng.gauss(0, spread)
+
+
+def grow_catalog(rng: random.Random, start: int, stop: int, batch_size: int = 10000):
+    """Inserts activities numbered [start, stop) with clustered locations and filler text."""
+    for batch_start in range(start, stop, batch_size):
+        batch = []
+        for i in range(batch_start, min(batch_start + batch_size, stop)):
+            lat, lon = random_location(rng)
+            batch.append(NPSThingToDo(
+                nps_id=f"synthetic-{i}",
+                title=" ".join(rng.choices(WORDS, k=4)).title(),
+                description=" ".join(rng.choices(WORDS, k=60)),
+                location=Point(lon, lat, srid=4326),
+                passes_qc=rng.random() > 0.05,
+            ))
+        NPSThingToDo.objects.bulk_create(batch)
+
+
+def grow_users(rng: random.Random, start: int, stop: int, votes_per_user: int):
+    """Creates users [start, stop) and gives each a Zipf-ish spread of votes and saves."""
+    users = CustomUser.objects.bulk_create(
+        [CustomUser(username=f"synthetic-{i}", firebase_id=f"synthetic-{i}") for i in range(start, stop)]
+    )
+    max_id = NPSThingToDo.objects.order_by("-id").values_list("id", flat=True).first()
+    min_id = NPSThingToDo.objects.order_by("id").values_list("id", flat=True).first()
+
+    through_rows = {"thumbs_up": [], "thumbs_down": [], "saved_activities": []}
+    for user in users:
+        for _ in range(votes_per_user):
+            # Popular activities (low ids here) get most of the votes
+            activity_id = min_id + int((max_id - min_id) * rng.random() ** 3)
+            field = rng.choices(list(through_rows), weights=[6, 3, 2])[0]
+            through_rows[field].append((user.id, activity_id))
+
+    for field, pairs in through_rows.items():
+        through = getattr(CustomUser, field).through
+        through.objects.bulk_create(
+            [through(customuser_id=u, npsthingtodo_id=a) for u, a in set(pairs)],
+            batch_size=10000,
+            ignore_conflicts=True,
+        )
+
+
+def recommender_classes():
+    """Returns every concrete BaseRecommender subclass."""
+    found = []
+    pending = list(recommenders.BaseRecommender.__subclasses__())
+    while pending:
+        cls = pending.pop(0)
+        pending.extend(cls.__subclasses__())
+        if not inspect.isabstract(cls):
+            found.append(cls)
+    return found
+
+
+def call_kwargs(cls, rng: random.Random, activity_ids, users) -> dict:
+    """Builds arguments for ``recommend`` from whichever parameters the class accepts."""
+    params = inspect.signature(cls.recommend).parameters
+    kwargs = {}
+    if "latitude" in params:
+        kwargs["latitude"], kwargs["longitude"] = random_location(rng)
+    if "activity_id" in params:
+        kwargs["activity_id"] = rng.choice(activity_ids)
+    if "user" in params and users:
+        kwargs["user"] = rng.choice(users)
+    return kwargs
+
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+
+def rss_mb() -> float:
+    """Current resident set size, or NaN where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        return float("nan")
+
+
+def reset_peak_rss():
+    """Resets the kernel's peak-RSS watermark to the current RSS, so the next peak_rss_mb is per run."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS since the last reset_peak_rss on Linux.
+
+    Elsewhere this falls back to ru_maxrss, the peak of the whole process, which only
+    the first row of a run reports correctly; rss_delta_mb is still per run there.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def benchmark(cls, calls: int, rng: random.Random, activity_ids, users) -> dict:
+    recommender = cls()
+    reset_peak_rss()
+    rss_before = rss_mb()
+    # Warm-up call pays for lazy index builds so they don't skew the percentiles
+    recommender.recommend(**call_kwargs(cls, rng, activity_ids, users))
+
+    latencies = []
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        for _ in range(calls):
+            kwargs = call_kwargs(cls, rng, activity_ids, users)
+            call_started = time.perf_counter()
+            recommender.recommend(**kwargs)
+            latencies.append((time.perf_counter() - call_started) * 1000)
+        elapsed = time.perf_counter() - started
+
+    return {
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "queries_per_call": round(len(queries.captured_queries) / calls, 2),
+        "throughput_per_s": round(calls / elapsed, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "rss_delta_mb": round(rss_mb() - rss_before, 1),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--users-per-1k", type=int, default=20, help="Synthetic users per 1k activities")
+    parser.add_argument("--votes-per-user", type=int, default=30)
+    parser.add_argument("--recommenders", nargs="*", help="Only run these class names")
+    parser.add_argument("--content-max", type=int, default=200000, help="Skip the content index above this size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_output.json")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    classes = [c for c in recommender_classes() if not args.recommenders or c.__name__ in args.recommenders]
+    report = {"commit": git_commit(), "seed": args.seed, "calls": args.calls, "results": []}
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    data_dir = tempfile.mkdtemp(prefix="recbench-")
+    try:
+        with override_settings(RECOMMENDER_DATA_DIR=data_dir):
+            catalog_size = 0
+            user_count = 0
+            for size in sorted(args.sizes):
+                print(f"Growing catalog to {size} activities...")
+                grow_catalog(rng, catalog_size, size)
+                catalog_size = size
+                target_users = size * args.users_per_1k // 1000
+                grow_users(rng, user_count, target_users, args.votes_per_user)
+                user_count = target_users
+
+                # bulk_create skips the signals, so drop every activity-derived cache
+                # (including the tile cache) before measuring the bigger catalog
+                refresh_after_bulk_write()
+                matrix, item_ids = build_interaction_matrix()
+                compute_item_neighbors(matrix, item_ids, top_n=50).save(neighbors_path())
+                if size <= args.content_max:
+                    ContentIndex.build(top_k=50)
+
+                activity_ids = list(NPSThingToDo.objects.filter(passes_qc=True).values_list("id", flat=True))
+                users = list(CustomUser.objects.order_by("?")[:1000])
+
+                for cls in classes:
+                    if cls is recommenders.SimilarActivityRecommender and size > args.content_max:
+                        continue
+                    print(f"  {cls.__name__}...")
+                    result = benchmark(cls, args.calls, rng, activity_ids, users)
+                    result.update({"recommender": cls.__name__, "catalog_size": size, "users": user_count})
+                    report["results"].append(result)
+                    print(f"    {result}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
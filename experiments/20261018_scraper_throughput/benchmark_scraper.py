@@ -0,0 +1,170 @@
+"""Measures NPSScraper ingest throughput against the local fake NPS API.
+
+Starts fake_nps in-process, creates a throwaway test database and runs each ingest mode
+twice: into an empty table, then again over the same corpus (the steady state of a
+re-sync). For every run it reports items/second, database round trips (counted on every
+thread's connection, since the async path stores pages from a worker thread) and peak
+Python memory, as JSON so runs can be diffed between commits:
+
+    python experiments/20261018_scraper_throughput/benchmark_scraper.py \
+        --items 5000 --modes serial sync async --latency-ms 20 --rate-limit-every 25
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "fun_things.settings")
+
+import django
+django.setup()
+
+import openai
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings, setup_test_environment
+
+import fake_nps
+from fun_things.core.models import NPSThingToDo
+from fun_things.core.utils import NPSScraper, RewriteCache
+
+
+class QueryCounter:
+    """Counts queries on every database connection, whichever thread opened it."""
+
+    def __init__(self):
+        self.queries = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.queries += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+def make_scraper(server, workers: int) -> NPSScraper:
+    scraper = NPSScraper(
+        base_url=f"{server.url}/api/v1",
+        requests_per_hour=10 ** 9,
+        burst=10 ** 6,
+        llm_client=openai.OpenAI(base_url=f"{server.url}/v1", api_key="fake"),
+        rewrite_cache=RewriteCache(":memory:"),
+        rewrite_workers=workers,
+        llm_requests_per_minute=10 ** 9,
+    )
+    # Injected 429s carry Retry-After: 0, so keep backoff short
+    scraper.BASE_BACKOFF = 0.01
+    return scraper
+
+
+def run(mode: str, scraper: NPSScraper, batch_size: int, concurrency: int):
+    if mode == "sync":
+        return scraper.sync_things_to_do(batch_size=batch_size)
+    return scraper.store_things_to_do(batch_size=batch_size, concurrency=concurrency if mode == "async" else 1)
+
+
+def measure(mode, server, counter, args) -> dict:
+    scraper = make_scraper(server, args.rewrite_workers)
+    pages_before = dict(server.counts)
+    queries_before = counter.queries
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    stats = run(mode, scraper, args.batch_size, args.concurrency)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    items = len(server.corpus)
+    return {
+        "mode": mode,
+        "items_per_s": round(items / elapsed, 1),
+        "seconds": round(elapsed, 2),
+        "db_round_trips": counter.queries - queries_before,
+        "round_trips_per_item": round((counter.queries - queries_before) / items, 3),
+        "page_requests": server.counts["pages"] - pages_before["pages"],
+        "rate_limited": server.counts["rate_limited"] - pages_before["rate_limited"],
+        "completions": server.counts["completions"] - pages_before["completions"],
+        "peak_traced_mb": round(peak / 1024 / 1024, 1),
+        "stats": dict(stats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--corpus", help="Recorded JSON/NDJSON corpus instead of a synthetic one")
+    parser.add_argument("--modes", nargs="+", choices=["serial", "sync", "async"], default=["serial", "sync", "async"])
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rewrite-workers", type=int, default=NPSScraper.REWRITE_WORKERS)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--llm-latency-ms", type=float, default=0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--bad-location-rate", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="scraper_bench.json")
+    args = parser.parse_args()
+
+    corpus = (
+        fake_nps.load_corpus(args.corpus) if args.corpus
+        else fake_nps.synthetic_corpus(args.items, args.seed, args.bad_location_rate)
+    )
+    server = fake_nps.serve(
+        corpus, latency=args.latency_ms / 1000, llm_latency=args.llm_latency_ms / 1000,
+        rate_limit_every=args.rate_limit_every,
+    )
+    counter = QueryCounter()
+    connection_created.connect(counter.install)
+
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except Exception:
+        commit = "unknown"
+    report = {"commit": commit, "items": len(corpus), "args": vars(args), "results": []}
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    connection.ensure_connection()
+    counter.install(None, connection)
+    # Keep the checkpoint and content index away from the real recommender_data
+    data_dir = tempfile.mkdtemp(prefix="scraperbench-")
+    try:
+        with override_settings(
+            RECOMMENDER_DATA_DIR=data_dir, SYNC_CHECKPOINT_PATH=os.path.join(data_dir, "checkpoint.json")
+        ):
+            for mode in args.modes:
+                NPSThingToDo.objects.all().delete()
+                for phase in ("insert", "re-sync"):
+                    result = measure(mode, server, counter, args)
+                    result["phase"] = phase
+                    report["results"].append(result)
+                    print(
+                        f"{mode:>6} {phase:<8} {result['items_per_s']:>9} items/s "
+                        f"{result['round_trips_per_item']:>6} queries/item {result['peak_traced_mb']:>6} MB"
+                    )
+    finally:
+        connection_created.disconnect(counter.install)
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        server.shutdown()
+
+    report["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Local stand-in for the NPS API and OpenAI chat completions, for exercising NPSScraper offline.
+
+Serves ``GET /api/v1/thingstodo?limit=&start=`` from a synthetic or recorded corpus, and
+``POST /v1/chat/completions`` with a canned rewrite of the prompt's description. Faults
+can be injected: fixed latency, a 429 on every Nth request and malformed lat/lon.
+
+    python experiments/20261018_scraper_throughput/fake_nps.py --items 5000 --port 8765 \
+        --latency-ms 50 --rate-limit-every 20 --bad-location-rate 0.05
+
+then point the scraper at it with ``NPSScraper(base_url="http://127.0.0.1:8765/api/v1",
+llm_client=openai.OpenAI(base_url="http://127.0.0.1:8765/v1", api_key="fake"))``.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WORDS = (
+    "hike trail river kayak museum history sunset canyon rim rapids bird wildlife camp lake "
+    "fish boat ranger tour cave geyser summit waterfall meadow forest beach dunes stargazing"
+).split()
+BAD_LOCATIONS = (("", ""), ("abc", "-110.5"), ("44.4", None), ("north", "west"))
+
+
+def synthetic_corpus(items: int, seed: int = 0, bad_location_rate: float = 0.0) -> list[dict]:
+    """Builds NPS-shaped things to do, a fraction of them with unusable coordinates."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(items):
+        if rng.random() < bad_location_rate:
+            latitude, longitude = rng.choice(BAD_LOCATIONS)
+        else:
+            latitude, longitude = str(rng.uniform(25, 49)), str(rng.uniform(-124, -67))
+        corpus.append({
+            "id": f"fake-{i:08d}",
+            "title": " ".join(rng.choices(WORDS, k=4)).title(),
+            "longDescription": "<p>" + " ".join(rng.choices(WORDS, k=rng.randint(20, 120))) + "</p>",
+            "url": f"https://www.nps.gov/thingstodo/fake-{i}.htm",
+            "images": [{"url": f"https://www.nps.gov/common/uploads/fake-{i}.jpg"}],
+            "latitude": latitude,
+            "longitude": longitude,
+        })
+    return corpus
+
+
+def load_corpus(path: str) -> list[dict]:
+    """Loads a recorded corpus: a JSON array, an API response with "data", or NDJSON."""
+    with open(path) as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    return data["data"] if isinstance(data, dict) else data
+
+
+class FakeNPS(ThreadingHTTPServer):
+    """HTTP server holding the corpus, fault settings and request counters."""
+
+    daemon_threads = True
+
+    def __init__(self, address, corpus, latency=0.0, llm_latency=0.0, rate_limit_every=0):
+        super().__init__(address, FakeNPSHandler)
+        self.corpus = corpus
+        self.latency = latency
+        self.llm_latency = llm_latency
+        self.rate_limit_every = rate_limit_every
+        self.counts = {"pages": 0, "rate_limited": 0, "completions": 0}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name: str) -> int:
+        with self.lock:
+            self.counts[name] += 1
+            return self.counts[name]
+
+
+class FakeNPSHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: dict, headers=()):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/api/v1/thingstodo":
+            return self.send_json(404, {"error": "not found"})
+
+        server = self.server
+        time.sleep(server.latency)
+        requests_seen = server.count("pages")
+        if server.rate_limit_every and requests_seen % server.rate_limit_every == 0:
+            server.count("rate_limited")
+            return self.send_json(429, {"error": "rate limited"}, [("Retry-After", "0")])
+
+        params = parse_qs(url.query)
+        limit = int(params.get("limit", ["50"])[0])
+        start = int(params.get("start", ["0"])[0])
+        self.send_json(200, {
+            "total": str(len(server.corpus)),
+            "limit": str(limit),
+            "start": str(start),
+            "data": server.corpus[start:start + limit],
+        })
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip("/") != "/v1/chat/completions":
+            return self.send_json(404, {"error": "not found"})
+
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        time.sleep(self.server.llm_latency)
+        self.server.count("completions")
+        prompt = request["messages"][-1]["content"]
+        # The scraper's prompt wraps the original text in "---" markers
+        parts = prompt.split("---")
+        content = (parts[1] if len(parts) > 2 else prompt).strip()
+        self.send_json(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+
+def serve(corpus, host="127.0.0.1", port=0, **faults) -> FakeNPS:
+    """Starts a FakeNPS in a daemon thread; ``port=0`` picks a free port. Call shutdown() when done."""
+    server = FakeNPS((host, port), corpus, **faults)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Recorded JSON/NDJSON corpus; synthetic if omitted")
+    parser.add_argument("--items", type=int, default=5000, help="Synthetic corpus size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--llm-latency-ms", type=float, default=0)
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth page request with 429")
+    parser.add_argument("--bad-location-rate", type=float, default=0, help="Fraction of synthetic items with bad lat/lon")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.items, args.seed, args.bad_location_rate)
+    server = FakeNPS(
+        (args.host, args.port), corpus, latency=args.latency_ms / 1000, llm_latency=args.llm_latency_ms / 1000,
+        rate_limit_every=args.rate_limit_every,
+    )
+    print(f"Serving {len(corpus)} things to do at {server.url}/api/v1/thingstodo")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'fun_things.core'
+
+    def ready(self):
+        # Connect signal receivers that keep in-process recommender state fresh
+        from fun_things.core import signals  # noqa: F401
@@ -0,0 +1,188 @@
+import functools
+import hashlib
+import inspect
+import os
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+
+from fun_things.core.caches import LRUTTLCache
+from fun_things.core.models import CustomUser
+
+# get the absolute path of the current file
+dir_path = os.path.dirname(os.path.realpath(__file__))
+FIREBASE_CREDENTIALS_PATH = os.path.join(dir_path, "fun-things-12caf-firebase-adminsdk-fbsvc-abf05155d3.json")
+
+USER_ID_TTL = 600  # Seconds a firebase uid -> user id mapping is trusted
+
+_firebase_lock = threading.Lock()
+# Decoded tokens keyed by sha256 of the token, each expiring at the token's own exp
+verified_tokens = LRUTTLCache(max_entries=10000, ttl=0)
+user_ids = LRUTTLCache(max_entries=10000, ttl=USER_ID_TTL)
+
+
+def bearer_token(request):
+    """Returns the token from an ``Authorization: Bearer`` header, or None."""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return None
+    return auth_header.split("Bearer ")[1]
+
+
+def verify_id_token(token):
+    """Verifies a Firebase ID token, reusing the result until the token expires.
+
+    Only successfully verified tokens are cached, so a bad token is rechecked (and
+    rejected) every time. The Admin SDK is initialised on first use.
+    """
+    key = hashlib.sha256(token.encode()).hexdigest()
+    decoded_token = verified_tokens.get(key)
+    if decoded_token is not None:
+        return decoded_token
+
+    import firebase_admin
+    from firebase_admin import auth, credentials
+
+    with _firebase_lock:
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
+            firebase_admin.initialize_app(cred)
+    decoded_token = auth.verify_id_token(token)
+
+    ttl = decoded_token.get("exp", 0) - time.time()
+    if ttl > 0:
+        verified_tokens.set(key, decoded_token, ttl)
+    return decoded_token
+
+
+async def averify_id_token(token):
+    """verify_id_token for async views: cache hits stay on the event loop, misses run in a thread.
+
+    A miss can fetch Google's signing certificates, so it must not block the loop.
+    """
+    decoded_token = verified_tokens.get(hashlib.sha256(token.encode()).hexdigest())
+    if decoded_token is not None:
+        return decoded_token
+    return await sync_to_async(verify_id_token, thread_sensitive=False)(token)
+
+
+def resolve_user_id(firebase_uid, create=False):
+    """Returns (user id, created) for a Firebase uid, or (None, False) if there is no such user."""
+    user_id = user_ids.get(firebase_uid)
+    if user_id is not None:
+        return user_id, False
+
+    if create:
+        user, created = CustomUser.objects.get_or_create(firebase_id=firebase_uid)
+        user_id = user.id
+    else:
+        user_id = CustomUser.objects.filter(firebase_id=firebase_uid).values_list("id", flat=True).first()
+        created = False
+    if user_id is not None:
+        user_ids.set(firebase_uid, user_id)
+    return user_id, created
+
+
+async def aresolve_user_id(firebase_uid, create=False):
+    """resolve_user_id using the async ORM on a cache miss."""
+    user_id = user_ids.get(firebase_uid)
+    if user_id is not None:
+        return user_id, False
+
+    if create:
+        user, created = await CustomUser.objects.aget_or_create(firebase_id=firebase_uid)
+        user_id = user.id
+    else:
+        user_id = await CustomUser.objects.filter(firebase_id=firebase_uid).values_list("id", flat=True).afirst()
+        created = False
+    if user_id is not None:
+        user_ids.set(firebase_uid, user_id)
+    return user_id, created
+
+
+def forget_user(firebase_uid):
+    """Drops a cached uid -> id mapping, e.g. once the user is deleted."""
+    user_ids.pop(firebase_uid)
+
+
+def authenticated_user(firebase_uid, user_id):
+    """A CustomUser carrying only its id and firebase_id, enough for its relations without a query."""
+    return CustomUser(id=user_id, firebase_id=firebase_uid)
+
+
+def get_request_user(request):
+    """Returns the CustomUser behind an optional Bearer token, or None for anonymous requests."""
+    token = bearer_token(request)
+    if token is None:
+        return None
+
+    try:
+        firebase_uid = verify_id_token(token)["uid"]
+    except Exception:
+        return None
+    user_id, _ = resolve_user_id(firebase_uid)
+    return authenticated_user(firebase_uid, user_id) if user_id is not None else None
+
+
+async def aget_request_user(request):
+    """get_request_user for async views."""
+    token = bearer_token(request)
+    if token is None:
+        return None
+
+    try:
+        firebase_uid = (await averify_id_token(token))["uid"]
+    except Exception:
+        return None
+    user_id, _ = await aresolve_user_id(firebase_uid)
+    return authenticated_user(firebase_uid, user_id) if user_id is not None else None
+
+
+def firebase_user_required(view):
+    """Rejects requests without a valid Firebase Bearer token, else sets ``request.user``.
+
+    ``request.user`` only has its id and firebase_id loaded (see authenticated_user), so
+    views should use its relations rather than read or save its other fields. Works on
+    both sync and async views.
+    """
+    if inspect.iscoroutinefunction(view):
+
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            token = bearer_token(request)
+            if token is None:
+                return JsonResponse({"error": "Unauthorized"}, status=401)
+
+            try:
+                firebase_uid = (await averify_id_token(token))["uid"]
+            except Exception as e:
+                return JsonResponse({"error": str(e)}, status=401)
+
+            user_id, _ = await aresolve_user_id(firebase_uid)
+            if user_id is None:
+                return JsonResponse({"error": "User not found"}, status=404)
+            request.user = authenticated_user(firebase_uid, user_id)
+            return await view(request, *args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = bearer_token(request)
+        if token is None:
+            return JsonResponse({"error": "Unauthorized"}, status=401)
+
+        try:
+            firebase_uid = verify_id_token(token)["uid"]
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=401)
+
+        user_id, _ = resolve_user_id(firebase_uid)
+        if user_id is None:
+            return JsonResponse({"error": "User not found"}, status=404)
+        request.user = authenticated_user(firebase_uid, user_id)
+        return view(request, *args, **kwargs)
+
+    return wrapper
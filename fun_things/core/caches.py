@@ -0,0 +1,352 @@
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+
+class EligibleIdCache:
+    """Dense array of QC'd activity ids supporting O(1) uniform sampling.
+
+    The array is loaded once on first use and then kept current from model signals:
+    ids are appended on insert and removed by swapping in the last element, with a
+    position map so removal never scans the array. It is reloaded after ``max_age``
+    seconds to pick up writes from other processes, which fire no signals here.
+    """
+
+    def __init__(self, max_age: float = 600):
+        self.max_age = max_age
+        self._ids = None
+        self._loaded_at = 0.0
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        from fun_things.core.models import NPSThingToDo
+
+        ids = array("q", NPSThingToDo.objects.filter(passes_qc=True).values_list("id", flat=True).iterator())
+        self._positions = {activity_id: i for i, activity_id in enumerate(ids)}
+        self._ids = ids
+        self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self._ids is None or time.monotonic() - self._loaded_at >= self.max_age:
+            self._load()
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._ids)
+
+    def sample(self, k: int = 1) -> list[int]:
+        """Returns up to ``k`` distinct eligible ids chosen uniformly at random."""
+        with self._lock:
+            self._ensure_loaded()
+            ids = self._ids
+            return [ids[i] for i in random.sample(range(len(ids)), min(k, len(ids)))]
+
+    def add(self, activity_id: int):
+        """Marks an activity as eligible."""
+        with self._lock:
+            if self._ids is None or activity_id in self._positions:
+                return
+            self._positions[activity_id] = len(self._ids)
+            self._ids.append(activity_id)
+
+    def discard(self, activity_id: int):
+        """Removes an activity from the eligible set if present."""
+        with self._lock:
+            if self._ids is None:
+                return
+            position = self._positions.pop(activity_id, None)
+            if position is None:
+                return
+            last = self._ids.pop()
+            if position < len(self._ids):
+                self._ids[position] = last
+                self._positions[last] = position
+
+    def invalidate(self):
+        """Drops the array so the next sample reloads it from the database."""
+        with self._lock:
+            self._ids = None
+            self._positions = {}
+
+
+class IdBitmap:
+    """Compact set of non-negative ids, split into 65536-wide containers (Roaring-style).
+
+    A container stores its low 16 bits as a sorted array('H') while sparse and switches
+    to an 8 KiB bitmap once it holds more than ARRAY_LIMIT ids.
+    """
+
+    ARRAY_LIMIT = 4096
+
+    def __init__(self, ids=()):
+        self._containers = {}
+        for value in ids:
+            self.add(value)
+
+    def add(self, value: int):
+        high, low = value >> 16, value & 0xFFFF
+        container = self._containers.setdefault(high, array("H"))
+        if isinstance(container, bytearray):
+            container[low >> 3] |= 1 << (low & 7)
+            return
+
+        position = bisect_left(container, low)
+        if position < len(container) and container[position] == low:
+            return
+        container.insert(position, low)
+        if len(container) > self.ARRAY_LIMIT:
+            bitmap = bytearray(8192)
+            for item in container:
+                bitmap[item >> 3] |= 1 << (item & 7)
+            self._containers[high] = bitmap
+
+    def discard(self, value: int):
+        high, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(high)
+        if container is None:
+            return
+        if isinstance(container, bytearray):
+            container[low >> 3] &= ~(1 << (low & 7)) & 0xFF
+            return
+        position = bisect_left(container, low)
+        if position < len(container) and container[position] == low:
+            del container[position]
+
+    def __contains__(self, value: int) -> bool:
+        container = self._containers.get(value >> 16)
+        if container is None:
+            return False
+        low = value & 0xFFFF
+        if isinstance(container, bytearray):
+            return bool(container[low >> 3] & (1 << (low & 7)))
+        position = bisect_left(container, low)
+        return position < len(container) and container[position] == low
+
+    def __iter__(self):
+        for high in sorted(self._containers):
+            container = self._containers[high]
+            if isinstance(container, bytearray):
+                lows = (i for i in range(65536) if container[i >> 3] & (1 << (i & 7)))
+            else:
+                lows = container
+            for low in lows:
+                yield (high << 16) | low
+
+    def __len__(self) -> int:
+        return sum(
+            int.from_bytes(container, "little").bit_count() if isinstance(container, bytearray) else len(container)
+            for container in self._containers.values()
+        )
+
+
+class UserExclusions:
+    """Activities one user should not be shown again: their downvotes plus recent impressions."""
+
+    def __init__(self, downvoted=(), max_impressions: int = 500):
+        self.downvoted = IdBitmap(downvoted)
+        self.recent = OrderedDict()  # Activity id -> None, oldest impression first
+        self.max_impressions = max_impressions
+        self._lock = threading.Lock()
+
+    def __contains__(self, activity_id: int) -> bool:
+        return activity_id in self.downvoted or activity_id in self.recent
+
+    def __len__(self) -> int:
+        return len(self.downvoted) + len(self.recent)
+
+    def __iter__(self):
+        with self._lock:
+            recent = list(self.recent)
+        yield from self.downvoted
+        yield from (activity_id for activity_id in recent if activity_id not in self.downvoted)
+
+    def record_impressions(self, activity_ids):
+        """Remembers activities that were just served, forgetting the oldest beyond the cap."""
+        with self._lock:
+            for activity_id in activity_ids:
+                self.recent.pop(activity_id, None)
+                self.recent[activity_id] = None
+            while len(self.recent) > self.max_impressions:
+                self.recent.popitem(last=False)
+
+    def clear_impressions(self):
+        """Forgets recent impressions so a user who has seen everything nearby can start over."""
+        with self._lock:
+            self.recent.clear()
+
+
+class ExclusionCache:
+    """LRU of per-user exclusion sets, seeded from thumbs_down on first use."""
+
+    def __init__(self, max_users: int = 10000, max_impressions: int = 500):
+        self.max_users = max_users
+        self.max_impressions = max_impressions
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> UserExclusions:
+        """Returns the user's exclusions, loading their downvotes if they are not cached."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+                return entry
+
+        from fun_things.core.models import CustomUser
+
+        downvoted = CustomUser.thumbs_down.through.objects.filter(customuser_id=user_id).values_list(
+            "npsthingtodo_id", flat=True
+        )
+        entry = UserExclusions(downvoted, self.max_impressions)
+
+        with self._lock:
+            entry = self._entries.setdefault(user_id, entry)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+            return entry
+
+    def peek(self, user_id: int):
+        """Returns the user's cached exclusions without loading them, or None."""
+        with self._lock:
+            return self._entries.get(user_id)
+
+
+class LRUTTLCache:
+    """Thread-safe in-process LRU whose entries also expire ``ttl`` seconds after being set."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # Key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def keys(self) -> list:
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TileCandidates:
+    """Candidate ids and cumulative exp(-LAMBDA * d) weights for one geohash cell."""
+
+    def __init__(self, cell: str, ids, cumulative):
+        self.cell = cell
+        self.ids = ids
+        self.cumulative = cumulative
+
+
+class TileCache:
+    """Per-cell recommendation candidates: an in-process LRU, optionally backed by Django's cache.
+
+    Local entries are dropped precisely when a nearby activity changes. The shared cache
+    can't enumerate its keys, so its entries are namespaced by a version number that any
+    change bumps, and TTL bounds staleness from changes made in other processes.
+    """
+
+    VERSION_KEY = "tile-candidates:version"
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 600):
+        self.local = LRUTTLCache(max_entries, ttl)
+        self.ttl = ttl
+
+    def _shared(self):
+        from django.conf import settings
+        from django.core.cache import caches
+
+        alias = getattr(settings, "TILE_CACHE_ALIAS", None)
+        return caches[alias] if alias else None
+
+    def _shared_key(self, shared, cell: str) -> str:
+        return f"tile-candidates:{shared.get_or_set(self.VERSION_KEY, 1)}:{cell}"
+
+    def get(self, cell: str):
+        entry = self.local.get(cell)
+        if entry is not None:
+            return entry
+
+        shared = self._shared()
+        if shared is not None:
+            entry = shared.get(self._shared_key(shared, cell))
+            if entry is not None:
+                self.local.set(cell, entry)
+        return entry
+
+    def set(self, cell: str, entry: TileCandidates):
+        self.local.set(cell, entry)
+        shared = self._shared()
+        if shared is not None:
+            shared.set(self._shared_key(shared, cell), entry, self.ttl)
+
+    def clear(self):
+        """Drops every cached cell, e.g. after a bulk write that fired no signals."""
+        self.local.clear()
+        self._bump_shared_version()
+
+    def _bump_shared_version(self):
+        shared = self._shared()
+        if shared is not None:
+            try:
+                shared.incr(self.VERSION_KEY)
+            except ValueError:
+                shared.set(self.VERSION_KEY, 1, None)
+
+    def invalidate_near(self, latitude: float, longitude: float, radius: float):
+        """Drops every cell whose influence radius covers the given location."""
+        from fun_things.core.spatial import geohash_bounds, haversine
+
+        for cell in self.local.keys():
+            min_lat, min_lon, max_lat, max_lon = geohash_bounds(cell)
+            center_lat, center_lon = (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+            half_diagonal = haversine(min_lat, min_lon, max_lat, max_lon) / 2
+            if haversine(latitude, longitude, center_lat, center_lon) <= radius + half_diagonal:
+                self.local.pop(cell)
+        self._bump_shared_version()
+
+
+class CachedResponse:
+    """A pre-encoded JSON body plus the validators conditional GETs are answered from."""
+
+    def __init__(self, body: bytes, etag: str, last_modified: float):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified  # Unix timestamp of the activity's updated_at
+
+
+eligible_ids = EligibleIdCache()
+user_exclusions = ExclusionCache()
+tile_candidates = TileCache()
+# Activity id -> CachedResponse for get_activity_details. Entries are dropped by signals
+# when the activity, its votes or favorites change here; the TTL bounds staleness from
+# writes in other processes.
+activity_details = LRUTTLCache(max_entries=10000, ttl=300)
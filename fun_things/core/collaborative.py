@@ -0,0 +1,331 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+from django.db import connections
+
+from fun_things.core.models import CustomUser
+
+# numpy and scipy are imported where they are used: together they add ~0.3s to startup,
+# and processes that never build or read the neighbour table shouldn't pay for them
+if TYPE_CHECKING:
+    import numpy as np
+    from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+# How much each kind of interaction counts towards a user's affinity for an item
+INTERACTION_WEIGHTS = (
+    ("thumbs_up", 1.0),
+    ("saved_activities", 1.0),
+    ("thumbs_down", -1.0),
+)
+NEIGHBORS_FILENAME = "item_neighbors.npz"
+
+
+def load_interactions(user_ids=None, item_ids=None) -> dict[tuple[int, int], float]:
+    """Returns {(user_id, activity_id): affinity} summed across the vote/save through-tables."""
+    interactions = defaultdict(float)
+    for field_name, weight in INTERACTION_WEIGHTS:
+        rows = getattr(CustomUser, field_name).through.objects.all()
+        if user_ids is not None:
+            rows = rows.filter(customuser_id__in=user_ids)
+        if item_ids is not None:
+            rows = rows.filter(npsthingtodo_id__in=item_ids)
+        for user_id, activity_id in rows.values_list("customuser_id", "npsthingtodo_id").iterator():
+            interactions[(user_id, activity_id)] += weight
+    return {key: value for key, value in interactions.items() if value}
+
+
+def build_interaction_matrix() -> tuple["sparse.csr_matrix", "np.ndarray"]:
+    """Returns the sparse user x item affinity matrix and the activity id of each column."""
+    import numpy as np
+    from scipy import sparse
+
+    interactions = load_interactions()
+    if not interactions:
+        return sparse.csr_matrix((0, 0), dtype=np.float32), np.empty(0, dtype=np.int64)
+
+    keys = np.array(list(interactions.keys()), dtype=np.int64)
+    values = np.fromiter(interactions.values(), dtype=np.float32, count=len(interactions))
+    _, rows = np.unique(keys[:, 0], return_inverse=True)
+    item_ids, cols = np.unique(keys[:, 1], return_inverse=True)
+
+    matrix = sparse.csr_matrix((values, (rows, cols)), shape=(rows.max() + 1, len(item_ids)))
+    return matrix, item_ids
+
+
+def compute_item_neighbors(matrix: "sparse.csr_matrix", item_ids: "np.ndarray", top_n: int, chunk_size: int = 256):
+    """Computes the top-N positive cosine neighbours of every item column.
+
+    Similarities are computed ``chunk_size`` items at a time so peak memory stays at
+    chunk_size x n_items floats regardless of the catalog size.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    n_items = len(item_ids)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    normalized = (matrix @ sparse.diags(1.0 / norms)).tocsc().astype(np.float32)
+    normalized_t = normalized.T.tocsr()
+
+    indptr = np.zeros(n_items + 1, dtype=np.int64)
+    indices = []
+    data = []
+
+    for start in range(0, n_items, chunk_size):
+        end = min(start + chunk_size, n_items)
+        block = (normalized_t[start:end] @ normalized).toarray()
+        block[np.arange(end - start), np.arange(start, end)] = 0  # Drop self-similarity
+
+        k = min(top_n, n_items - 1)
+        if k <= 0:
+            continue
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        for offset, row in enumerate(top):
+            scores = block[offset, row]
+            keep = scores > 0
+            order = np.argsort(-scores[keep])
+            indices.append(row[keep][order])
+            data.append(scores[keep][order])
+            indptr[start + offset + 1] = len(order)
+
+    indptr = np.cumsum(indptr)
+    return ItemNeighbors(
+        item_ids=item_ids,
+        indptr=indptr,
+        indices=np.concatenate(indices).astype(np.int32) if indices else np.empty(0, dtype=np.int32),
+        data=np.concatenate(data).astype(np.float32) if data else np.empty(0, dtype=np.float32),
+        top_n=top_n,
+    )
+
+
+class ItemNeighbors:
+    """Top-N item-item cosine neighbours stored as CSR arrays.
+
+    Row ``r`` lists the neighbours of activity ``item_ids[r]`` as column positions in
+    ``indices[indptr[r]:indptr[r + 1]]`` with scores in ``data``. Rows touched by votes
+    since the last batch build are kept in ``_overrides`` keyed by activity id, so a vote
+    rewrites a handful of rows instead of the arrays. Overrides live in this process only
+    and are folded into the arrays by the next build.
+    """
+
+    def __init__(self, item_ids, indptr, indices, data, top_n: int):
+        self.item_ids = item_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.top_n = top_n
+        self._overrides = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def empty(cls, top_n: int) -> "ItemNeighbors":
+        import numpy as np
+
+        return cls(
+            item_ids=np.empty(0, dtype=np.int64),
+            indptr=np.zeros(1, dtype=np.int64),
+            indices=np.empty(0, dtype=np.int32),
+            data=np.empty(0, dtype=np.float32),
+            top_n=top_n,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "ItemNeighbors":
+        import numpy as np
+
+        with np.load(path) as arrays:
+            return cls(
+                item_ids=arrays["item_ids"],
+                indptr=arrays["indptr"],
+                indices=arrays["indices"],
+                data=arrays["data"],
+                top_n=int(arrays["top_n"]),
+            )
+
+    def save(self, path: str):
+        import numpy as np
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(
+            path,
+            item_ids=self.item_ids,
+            indptr=self.indptr,
+            indices=self.indices,
+            data=self.data,
+            top_n=np.int64(self.top_n),
+        )
+
+    def neighbors(self, activity_id: int) -> list[tuple[int, float]]:
+        """Returns [(neighbour activity id, cosine similarity)] sorted by similarity."""
+        override = self._overrides.get(activity_id)
+        if override is not None:
+            return override
+
+        import numpy as np
+
+        row = np.searchsorted(self.item_ids, activity_id)
+        if row >= len(self.item_ids) or self.item_ids[row] != activity_id:
+            return []
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return list(zip(self.item_ids[self.indices[start:end]].tolist(), self.data[start:end].tolist()))
+
+    def scores_for(self, affinities: dict[int, float]) -> dict[int, float]:
+        """Sums neighbour similarities weighted by a user's affinity for each item."""
+        scores = defaultdict(float)
+        for activity_id, affinity in affinities.items():
+            for neighbor_id, similarity in self.neighbors(activity_id):
+                scores[neighbor_id] += affinity * similarity
+        return scores
+
+    def update_items(self, activity_ids, max_users: int | None = None):
+        """Recomputes the neighbour rows of items whose interactions just changed.
+
+        Only users who touched these items are read, and the new similarities are also
+        patched into each neighbour's row so the table stays symmetric. Items touched by
+        more than ``max_users`` users are skipped: one vote barely moves their rows, and
+        reading every one of those users' votes is left to the next batch build.
+        """
+        activity_ids = set(activity_ids)
+        item_interactions = load_interactions(item_ids=activity_ids)
+        if max_users is not None:
+            user_counts = defaultdict(int)
+            for _, activity_id in item_interactions:
+                user_counts[activity_id] += 1
+            activity_ids = {activity_id for activity_id in activity_ids if user_counts[activity_id] <= max_users}
+            item_interactions = {key: value for key, value in item_interactions.items() if key[1] in activity_ids}
+            if not activity_ids:
+                return
+        user_ids = {user_id for user_id, _ in item_interactions}
+
+        by_user = defaultdict(dict)
+        for (user_id, activity_id), value in load_interactions(user_ids=user_ids).items():
+            by_user[user_id][activity_id] = value
+
+        dots = {activity_id: defaultdict(float) for activity_id in activity_ids}
+        for items in by_user.values():
+            for activity_id in activity_ids & items.keys():
+                value = items[activity_id]
+                for other_id, other_value in items.items():
+                    if other_id != activity_id:
+                        dots[activity_id][other_id] += value * other_value
+
+        touched = activity_ids.union(*(row.keys() for row in dots.values()))
+        norms = defaultdict(float)
+        for (_, activity_id), value in load_interactions(item_ids=touched).items():
+            norms[activity_id] += value * value
+
+        # Items that used to list these as neighbours may need them dropped
+        stale = {other_id for activity_id in activity_ids for other_id, _ in self.neighbors(activity_id)}
+        touched |= stale
+
+        with self._lock:
+            for activity_id, row in dots.items():
+                similarities = {
+                    other_id: dot / math.sqrt(norms[activity_id] * norms[other_id])
+                    for other_id, dot in row.items()
+                    if dot > 0 and norms[activity_id] and norms[other_id]
+                }
+                self._overrides[activity_id] = self._top(similarities)
+
+                for other_id in touched - {activity_id}:
+                    current = dict(self.neighbors(other_id))
+                    current.pop(activity_id, None)
+                    if other_id in similarities:
+                        current[activity_id] = similarities[other_id]
+                    self._overrides[other_id] = self._top(current)
+
+    def _top(self, similarities: dict[int, float]) -> list[tuple[int, float]]:
+        return sorted(similarities.items(), key=lambda item: -item[1])[:self.top_n]
+
+
+_neighbors = None
+_neighbors_mtime = None
+_neighbors_lock = threading.Lock()
+
+
+def neighbors_path() -> str:
+    return os.path.join(settings.RECOMMENDER_DATA_DIR, NEIGHBORS_FILENAME)
+
+
+def get_item_neighbors() -> ItemNeighbors:
+    """Returns the process-wide neighbour table, reloading it when the file is rebuilt."""
+    global _neighbors, _neighbors_mtime
+    path = neighbors_path()
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+
+    with _neighbors_lock:
+        if _neighbors is None or mtime != _neighbors_mtime:
+            if mtime is not None:
+                _neighbors = ItemNeighbors.load(path)
+            else:
+                _neighbors = ItemNeighbors.empty(settings.ITEM_NEIGHBORS_TOP_N)
+            _neighbors_mtime = mtime
+        return _neighbors
+
+
+class NeighborUpdater:
+    """Applies vote-driven neighbour updates on a daemon thread, off the request path.
+
+    ``schedule`` only adds ids to a pending set; the thread waits ``delay`` seconds after
+    the first one so a burst of votes on the same items is recomputed once, then updates
+    at most ``batch_size`` items per pass. With ``delay=None`` updates run inline, which
+    keeps tests deterministic.
+    """
+
+    def __init__(self, delay: float | None = 1.0, batch_size: int = 100, max_users: int | None = None):
+        self.delay = delay
+        self.batch_size = batch_size
+        self.max_users = max_users
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def schedule(self, activity_ids):
+        if self.delay is None:
+            get_item_neighbors().update_items(activity_ids, max_users=self.max_users)
+            return
+        with self._lock:
+            self._pending.update(activity_ids)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="item-neighbors", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def flush(self):
+        """Applies every pending update, ``batch_size`` items at a time."""
+        while True:
+            with self._lock:
+                batch = {self._pending.pop() for _ in range(min(self.batch_size, len(self._pending)))}
+            if not batch:
+                return
+            try:
+                get_item_neighbors().update_items(batch, max_users=self.max_users)
+            except Exception:
+                # The next batch build recomputes these rows anyway
+                logger.exception("Failed to update neighbours of %d activities", len(batch))
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.delay)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                # Don't hold a connection open between bursts
+                connections.close_all()
+
+
+neighbor_updates = NeighborUpdater(
+    delay=settings.ITEM_NEIGHBORS_UPDATE_DELAY,
+    max_users=settings.ITEM_NEIGHBORS_MAX_USERS,
+)
@@ -0,0 +1,266 @@
+import math
+import os
+import re
+import shutil
+import threading
+import zlib
+from collections import Counter
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+
+from fun_things.core.models import NPSThingToDo
+
+# numpy is imported where it is used, so importing the recommenders doesn't load it
+if TYPE_CHECKING:
+    import numpy as np
+
+VECTOR_DIM = 1024  # Hashed feature buckets per activity
+VECTORS_FILENAME = "content_vectors.f32"
+IDS_FILENAME = "content_ids.npy"
+IDF_FILENAME = "content_idf.npy"
+NEIGHBORS_FILENAME = "content_neighbors.npz"
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+def data_path(filename: str) -> str:
+    return os.path.join(settings.RECOMMENDER_DATA_DIR, filename)
+
+
+def staging_path(filename: str) -> str:
+    return data_path(filename) + ".tmp"
+
+
+def publish(filenames):
+    """Moves each staged file over its live copy, in order.
+
+    Readers reopen the index when the ids file changes, so it must be the last in
+    ``filenames``: by the time a reader sees the new ids, every file it pairs with is in
+    place. Readers still mapping the old files keep their inodes and are unaffected.
+    """
+    for filename in filenames:
+        os.replace(staging_path(filename), data_path(filename))
+
+
+def hashed_features(text: str) -> Counter:
+    """Hashes word unigrams and bigrams into signed buckets, returning bucket -> count."""
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    features = Counter()
+    for gram in grams:
+        # crc32 is stable across processes, unlike hash()
+        h = zlib.crc32(gram.encode())
+        features[h % VECTOR_DIM] += 1 if h & 0x80000000 else -1
+    return features
+
+
+def activity_text(title: str, description: str) -> str:
+    return f"{title or ''} {description or ''}"
+
+
+def open_vectors(rows: int, path: str = None) -> "np.ndarray":
+    """Maps the first ``rows`` vectors of the shared matrix (or the file at ``path``) read-only."""
+    import numpy as np
+
+    if rows == 0:
+        return np.zeros((0, VECTOR_DIM), dtype=np.float32)
+    return np.memmap(path or data_path(VECTORS_FILENAME), dtype=np.float32, mode="r", shape=(rows, VECTOR_DIM))
+
+
+def vectorize(texts, idf: "np.ndarray") -> "np.ndarray":
+    """Returns L2-normalised sublinear TF-IDF rows (float32) for ``texts``."""
+    import numpy as np
+
+    vectors = np.zeros((len(texts), VECTOR_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for bucket, count in hashed_features(text).items():
+            if count:
+                vectors[row, bucket] = math.copysign(1 + math.log(abs(count)), count)
+    vectors *= idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def compute_neighbors(vectors: "np.ndarray", top_k: int, chunk_size: int = 1024, rows=None):
+    """Returns (positions, scores) of the ``top_k`` most similar rows for each requested row.
+
+    Similarities are batched dot products of ``chunk_size`` rows against the whole matrix,
+    so memory stays at chunk_size x n floats.
+    """
+    import numpy as np
+
+    n = len(vectors)
+    rows = np.arange(n) if rows is None else np.asarray(rows)
+    k = min(top_k, n - 1)
+    positions = np.full((len(rows), top_k), -1, dtype=np.int64)
+    scores = np.zeros((len(rows), top_k), dtype=np.float32)
+    if k <= 0:
+        return positions, scores
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        block = np.asarray(vectors[chunk]) @ np.asarray(vectors).T
+        block[np.arange(len(chunk)), chunk] = -np.inf  # Drop self-similarity
+
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        positions[start:start + len(chunk), :k] = np.take_along_axis(top, order, axis=1)
+        scores[start:start + len(chunk), :k] = np.take_along_axis(top_scores, order, axis=1)
+    return positions, scores
+
+
+class ContentIndex:
+    """Hashed TF-IDF vectors of activity titles and descriptions, plus precomputed neighbours.
+
+    Vectors live in a raw float32 file under RECOMMENDER_DATA_DIR that every worker maps
+    read-only, so the OS page cache holds a single shared copy. New activities are
+    appended to the end of a copy of that file; the IDF weights stay fixed until the next
+    build. Builds and appends publish their files with ``publish``, ids last.
+    """
+
+    def __init__(self):
+        import numpy as np
+
+        self.ids = np.load(data_path(IDS_FILENAME))
+        self.idf = np.load(data_path(IDF_FILENAME))
+        self.vectors = open_vectors(len(self.ids))
+        with np.load(data_path(NEIGHBORS_FILENAME)) as arrays:
+            self.neighbor_ids = arrays["ids"]
+            self.neighbor_scores = arrays["scores"]
+        self._rows = {activity_id: row for row, activity_id in enumerate(self.ids.tolist())}
+
+    @classmethod
+    def build(cls, top_k: int, chunk_size: int = 1024):
+        """Vectorizes the whole QC'd catalog and precomputes every row's neighbours."""
+        import numpy as np
+
+        rows = list(
+            NPSThingToDo.objects.filter(passes_qc=True).order_by("id").values_list("id", "title", "description")
+        )
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        texts = [activity_text(title, description) for _, title, description in rows]
+
+        document_frequency = np.zeros(VECTOR_DIM, dtype=np.float64)
+        for text in texts:
+            document_frequency[list(hashed_features(text))] += 1
+        idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        # Every file is written to a staging path and published together, ids last
+        os.makedirs(settings.RECOMMENDER_DATA_DIR, exist_ok=True)
+        with open(staging_path(VECTORS_FILENAME), "wb") as f:
+            for start in range(0, len(texts), chunk_size):
+                f.write(vectorize(texts[start:start + chunk_size], idf).tobytes())
+        vectors = open_vectors(len(ids), staging_path(VECTORS_FILENAME))
+
+        positions, scores = compute_neighbors(vectors, top_k, chunk_size)
+        cls._save_neighbors(ids, positions, scores)
+        with open(staging_path(IDF_FILENAME), "wb") as f:
+            np.save(f, idf)
+        with open(staging_path(IDS_FILENAME), "wb") as f:
+            np.save(f, ids)
+        publish([VECTORS_FILENAME, NEIGHBORS_FILENAME, IDF_FILENAME, IDS_FILENAME])
+        return len(ids)
+
+    @classmethod
+    def append(cls, activity_ids):
+        """Adds vectors for new activities to the end of the matrix and patches neighbours.
+
+        Existing rows are never rewritten: new rows get their own top-k, and existing rows
+        only take a new activity into their list where it beats their weakest neighbour.
+        """
+        import numpy as np
+
+        if not os.path.exists(data_path(IDS_FILENAME)):
+            return 0
+
+        index = cls()
+        rows = [
+            row for row in NPSThingToDo.objects.filter(id__in=activity_ids, passes_qc=True)
+            .order_by("id").values_list("id", "title", "description")
+            if row[0] not in index._rows
+        ]
+        if not rows:
+            return 0
+
+        new_vectors = vectorize([activity_text(title, description) for _, title, description in rows], index.idf)
+        # Extend a copy: workers map the live file, which must not change under them
+        shutil.copyfile(data_path(VECTORS_FILENAME), staging_path(VECTORS_FILENAME))
+        with open(staging_path(VECTORS_FILENAME), "r+b") as f:
+            f.seek(len(index.ids) * VECTOR_DIM * 4)
+            f.write(new_vectors.tobytes())
+            f.truncate()
+
+        ids = np.concatenate([index.ids, np.array([row[0] for row in rows], dtype=np.int64)])
+        vectors = open_vectors(len(ids), staging_path(VECTORS_FILENAME))
+        top_k = index.neighbor_ids.shape[1]
+
+        # Top-k for the new rows against the whole matrix
+        new_rows = np.arange(len(index.ids), len(ids))
+        new_positions, new_scores = compute_neighbors(vectors, top_k, rows=new_rows)
+
+        # Existing rows only change where a new activity beats their weakest neighbour
+        old_positions = np.array(
+            [[index._rows.get(neighbor_id, -1) for neighbor_id in row] for row in index.neighbor_ids.tolist()],
+            dtype=np.int64,
+        ).reshape(index.neighbor_ids.shape)
+        old_scores = np.where(index.neighbor_ids < 0, -np.inf, index.neighbor_scores)
+        against_new = np.asarray(vectors[:len(index.ids)]) @ new_vectors.T
+        merged_positions = np.concatenate([old_positions, np.broadcast_to(new_rows, against_new.shape)], axis=1)
+        merged_scores = np.concatenate([old_scores, against_new], axis=1)
+        order = np.argsort(-merged_scores, axis=1)[:, :top_k]
+
+        positions = np.concatenate([np.take_along_axis(merged_positions, order, axis=1), new_positions])
+        scores = np.concatenate([np.take_along_axis(merged_scores, order, axis=1), new_scores])
+        positions[~np.isfinite(scores)] = -1
+        scores[~np.isfinite(scores)] = 0
+
+        cls._save_neighbors(ids, positions, scores)
+        with open(staging_path(IDS_FILENAME), "wb") as f:
+            np.save(f, ids)
+        publish([VECTORS_FILENAME, NEIGHBORS_FILENAME, IDS_FILENAME])
+        return len(rows)
+
+    @staticmethod
+    def _save_neighbors(ids, positions, scores):
+        """Writes the neighbour lists to the staging path, for ``publish`` to swap in."""
+        import numpy as np
+
+        neighbor_ids = np.full(positions.shape, -1, dtype=np.int64)
+        neighbor_ids[positions >= 0] = ids[positions[positions >= 0]]
+        with open(staging_path(NEIGHBORS_FILENAME), "wb") as f:
+            np.savez(f, ids=neighbor_ids, scores=scores.astype(np.float32))
+
+    def similar(self, activity_id: int) -> list[tuple[int, float]]:
+        """Returns [(activity id, cosine similarity)] for the precomputed neighbours."""
+        row = self._rows.get(activity_id)
+        if row is None:
+            return []
+        return [
+            (neighbor_id, score)
+            for neighbor_id, score in zip(self.neighbor_ids[row].tolist(), self.neighbor_scores[row].tolist())
+            if neighbor_id >= 0
+        ]
+
+
+_index = None
+_index_mtime = None
+_index_lock = threading.Lock()
+
+
+def get_content_index():
+    """Returns the process-wide content index, reopening it after a build or append."""
+    global _index, _index_mtime
+    path = data_path(IDS_FILENAME)
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+
+    with _index_lock:
+        if _index is None or mtime != _index_mtime:
+            _index = ContentIndex()
+            _index_mtime = mtime
+        return _index
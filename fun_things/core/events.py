@@ -0,0 +1,110 @@
+import atexit
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from fun_things.core.metrics import interaction_events
+
+logger = logging.getLogger(__name__)
+
+
+class EventBuffer:
+    """In-process buffer that writes InteractionEvents in batches, off the request path.
+
+    ``record`` only appends to a deque under a lock; a daemon thread started on first use
+    writes the buffer with one bulk INSERT once ``flush_size`` events are waiting or
+    ``flush_interval`` seconds have passed. If the database falls behind, the buffer holds
+    at most ``max_buffer`` events and drops the oldest. Events still buffered when the
+    process exits are flushed by an atexit hook; a hard kill loses them. With
+    ``flush_interval=None`` there is no thread and no hook, and events are only written by
+    an explicit ``flush()``, e.g. inside a test's transaction.
+    """
+
+    def __init__(self, flush_size: int = 1000, flush_interval: float | None = 1.0, max_buffer: int = 100000):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval  # None: never flush in the background, only on flush()
+        self.max_buffer = max_buffer
+        self._events = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # One writer at a time, so batches land in order
+        self._wakeup = threading.Event()
+        self._thread = None
+        if flush_interval is not None:
+            atexit.register(self.flush)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._events)
+
+    def record(self, event_type: str, user_id: int | None, activity_ids):
+        """Queues one event per activity id, stamped now."""
+        created_at = timezone.now()
+        recorded = dropped = 0
+        with self._lock:
+            for activity_id in activity_ids:
+                self._events.append((created_at, user_id, activity_id, event_type))
+                recorded += 1
+            while len(self._events) > self.max_buffer:
+                self._events.popleft()
+                dropped += 1
+            pending = len(self._events)
+        interaction_events.inc("recorded", amount=recorded)
+        if dropped:
+            interaction_events.inc("dropped", amount=dropped)
+        self._ensure_thread()
+        if pending >= self.flush_size:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Writes everything buffered so far and returns how many events were written."""
+        from fun_things.core.models import InteractionEvent
+
+        with self._flush_lock:
+            written = 0
+            while True:
+                with self._lock:
+                    batch = [self._events.popleft() for _ in range(min(self.flush_size, len(self._events)))]
+                if not batch:
+                    return written
+                try:
+                    InteractionEvent.objects.bulk_create([
+                        InteractionEvent(created_at=created_at, user_id=user_id, activity_id=activity_id, event_type=event_type)
+                        for created_at, user_id, activity_id, event_type in batch
+                    ])
+                except Exception:
+                    # Losing analytics beats retrying against a database that is already struggling
+                    logger.exception("Failed to write %d interaction events", len(batch))
+                    interaction_events.inc("failed", amount=len(batch))
+                    return written
+                interaction_events.inc("written", amount=len(batch))
+                written += len(batch)
+
+    def _ensure_thread(self):
+        if self.flush_interval is None or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="interaction-events", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                # Don't hold a connection open between flushes
+                connections.close_all()
+
+
+interaction_event_buffer = EventBuffer(flush_interval=settings.INTERACTION_EVENT_FLUSH_INTERVAL)
+
+
+def record_events(event_type: str, user_id: int | None, activity_ids):
+    """Queues an event per activity on the shared buffer; never touches the database."""
+    interaction_event_buffer.record(event_type, user_id, activity_ids)
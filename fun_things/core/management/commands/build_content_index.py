@@ -0,0 +1,21 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from fun_things.core.content import ContentIndex
+
+
+class Command(BaseCommand):
+    help = "Vectorizes activity titles and descriptions and precomputes similar activities."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-k", type=int, default=settings.CONTENT_NEIGHBORS_TOP_K)
+        parser.add_argument("--chunk-size", type=int, default=1024)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = ContentIndex.build(options["top_k"], options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {count} activities in {time.perf_counter() - started:.1f}s"
+        ))
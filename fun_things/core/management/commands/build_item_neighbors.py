@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from fun_things.core.collaborative import (
+    build_interaction_matrix,
+    compute_item_neighbors,
+    neighbors_path,
+)
+
+
+class Command(BaseCommand):
+    help = "Precomputes top-N item-item cosine neighbours from votes and saves."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-n", type=int, default=settings.ITEM_NEIGHBORS_TOP_N)
+        parser.add_argument("--chunk-size", type=int, default=256)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        matrix, item_ids = build_interaction_matrix()
+        self.stdout.write(f"Loaded {matrix.nnz} interactions over {len(item_ids)} activities")
+
+        neighbors = compute_item_neighbors(matrix, item_ids, options["top_n"], options["chunk_size"])
+        neighbors.save(neighbors_path())
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved {len(neighbors.data)} neighbour pairs to {neighbors_path()} "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,247 @@
+import gzip
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from fun_things.core.models import NPSThingToDo
+from fun_things.core.signals import refresh_after_bulk_write
+from fun_things.core.utils import NPSScraper, RewriteCache
+
+READ_SIZE = 1 << 16
+# Stored instead of the content hash for rows whose description wasn't LLM-rewritten. It
+# never matches a real hash, so the next sync_things_to_do rewrites them.
+UNREWRITTEN_HASH = "unrewritten"
+STAGING_COLUMNS = (
+    "line", "nps_id", "title", "description", "url", "image_url", "longitude", "latitude", "content_hash",
+)
+
+
+def open_dump(path):
+    """Opens a dump as text, transparently decompressing .gz files."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def iter_ndjson(f):
+    """Yields one item per non-blank line."""
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_json_array(f, key="data"):
+    """Yields the elements of the dump's item array without loading it whole.
+
+    The array is either the whole document or, for an API response like
+    {"total": ..., "data": [...]}, the value of its top-level ``key``; the object's other
+    members are parsed and skipped. Only the unparsed tail of the text is kept in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+
+    def peek(skip=" \t\r\n"):
+        """Returns the next character not in ``skip``, reading more as needed, or "" at EOF."""
+        nonlocal buffer, position
+        while True:
+            while position < len(buffer) and buffer[position] in skip:
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                return ""
+            buffer, position = chunk, 0
+
+    def decode():
+        """Decodes the value at ``position``, reading more while it is cut off."""
+        nonlocal buffer, position
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                # A number is only complete once a delimiter follows it; "1" may be "1.5e3"
+                complete = isinstance(value, (dict, list, str)) or (end < len(buffer) and buffer[end] in " \t\r\n,]}")
+            except json.JSONDecodeError:
+                complete = False
+            if complete:
+                position = end
+                return value
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                value, position = decoder.raw_decode(buffer, position)
+                return value
+            buffer, position = buffer[position:] + chunk, 0
+
+    first = peek()
+    if first == "{":
+        position += 1
+        while True:
+            if peek(" \t\r\n,") in ("}", ""):
+                return
+            name = decode()
+            if peek() != ":":
+                raise json.JSONDecodeError("Expecting ':' delimiter", buffer, position)
+            position += 1
+            if peek() == "[" and name == key:
+                break
+            decode()
+    elif first != "[":
+        if first:
+            raise json.JSONDecodeError("Expecting an array or object", buffer, position)
+        return
+    position += 1
+
+    while True:
+        if peek(" \t\r\n,") in ("]", ""):
+            return
+        yield decode()
+        if position > READ_SIZE:
+            buffer, position = buffer[position:], 0
+
+
+def copy_value(value) -> str:
+    """Formats one value for COPY's text format."""
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+class CopyStream:
+    """File-like view over generated COPY lines, so psycopg2 can stream them without a temp file."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+class Command(BaseCommand):
+    help = "Loads an archived NPS things-to-do dump (JSON or NDJSON) via COPY into a staging table, then merges it."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Dump file; .gz files are decompressed on the fly")
+        parser.add_argument(
+            "--format", choices=["auto", "json", "ndjson"], default="auto",
+            help="auto treats .ndjson and .jsonl (optionally .gz) as NDJSON and anything else as JSON",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not os.path.exists(path):
+            raise CommandError(f"No such dump: {path}")
+        dump_format = options["format"]
+        if dump_format == "auto":
+            base = path[:-3] if path.endswith(".gz") else path
+            dump_format = "ndjson" if base.endswith((".ndjson", ".jsonl")) else "json"
+
+        # Same normalisation the API scraper applies, minus the LLM rewrite
+        scraper = NPSScraper(rewrite_cache=RewriteCache(":memory:"))
+        self.skipped = 0
+        started = time.perf_counter()
+
+        with open_dump(path) as f, transaction.atomic(), connection.cursor() as cursor:
+            items = iter_ndjson(f) if dump_format == "ndjson" else iter_json_array(f)
+            cursor.execute(
+                """
+                CREATE TEMP TABLE nps_staging (
+                    line bigint, nps_id text, title text, description text, url text, image_url text,
+                    longitude double precision, latitude double precision, content_hash text
+                ) ON COMMIT DROP
+                """
+            )
+            cursor.cursor.copy_expert(
+                f"COPY nps_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN",
+                CopyStream(self.copy_lines(scraper, items)),
+            )
+            cursor.execute("SELECT count(*) FROM nps_staging")
+            staged = cursor.fetchone()[0]
+            self.stdout.write(f"Staged {staged} rows in {time.perf_counter() - started:.1f}s, skipped {self.skipped}")
+
+            inserted, updated = self.merge(cursor)
+
+        refresh_after_bulk_write()
+        self.stdout.write(self.style.SUCCESS(
+            f"Inserted {inserted} and updated {updated} activities in {time.perf_counter() - started:.1f}s. "
+            "Run build_content_index to refresh similar-activity vectors."
+        ))
+
+    def copy_lines(self, scraper, items):
+        """Normalises dump items into COPY lines, skipping any without an id."""
+        for line, thing in enumerate(items):
+            if not isinstance(thing, dict) or not thing.get("id"):
+                self.skipped += 1
+                continue
+            activity = scraper.build_activity(thing, scraper.clean_description(thing.get("longDescription", "")))
+            location = activity.location
+            row = (
+                line, activity.nps_id, activity.title, activity.description, activity.url, activity.image_url,
+                location.x if location else None, location.y if location else None, activity.content_hash,
+            )
+            yield "\t".join(copy_value(value) for value in row) + "\n"
+
+    def merge(self, cursor):
+        """Upserts staged rows into the activity table, keeping the last copy of each nps_id.
+
+        Rows whose stored content hash matches the dump's are left alone, so re-loading a
+        dump over an already synced database keeps its LLM-rewritten descriptions. Written
+        rows get UNREWRITTEN_HASH so the next sync gives them a rewrite; existing rows keep
+        their QC verdict.
+        """
+        table = NPSThingToDo._meta.db_table
+        cursor.execute(
+            f"""
+            WITH latest AS (
+                SELECT DISTINCT ON (nps_id) *
+                FROM nps_staging
+                WHERE length(nps_id) <= 255
+                ORDER BY nps_id, line DESC
+            ),
+            upserted AS (
+                INSERT INTO {table} (
+                    nps_id, title, description, url, image_url, location, passes_qc, content_hash, updated_at
+                )
+                SELECT
+                    latest.nps_id,
+                    left(latest.title, 255),
+                    latest.description,
+                    CASE WHEN length(latest.url) <= 200 THEN latest.url END,
+                    CASE WHEN length(latest.image_url) <= 200 THEN latest.image_url END,
+                    CASE
+                        WHEN latest.longitude IS NOT NULL
+                        THEN ST_SetSRID(ST_MakePoint(latest.longitude, latest.latitude), 4326)
+                    END,
+                    true,
+                    %s,
+                    now()
+                FROM latest
+                LEFT JOIN {table} existing ON existing.nps_id = latest.nps_id
+                WHERE existing.content_hash IS DISTINCT FROM latest.content_hash
+                ON CONFLICT (nps_id) DO UPDATE SET
+                    title = EXCLUDED.title,
+                    description = EXCLUDED.description,
+                    url = EXCLUDED.url,
+                    image_url = EXCLUDED.image_url,
+                    location = EXCLUDED.location,
+                    content_hash = EXCLUDED.content_hash,
+                    updated_at = EXCLUDED.updated_at
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted
+            """,
+            [UNREWRITTEN_HASH],
+        )
+        return cursor.fetchone()
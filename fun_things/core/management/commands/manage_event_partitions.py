@@ -0,0 +1,98 @@
+import datetime
+import re
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+TABLE = "core_interactionevent"
+DEFAULT_PARTITION = f"{TABLE}_default"
+PARTITION_NAME = re.compile(rf"^{TABLE}_y(\d{{4}})m(\d{{2}})$")
+
+
+def month_start(year, month):
+    """Midnight UTC on the first of the month, normalising month overflow either way."""
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return datetime.datetime(year, month, 1, tzinfo=datetime.timezone.utc)
+
+
+def partition_name(start):
+    return f"{TABLE}_y{start.year:04d}m{start.month:02d}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates monthly interaction event partitions ahead of time and drops ones older than "
+        "the retention window. Run it daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ahead", type=int, default=2, help="Months of partitions to create past the current one")
+        parser.add_argument("--retain-months", type=int, default=12, help="Drop partitions entirely older than this")
+        parser.add_argument("--dry-run", action="store_true", help="Print what would change without changing it")
+
+    def handle(self, *args, **options):
+        now = timezone.now().astimezone(datetime.timezone.utc)
+        existing = self.existing_partitions()
+
+        for offset in range(options["ahead"] + 1):
+            start = month_start(now.year, now.month + offset)
+            if start not in existing:
+                self.create_partition(start, options["dry_run"])
+
+        cutoff = month_start(now.year, now.month - options["retain_months"])
+        for start, name in sorted(existing.items()):
+            if month_start(start.year, start.month + 1) <= cutoff:
+                self.stdout.write(f"Dropping {name}")
+                if not options["dry_run"]:
+                    with connection.cursor() as cursor:
+                        cursor.execute(f"DROP TABLE {name}")
+
+        self.stdout.write(self.style.SUCCESS("Interaction event partitions are up to date"))
+
+    def existing_partitions(self):
+        """Returns {month start: partition table} for the attached monthly partitions."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT child.relname FROM pg_inherits
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE parent.relname = %s
+                """,
+                [TABLE],
+            )
+            names = [row[0] for row in cursor.fetchall()]
+        partitions = {}
+        for name in names:
+            match = PARTITION_NAME.match(name)
+            if match:
+                partitions[month_start(int(match.group(1)), int(match.group(2)))] = name
+        return partitions
+
+    def create_partition(self, start, dry_run):
+        """Attaches a partition for the month starting at ``start``.
+
+        A new range partition can't be attached while the default partition holds rows in
+        its range, so those rows are moved into the new table first, in the same transaction.
+        """
+        end = month_start(start.year, start.month + 1)
+        name = partition_name(start)
+        self.stdout.write(f"Creating {name} for [{start:%Y-%m-%d}, {end:%Y-%m-%d})")
+        if dry_run:
+            return
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+            cursor.execute(
+                f"""
+                WITH moved AS (
+                    DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+                """,
+                [start, end],
+            )
+            if cursor.rowcount:
+                self.stdout.write(f"  moved {cursor.rowcount} events out of {DEFAULT_PARTITION}")
+            cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", [start, end])
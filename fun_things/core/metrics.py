@@ -0,0 +1,165 @@
+import contextvars
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+from django.db import connection
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50)
+
+
+def format_labels(labels: tuple) -> str:
+    return ",".join(f'{name}="{value}"' for name, value in labels)
+
+
+class Histogram:
+    """Fixed-bucket histogram keyed by label values, rendered in Prometheus text format."""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple, buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # Label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = tuple(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{format_labels(labels + (("le", bound),))}}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{format_labels(labels + (("le", "+Inf"),))}}} {values[-1]}')
+            lines.append(f"{self.name}_sum{{{format_labels(labels)}}} {values[-2]}")
+            lines.append(f"{self.name}_count{{{format_labels(labels)}}} {values[-1]}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by label values, rendered in Prometheus text format."""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = dict(self._series)
+        for label_values, value in sorted(series.items()):
+            lines.append(f"{self.name}{{{format_labels(tuple(zip(self.label_names, label_values)))}}} {value}")
+        return lines
+
+
+call_duration = Histogram(
+    "recommender_call_duration_seconds", "Wall time of a recommender call.",
+    ("recommender", "method"), DURATION_BUCKETS,
+)
+candidate_count = Histogram(
+    "recommender_candidates", "Number of candidate activities considered per call.",
+    ("recommender", "method"), SIZE_BUCKETS,
+)
+query_count = Histogram(
+    "recommender_queries", "SQL queries issued per call.",
+    ("recommender", "method"), QUERY_BUCKETS,
+)
+cache_requests = Counter(
+    "recommender_cache_requests_total", "Recommender cache lookups by result.",
+    ("recommender", "cache", "result"),
+)
+interaction_events = Counter(
+    "interaction_events_total", "Interaction events by what happened to them in the write buffer.",
+    ("result",),
+)
+METRICS = (call_duration, candidate_count, query_count, cache_requests, interaction_events)
+
+
+def render_metrics() -> str:
+    """Returns every metric in Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class CallStats:
+    """What one outermost recommender call did, filled in by the hooks below."""
+
+    def __init__(self, recommender: str):
+        self.recommender = recommender
+        self.queries = 0
+        self.candidates = None
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+_current_call = contextvars.ContextVar("recommender_call", default=None)
+
+
+def record_candidates(count: int):
+    """Records how many candidates the current recommender call considered."""
+    call = _current_call.get()
+    if call is not None:
+        call.candidates = count
+
+
+def record_cache(cache: str, hit: bool):
+    """Records a cache hit or miss against the current recommender call."""
+    call = _current_call.get()
+    if call is not None:
+        cache_requests.inc(call.recommender, cache, "hit" if hit else "miss")
+
+
+def instrumented(method):
+    """Wraps a recommender method to time it and count its queries.
+
+    Only the outermost call is recorded, so a subclass falling back to ``super()`` is
+    measured once, under the subclass's name.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if _current_call.get() is not None:
+            return method(self, *args, **kwargs)
+
+        call = CallStats(type(self).__name__)
+        token = _current_call.set(call)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(call.count_query):
+                return method(self, *args, **kwargs)
+        finally:
+            _current_call.reset(token)
+            call_duration.observe(time.perf_counter() - started, call.recommender, method.__name__)
+            query_count.observe(call.queries, call.recommender, method.__name__)
+            if call.candidates is not None:
+                candidate_count.observe(call.candidates, call.recommender, method.__name__)
+
+    return wrapper
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_npsthingtodo_passes_qc'),
+    ]
+
+    operations = [
+        # Backs the ST_DWithin cutoff used by PostGISDistanceRecommender
+        migrations.RunSQL(
+            sql=(
+                "CREATE INDEX core_npsthingtodo_location_geog_gist "
+                "ON core_npsthingtodo USING GIST ((location::geography)) "
+                "WHERE passes_qc AND location IS NOT NULL;"
+            ),
+            reverse_sql="DROP INDEX IF EXISTS core_npsthingtodo_location_geog_gist;",
+        ),
+    ]
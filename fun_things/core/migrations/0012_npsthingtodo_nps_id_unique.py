@@ -0,0 +1,52 @@
+from django.db import migrations, models
+from django.db.models import Min
+
+M2M_FIELDS = ('saved_activities', 'submitted_activities', 'thumbs_up', 'thumbs_down')
+
+
+def null_blank_and_duplicate_nps_ids(apps, schema_editor):
+    """Clears user submissions' blank nps_id and keeps the oldest row for each NPS id.
+
+    User-submitted activities have no NPS id and were stored with '', so they become
+    NULL (which the unique constraint allows any number of) rather than duplicates.
+    Saves, submissions and votes on a dropped duplicate are moved to the kept row.
+    """
+    NPSThingToDo = apps.get_model('core', 'NPSThingToDo')
+    CustomUser = apps.get_model('core', 'CustomUser')
+    NPSThingToDo.objects.filter(nps_id='').update(nps_id=None)
+    duplicates = (
+        NPSThingToDo.objects.filter(nps_id__isnull=False).values('nps_id')
+        .annotate(keep_id=Min('id'), rows=models.Count('id'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        others = NPSThingToDo.objects.filter(nps_id=duplicate['nps_id']).exclude(id=duplicate['keep_id'])
+        for field in M2M_FIELDS:
+            through = getattr(CustomUser, field).through
+            user_ids = through.objects.filter(npsthingtodo__in=others).values_list('customuser_id', flat=True)
+            through.objects.bulk_create(
+                [through(customuser_id=u, npsthingtodo_id=duplicate['keep_id']) for u in set(user_ids)],
+                ignore_conflicts=True,
+            )
+        others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_npsthingtodo_location_geography_gist'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='npsthingtodo',
+            name='nps_id',
+            field=models.CharField(max_length=255, null=True, blank=True),
+        ),
+        migrations.RunPython(null_blank_and_duplicate_nps_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='npsthingtodo',
+            name='nps_id',
+            field=models.CharField(max_length=255, null=True, blank=True, unique=True),
+        ),
+    ]
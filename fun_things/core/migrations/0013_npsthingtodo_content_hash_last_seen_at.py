@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_npsthingtodo_nps_id_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='npsthingtodo',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='npsthingtodo',
+            name='last_seen_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='npsthingtodo',
+            name='disappeared_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+from django.db.models import Min
+
+M2M_FIELDS = ('saved_activities', 'submitted_activities', 'thumbs_up', 'thumbs_down')
+
+
+def merge_duplicate_firebase_ids(apps, schema_editor):
+    """Folds users sharing a firebase_id into the oldest one so the unique constraint can be added."""
+    CustomUser = apps.get_model('core', 'CustomUser')
+    duplicates = (
+        CustomUser.objects.exclude(firebase_id=None).values('firebase_id')
+        .annotate(keep_id=Min('id'), rows=models.Count('id'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        others = CustomUser.objects.filter(firebase_id=duplicate['firebase_id']).exclude(id=duplicate['keep_id'])
+        for field in M2M_FIELDS:
+            through = getattr(CustomUser, field).through
+            activity_ids = through.objects.filter(customuser__in=others).values_list('npsthingtodo_id', flat=True)
+            through.objects.bulk_create(
+                [through(customuser_id=duplicate['keep_id'], npsthingtodo_id=a) for a in set(activity_ids)],
+                ignore_conflicts=True,
+            )
+        others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_npsthingtodo_content_hash_last_seen_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_firebase_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='customuser',
+            name='firebase_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+    ]
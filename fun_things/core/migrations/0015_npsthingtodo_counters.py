@@ -0,0 +1,47 @@
+from django.db import migrations, models
+
+# Counter column -> through table it counts
+COUNTERS = {
+    'favorites_count': 'core_customuser_saved_activities',
+    'thumbs_up_count': 'core_customuser_thumbs_up',
+    'thumbs_down_count': 'core_customuser_thumbs_down',
+}
+
+
+def backfill_counters(apps, schema_editor):
+    """Fills the new counter columns from the m2m tables, one UPDATE per counter."""
+    with schema_editor.connection.cursor() as cursor:
+        for column, through_table in COUNTERS.items():
+            cursor.execute(
+                f"""
+                UPDATE core_npsthingtodo SET {column} = counts.n
+                FROM (SELECT npsthingtodo_id, count(*) AS n FROM {through_table} GROUP BY npsthingtodo_id) counts
+                WHERE core_npsthingtodo.id = counts.npsthingtodo_id
+                """
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_customuser_firebase_id_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='npsthingtodo',
+            name='favorites_count',
+            field=models.PositiveIntegerField(db_default=0, default=0),
+        ),
+        migrations.AddField(
+            model_name='npsthingtodo',
+            name='thumbs_up_count',
+            field=models.PositiveIntegerField(db_default=0, default=0),
+        ),
+        migrations.AddField(
+            model_name='npsthingtodo',
+            name='thumbs_down_count',
+            field=models.PositiveIntegerField(db_default=0, default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_npsthingtodo_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InteractionEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField()),
+                ('user_id', models.BigIntegerField(blank=True, null=True)),
+                ('activity_id', models.BigIntegerField(blank=True, null=True)),
+                ('event_type', models.CharField(choices=[('impression', 'Impression'), ('skip', 'Skip'), ('detail_view', 'Detail view'), ('favorite', 'Favorite'), ('unfavorite', 'Unfavorite'), ('upvote', 'Upvote'), ('downvote', 'Downvote')], max_length=16)),
+            ],
+            options={
+                'db_table': 'core_interactionevent',
+                'managed': False,
+            },
+        ),
+        # Partitioned by month so old events are dropped with DROP TABLE instead of DELETE.
+        # The primary key has to include the partition key; rows that arrive before their
+        # month's partition exists land in the default partition until
+        # manage_event_partitions moves them out.
+        migrations.RunSQL(
+            sql=[
+                """
+                CREATE TABLE core_interactionevent (
+                    id bigint GENERATED BY DEFAULT AS IDENTITY,
+                    created_at timestamp with time zone NOT NULL,
+                    user_id bigint NULL,
+                    activity_id bigint NULL,
+                    event_type varchar(16) NOT NULL,
+                    PRIMARY KEY (id, created_at)
+                ) PARTITION BY RANGE (created_at);
+                """,
+                "CREATE TABLE core_interactionevent_default PARTITION OF core_interactionevent DEFAULT;",
+                "CREATE INDEX core_interactionevent_user_created ON core_interactionevent (user_id, created_at);",
+                "CREATE INDEX core_interactionevent_activity_created ON core_interactionevent (activity_id, created_at);",
+            ],
+            reverse_sql="DROP TABLE IF EXISTS core_interactionevent CASCADE;",
+        ),
+    ]
@@ -0,0 +1,17 @@
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_interactionevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='npsthingtodo',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now()),
+        ),
+    ]
@@ -3,10 +3,12 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.contrib.gis.db import models as gis_models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Now
 
 class CustomUser(AbstractUser):
     """Custom user model storing login, location, saved activities, and votes."""
-    firebase_id = models.CharField(max_length=255, blank=True, null=True)
+    firebase_id = models.CharField(max_length=255, blank=True, null=True, unique=True)
     saved_activities = models.ManyToManyField("NPSThingToDo", blank=True, related_name="saved_by_users")
     submitted_activities = models.ManyToManyField("NPSThingToDo", blank=True, related_name="submitted_by_users")
     thumbs_up = models.ManyToManyField("NPSThingToDo", blank=True, related_name="liked_by_users")
@@ -16,17 +18,95 @@ class CustomUser(AbstractUser):
         return self.firebase_id
 
 
+# Counter column on NPSThingToDo -> CustomUser m2m field it counts
+COUNT_FIELDS = {
+    "favorites_count": "saved_activities",
+    "thumbs_up_count": "thumbs_up",
+    "thumbs_down_count": "thumbs_down",
+}
+
+
+class NPSThingToDoQuerySet(models.QuerySet):
+    def with_computed_counts(self):
+        """Annotates ``computed_<counter>`` recounted from the through tables, to check the counters against."""
+        annotations = {}
+        for name, field in COUNT_FIELDS.items():
+            through = getattr(CustomUser, field).through
+            counts = (
+                through.objects.filter(npsthingtodo_id=OuterRef("pk"))
+                .order_by().values("npsthingtodo_id").annotate(count=Count("*")).values("count")
+            )
+            annotations[f"computed_{name}"] = Coalesce(Subquery(counts), 0)
+        return self.annotate(**annotations)
+
+
 class NPSThingToDo(models.Model):
     """Stores 'things to do' from the National Park Service API."""
 
-    nps_id = models.CharField(max_length=255)
+    objects = NPSThingToDoQuerySet.as_manager()
+
+    nps_id = models.CharField(max_length=255, null=True, blank=True, unique=True)  # NULL for user submissions
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     url = models.URLField(blank=True, null=True)
     image_url = models.URLField(blank=True, null=True)
     location = gis_models.PointField(blank=True, null=True)  # Store as a PointField
     passes_qc = models.BooleanField(default=False)
+    content_hash = models.CharField(max_length=64, blank=True, null=True)  # sha256 of the NPS fields we store
+    last_seen_at = models.DateTimeField(blank=True, null=True)  # Start of the last sync that returned this item
+    disappeared_at = models.DateTimeField(blank=True, null=True)  # Set while a sync hides an item the API dropped
+    # Denormalised from the CustomUser m2m tables (see COUNT_FIELDS); kept current by
+    # update_preference and repaired by the reconcile_activity_counts command. The DB
+    # defaults let raw INSERTs (e.g. load_nps_dump) leave them out
+    favorites_count = models.PositiveIntegerField(default=0, db_default=0)
+    thumbs_up_count = models.PositiveIntegerField(default=0, db_default=0)
+    thumbs_down_count = models.PositiveIntegerField(default=0, db_default=0)
+    # Version of what get_activity_details returns; bulk and queryset writes set it explicitly
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets signals invalidate caches around where the activity was, not just where it is
+        instance._loaded_location = instance.__dict__.get("location")
+        return instance
 
     def __str__(self):
         return self.title
+
+
+class InteractionEvent(models.Model):
+    """Append-only log of what users were shown and did, written in batches by core.events.
+
+    The table is range-partitioned by month on created_at (see the manage_event_partitions
+    command), so it is created by raw SQL in its migration rather than managed here. It
+    has no foreign keys: anonymous impressions have no user, and rows must outlive the
+    activities and users they mention.
+    """
+
+    IMPRESSION = "impression"
+    SKIP = "skip"
+    DETAIL_VIEW = "detail_view"
+    FAVORITE = "favorite"
+    UNFAVORITE = "unfavorite"
+    UPVOTE = "upvote"
+    DOWNVOTE = "downvote"
+    EVENT_TYPES = [
+        (IMPRESSION, "Impression"),
+        (SKIP, "Skip"),
+        (DETAIL_VIEW, "Detail view"),
+        (FAVORITE, "Favorite"),
+        (UNFAVORITE, "Unfavorite"),
+        (UPVOTE, "Upvote"),
+        (DOWNVOTE, "Downvote"),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    created_at = models.DateTimeField()
+    user_id = models.BigIntegerField(blank=True, null=True)
+    activity_id = models.BigIntegerField(blank=True, null=True)
+    event_type = models.CharField(max_length=16, choices=EVENT_TYPES)
+
+    class Meta:
+        managed = False
+        db_table = "core_interactionevent"
@@ -0,0 +1,159 @@
+from django.db import router, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest, Now
+from django.db.models.signals import m2m_changed
+
+from fun_things.core.events import record_events
+from fun_things.core.models import CustomUser, InteractionEvent, NPSThingToDo
+
+ACTIONS = ("favorite", "upvote", "downvote")
+# m2m field -> counter column it feeds
+PREFERENCE_FIELDS = {
+    "saved_activities": "favorites_count",
+    "thumbs_up": "thumbs_up_count",
+    "thumbs_down": "thumbs_down_count",
+}
+# m2m field -> interaction events logged for net additions and removals
+PREFERENCE_EVENTS = {
+    "saved_activities": (InteractionEvent.FAVORITE, InteractionEvent.UNFAVORITE),
+    "thumbs_up": (InteractionEvent.UPVOTE, None),  # Votes are only removed by the opposite vote
+    "thumbs_down": (InteractionEvent.DOWNVOTE, None),
+}
+
+
+class PreferenceError(Exception):
+    """An operation in a preference batch is invalid; nothing was applied."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def validate_operations(operations):
+    """Returns [(activity_id, action)] or raises PreferenceError for malformed operations."""
+    if not isinstance(operations, list) or not operations:
+        raise PreferenceError("Expected a non-empty list of operations")
+
+    parsed = []
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise PreferenceError("Invalid request parameters")
+        activity_id = operation.get("activity_id")
+        action = operation.get("action")
+        if not activity_id or action not in ACTIONS:
+            raise PreferenceError("Invalid request parameters")
+        try:
+            parsed.append((int(activity_id), action))
+        except (TypeError, ValueError):
+            raise PreferenceError("Invalid request parameters")
+    return parsed
+
+
+def load_state(user, activity_ids):
+    """Returns {m2m field: set of activity ids} for the user's current rows among activity_ids."""
+    return {
+        field: set(
+            getattr(CustomUser, field).through.objects
+            .filter(customuser_id=user.id, npsthingtodo_id__in=activity_ids)
+            .values_list("npsthingtodo_id", flat=True)
+        )
+        for field in PREFERENCE_FIELDS
+    }
+
+
+def fold(state, operations):
+    """Applies operations in order to a copy of state; later operations on an activity win."""
+    state = {field: set(ids) for field, ids in state.items()}
+    for activity_id, action in operations:
+        if action == "favorite":
+            state["saved_activities"] ^= {activity_id}
+        elif action == "upvote":
+            state["thumbs_up"].add(activity_id)
+            state["thumbs_down"].discard(activity_id)
+        else:
+            state["thumbs_down"].add(activity_id)
+            state["thumbs_up"].discard(activity_id)
+    return state
+
+
+def send_m2m_changed(user, field, action, pk_set, using):
+    """Fires the m2m_changed signal a manager add()/remove() would have sent."""
+    m2m_changed.send(
+        sender=getattr(CustomUser, field).through, instance=user, action=action, reverse=False,
+        model=NPSThingToDo, pk_set=set(pk_set), using=using,
+    )
+
+
+def apply_preferences(user, operations):
+    """Applies an ordered batch of {activity_id, action} operations in one transaction.
+
+    Operations are folded over the user's current state first, so only the net change per
+    activity reaches the database: one bulk insert and one delete per through table, and
+    one UPDATE for every counter. m2m_changed is still sent for the net changes so caches
+    derived from votes stay current, and the net changes are logged as interaction events
+    once the transaction commits. Returns {activity_id: (favorited, vote, activity)}.
+    """
+    operations = validate_operations(operations)
+    activity_ids = {activity_id for activity_id, _ in operations}
+    using = router.db_for_write(CustomUser)
+
+    with transaction.atomic(using=using):
+        # Serialise this user's preference changes so the counter deltas match the rows
+        list(CustomUser.objects.select_for_update().filter(id=user.id).values_list("id", flat=True))
+        found = set(NPSThingToDo.objects.filter(id__in=activity_ids).values_list("id", flat=True))
+        if found != activity_ids:
+            raise PreferenceError(f"Activity not found: {sorted(activity_ids - found)}", status=404)
+
+        before = load_state(user, activity_ids)
+        after = fold(before, operations)
+
+        deltas = {}  # Counter column -> {activity id: delta}
+        for field, counter in PREFERENCE_FIELDS.items():
+            through = getattr(CustomUser, field).through
+            added = after[field] - before[field]
+            removed = before[field] - after[field]
+            if added:
+                send_m2m_changed(user, field, "pre_add", added, using)
+                through.objects.bulk_create(
+                    [through(customuser_id=user.id, npsthingtodo_id=activity_id) for activity_id in added],
+                    ignore_conflicts=True,
+                )
+                send_m2m_changed(user, field, "post_add", added, using)
+            if removed:
+                send_m2m_changed(user, field, "pre_remove", removed, using)
+                through.objects.filter(customuser_id=user.id, npsthingtodo_id__in=removed).delete()
+                send_m2m_changed(user, field, "post_remove", removed, using)
+            deltas[counter] = {**{a: 1 for a in added}, **{a: -1 for a in removed}}
+
+            for event_type, changed_ids in zip(PREFERENCE_EVENTS[field], (added, removed)):
+                if event_type and changed_ids:
+                    transaction.on_commit(
+                        lambda e=event_type, ids=sorted(changed_ids): record_events(e, user.id, ids),
+                        using=using,
+                    )
+
+        changed = {activity_id for counter_deltas in deltas.values() for activity_id in counter_deltas}
+        if changed:
+            # Clamp at 0: a counter that drifted low would otherwise fail the >= 0 check
+            # and roll back the whole batch
+            NPSThingToDo.objects.filter(id__in=changed).update(updated_at=Now(), **{
+                counter: Greatest(F(counter) + Case(
+                    *(When(id=activity_id, then=Value(delta)) for activity_id, delta in counter_deltas.items()),
+                    default=Value(0),
+                ), Value(0))
+                for counter, counter_deltas in deltas.items()
+                if counter_deltas
+            })
+
+        activities = NPSThingToDo.objects.in_bulk(activity_ids)
+
+    results = {}
+    for activity_id in activity_ids:
+        if activity_id in after["thumbs_up"]:
+            vote = "up"
+        elif activity_id in after["thumbs_down"]:
+            vote = "down"
+        else:
+            vote = None
+        results[activity_id] = (activity_id in after["saved_activities"], vote, activities[activity_id])
+    return results
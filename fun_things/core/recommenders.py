@@ -1,42 +1,144 @@
 from abc import ABC, abstractmethod
 from typing import Optional
 from fun_things.core.models import NPSThingToDo
+from fun_things.core.caches import TileCandidates, eligible_ids, tile_candidates
+from fun_things.core.collaborative import get_item_neighbors, load_interactions
+from fun_things.core.content import get_content_index
+from fun_things.core.metrics import instrumented, record_cache, record_candidates
+import logging
 import random
 import math
+import heapq
+import sys
+from array import array
+from bisect import bisect_right
 from django.db import connection
 from django.contrib.gis.db.models.functions import Distance
 from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from fun_things.core.spatial import (
+    ActivityIndex,
+    chord_for_distance,
+    distance_for_chord,
+    geohash,
+    geohash_bounds,
+    to_unit_vector,
+)
+
+logger = logging.getLogger(__name__)
 
 class BaseRecommender(ABC):
-    """Abstract base class for recommenders."""
+    """Abstract base class for recommenders.
+
+    ``recommend`` and ``recommend_many`` on every subclass are wrapped with
+    ``metrics.instrumented``, which records wall time and SQL queries per call.
+    Implementations report the rest through ``record_candidates`` and ``record_cache``.
+    """
+
+    personalized = False  # True when recommend/recommend_many accept the requesting ``user``
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in ("recommend", "recommend_many"):
+            if name in cls.__dict__:
+                setattr(cls, name, instrumented(cls.__dict__[name]))
 
     @abstractmethod
     def recommend(self, **kwargs) -> Optional[NPSThingToDo]:
         """Returns a recommended NPSThingToDo object based on given criteria."""
         pass
 
+    def recommend_many(self, count: int, **kwargs) -> list[NPSThingToDo]:
+        """Returns up to ``count`` distinct recommendations.
+
+        The default draws repeatedly and drops repeats; subclasses override this with a
+        single batched draw.
+        """
+        picks = {}
+        for _ in range(count * 3):
+            if len(picks) == count:
+                break
+            activity = self.recommend(**kwargs)
+            if activity is None:
+                break
+            picks.setdefault(activity.id, activity)
+        return list(picks.values())
+
+
+def gumbel_top_k(ids, log_weights, k: int) -> list[int]:
+    """Samples ``k`` distinct ids without replacement, proportional to exp(log_weight).
+
+    Adds Gumbel noise to each log-weight and keeps the ``k`` largest keys, which is
+    equivalent to drawing one id at a time and renormalising after each pick.
+    """
+    keys = []
+    for activity_id, log_weight in zip(ids, log_weights):
+        u = random.random() or sys.float_info.min  # Gumbel noise needs u in (0, 1)
+        keys.append((log_weight - math.log(-math.log(u)), activity_id))
+    return [activity_id for _, activity_id in heapq.nlargest(k, keys)]
+
+
+def fetch_in_order(ids) -> list[NPSThingToDo]:
+    """Fetches activities with one id__in query, preserving the order of ``ids``."""
+    activities = NPSThingToDo.objects.in_bulk(ids)
+    return [activities[activity_id] for activity_id in ids if activity_id in activities]
+
 class RandomRecommender(BaseRecommender):
     """Recommender that selects a completely random activity."""
 
-    def recommend(self) -> Optional[NPSThingToDo]:
-        count = NPSThingToDo.objects.count()
-        if count == 0:
-            return None
-        
-        random_index = random.randint(0, count - 1)
-        return NPSThingToDo.objects.filter(passes_qc=True)[random_index]
+    MAX_ATTEMPTS = 3  # Retries when a sampled id was deleted by another process
+    MAX_REDRAWS = 5  # Redraws of excluded picks before falling back to a full filtered pass
+
+    def recommend(self, exclude=None) -> Optional[NPSThingToDo]:
+        """Draws a uniform id from the cached eligible-id array and fetches that row."""
+        for _ in range(self.MAX_ATTEMPTS):
+            sampled = self._sample(1, exclude)
+            if not sampled:
+                return None
+
+            activity = NPSThingToDo.objects.filter(id=sampled[0], passes_qc=True).first()
+            if activity is not None:
+                return activity
+            eligible_ids.discard(sampled[0])
+        return None
+
+    def recommend_many(self, count: int, exclude=None) -> list[NPSThingToDo]:
+        """Draws ``count`` distinct ids from the cached array and fetches them together."""
+        return fetch_in_order(self._sample(count, exclude))
+
+    def _sample(self, count: int, exclude) -> list[int]:
+        """Samples ``count`` ids uniformly from the eligible ids not in ``exclude``."""
+        record_candidates(len(eligible_ids))
+        if not exclude:
+            return eligible_ids.sample(count)
+
+        picks = {}
+        missing = count
+        for _ in range(self.MAX_REDRAWS + 1):
+            for activity_id in eligible_ids.sample(missing):
+                if activity_id not in exclude:
+                    picks.setdefault(activity_id, None)
+            missing = count - len(picks)
+            if missing <= 0:
+                return list(picks)[:count]
+
+        # Exclusions cover most of the catalog, so filter all of it rather than keep guessing
+        for activity_id in eligible_ids.sample(len(eligible_ids)):
+            if activity_id not in exclude:
+                picks.setdefault(activity_id, None)
+        return list(picks)[:count]
 
 class DistanceRecommender(BaseRecommender):
     """Recommender that selects activities weighted by proximity to the user."""
 
     LAMBDA = 0.000003  # Controls how fast probability decays with distance
 
-    def recommend(self, latitude: float, longitude: float) -> Optional[NPSThingToDo]:
+    def recommend(self, latitude: float, longitude: float, exclude=None) -> Optional[NPSThingToDo]:
         """Recommend an activity based on distance-weighted probabilities."""
         
         # Create a Point object for the user's location
         user_location = Point(longitude, latitude, srid=4326)  # SRID 4326 is standard for lat/lon
-        print('user_location', user_location)
+        logger.debug("user_location %s", user_location)
         
         # Query database using Django ORM
         activities = (
@@ -53,7 +155,11 @@ class DistanceRecommender(BaseRecommender):
         weighted_choices = [
             (activity.id, math.exp(-self.LAMBDA * activity.distance.m))  # Distance in meters
             for activity in activities
+            if not exclude or activity.id not in exclude
         ]
+        record_candidates(len(weighted_choices))
+        if not weighted_choices:
+            return None
 
         # Normalize weights into a probability distribution
         total_weight = sum(w for _, w in weighted_choices)
@@ -66,6 +172,280 @@ class DistanceRecommender(BaseRecommender):
             k=1
         )[0]
 
-        print('activity location', NPSThingToDo.objects.get(id=activity_id).location)
+        activity = NPSThingToDo.objects.get(id=activity_id)
+        logger.debug("activity location %s", activity.location)
+        return activity
+
+    def recommend_many(self, count: int, latitude: float, longitude: float, exclude=None) -> list[NPSThingToDo]:
+        """Recommend ``count`` distinct activities, distance-weighted, without replacement."""
+        user_location = Point(longitude, latitude, srid=4326)
+        rows = (
+            NPSThingToDo.objects
+            .filter(location__isnull=False, passes_qc=True)
+            .annotate(distance=Distance("location", user_location))
+            .values_list("id", "distance")
+        )
+
+        ids = []
+        log_weights = []
+        for activity_id, distance in rows:
+            if exclude and activity_id in exclude:
+                continue
+            ids.append(activity_id)
+            log_weights.append(-self.LAMBDA * distance.m)
+
+        record_candidates(len(ids))
+        return fetch_in_order(gumbel_top_k(ids, log_weights, count))
+
+
+class IndexedDistanceRecommender(DistanceRecommender):
+    """Distance recommender that samples from an in-process KD-tree of activity locations.
+
+    Only activities whose weight exp(-LAMBDA * d) is above EPSILON are visited, so the
+    cost of a call scales with the size of the user's neighbourhood instead of the catalog.
+    """
+
+    EPSILON = 1e-6  # Weights below this are treated as zero
+
+    def candidates(self, latitude: float, longitude: float, exclude=None) -> list[tuple[int, float]]:
+        """Returns (activity id, distance in meters) for every activity above EPSILON weight."""
+        radius = chord_for_distance(-math.log(self.EPSILON) / self.LAMBDA)
+        record_cache("activity_index", ActivityIndex.is_built())
+        candidates = [
+            (activity_id, distance_for_chord(chord))
+            for activity_id, chord in ActivityIndex.get().query_radius(to_unit_vector(latitude, longitude), radius)
+            if not exclude or activity_id not in exclude
+        ]
+        record_candidates(len(candidates))
+        return candidates
+
+    def recommend(self, latitude: float, longitude: float, exclude=None) -> Optional[NPSThingToDo]:
+        """Recommend an activity by sampling nearby candidates from the spatial index."""
+        candidates = self.candidates(latitude, longitude, exclude)
+
+        # Nothing carries meaningful weight this far out, so fall back to the full scan
+        if not candidates:
+            return super().recommend(latitude=latitude, longitude=longitude, exclude=exclude)
+
+        activity_id = random.choices(
+            [activity_id for activity_id, _ in candidates],
+            weights=[math.exp(-self.LAMBDA * distance) for _, distance in candidates],
+            k=1
+        )[0]
+
+        return NPSThingToDo.objects.filter(id=activity_id).first()
+
+    def recommend_many(self, count: int, latitude: float, longitude: float, exclude=None) -> list[NPSThingToDo]:
+        """Recommend ``count`` distinct nearby activities from the spatial index."""
+        candidates = self.candidates(latitude, longitude, exclude)
+
+        # Too few candidates carry meaningful weight, so fall back to the full scan
+        if len(candidates) < count:
+            return super().recommend_many(count=count, latitude=latitude, longitude=longitude, exclude=exclude)
+
+        ids = gumbel_top_k(
+            [activity_id for activity_id, _ in candidates],
+            [-self.LAMBDA * distance for _, distance in candidates],
+            count,
+        )
+        return fetch_in_order(ids)
+
+
+class TileCachedDistanceRecommender(DistanceRecommender):
+    """Distance recommender that shares one candidate distribution per geohash cell.
+
+    The user's location is snapped to the centre of its cell, whose candidate ids and
+    cumulative weights are cached (see TileCache), so most calls only draw a random
+    number, binary-search the cumulative weights, and fetch one row. At precision 5 a
+    cell is about 5 km across, which moves any weight by about 1% at the default LAMBDA.
+    """
+
+    EPSILON = 1e-6  # Weights below this are treated as zero
+    GEOHASH_PRECISION = 5
+    MAX_ATTEMPTS = 10  # Redraws when a draw lands on an excluded activity
+
+    @classmethod
+    def influence_radius(cls) -> float:
+        """Distance in meters beyond which an activity's weight is below EPSILON."""
+        return -math.log(cls.EPSILON) / cls.LAMBDA
+
+    def tile(self, latitude: float, longitude: float) -> TileCandidates:
+        """Returns the cached candidates for the user's cell, computing them on a miss."""
+        cell = geohash(latitude, longitude, self.GEOHASH_PRECISION)
+        entry = tile_candidates.get(cell)
+        record_cache("tile_candidates", entry is not None)
+        if entry is None:
+            entry = self.build_tile(cell)
+            tile_candidates.set(cell, entry)
+        return entry
+
+    def build_tile(self, cell: str) -> TileCandidates:
+        """Queries every activity within the influence radius of the cell's centre."""
+        min_lat, min_lon, max_lat, max_lon = geohash_bounds(cell)
+        center = Point((min_lon + max_lon) / 2, (min_lat + max_lat) / 2, srid=4326)
+        rows = (
+            NPSThingToDo.objects
+            .filter(location__isnull=False, passes_qc=True)
+            .filter(location__distance_lte=(center, D(m=self.influence_radius())))
+            .annotate(distance=Distance("location", center))
+            .values_list("id", "distance")
+        )
+
+        ids = array("q")
+        cumulative = array("d")
+        total = 0.0
+        for activity_id, distance in rows:
+            total += math.exp(-self.LAMBDA * distance.m)
+            ids.append(activity_id)
+            cumulative.append(total)
+        return TileCandidates(cell, ids, cumulative)
+
+    def recommend(self, latitude: float, longitude: float, exclude=None) -> Optional[NPSThingToDo]:
+        """Recommend an activity by binary-searching the cell's cumulative weights."""
+        tile = self.tile(latitude, longitude)
+        record_candidates(len(tile.ids))
+        if tile.ids:
+            for _ in range(self.MAX_ATTEMPTS):
+                position = bisect_right(tile.cumulative, random.random() * tile.cumulative[-1])
+                activity_id = tile.ids[min(position, len(tile.ids) - 1)]
+                if not exclude or activity_id not in exclude:
+                    return NPSThingToDo.objects.filter(id=activity_id).first()
+
+        # Empty cell or mostly-excluded candidates, so fall back to the full scan
+        return super().recommend(latitude=latitude, longitude=longitude, exclude=exclude)
+
+    def recommend_many(self, count: int, latitude: float, longitude: float, exclude=None) -> list[NPSThingToDo]:
+        """Recommend ``count`` distinct activities from the cell's cached candidates."""
+        tile = self.tile(latitude, longitude)
+        record_candidates(len(tile.ids))
+
+        ids = []
+        log_weights = []
+        previous = 0.0
+        for activity_id, total in zip(tile.ids, tile.cumulative):
+            weight, previous = total - previous, total
+            if weight > 0 and (not exclude or activity_id not in exclude):
+                ids.append(activity_id)
+                log_weights.append(math.log(weight))
+
+        if len(ids) < count:
+            return super().recommend_many(count=count, latitude=latitude, longitude=longitude, exclude=exclude)
+        return fetch_in_order(gumbel_top_k(ids, log_weights, count))
+
+
+class PostGISDistanceRecommender(DistanceRecommender):
+    """Distance recommender that performs the weighted draw inside PostgreSQL.
+
+    Each candidate gets the exponential-race key -ln(u) / exp(-LAMBDA * d) with u uniform
+    on (0, 1]; the smallest key wins with probability proportional to its weight, so the
+    database returns exactly one row. Candidates are bounded by an ST_DWithin cutoff at
+    which the weight falls below EPSILON, served by the geography GiST index. Distances
+    use ST_DistanceSphere, the same function Django's Distance compiles to for this field.
+    Keeping the ``count`` smallest keys samples without replacement in the same query.
+    Excluded ids are bound as an array parameter rather than a subquery.
+    """
+
+    EPSILON = 1e-6  # Weights below this are treated as zero
+
+    SQL = """
+        SELECT * FROM {table}
+        WHERE passes_qc AND location IS NOT NULL
+          AND NOT (id = ANY(%(exclude)s))
+          {cutoff}
+        ORDER BY -ln(1.0 - random())
+            / exp(-%(lambda)s * ST_DistanceSphere(location, %(point)s::geometry))
+        LIMIT %(count)s
+    """
+    CUTOFF = "AND ST_DWithin(location::geography, %(point)s::geography, %(radius)s)"
 
-        return NPSThingToDo.objects.get(id=activity_id)
+    def recommend(self, latitude: float, longitude: float, exclude=None) -> Optional[NPSThingToDo]:
+        """Recommend an activity with a single distance-weighted query."""
+        activities = self.recommend_many(count=1, latitude=latitude, longitude=longitude, exclude=exclude)
+        return activities[0] if activities else None
+
+    def recommend_many(self, count: int, latitude: float, longitude: float, exclude=None) -> list[NPSThingToDo]:
+        """Recommend ``count`` distinct activities with a single distance-weighted query."""
+        params = {
+            "point": Point(longitude, latitude, srid=4326).ewkt,
+            "lambda": self.LAMBDA,
+            "radius": -math.log(self.EPSILON) / self.LAMBDA,
+            "count": count,
+            "exclude": list(exclude or ()),
+        }
+        table = NPSThingToDo._meta.db_table
+
+        activities = list(NPSThingToDo.objects.raw(self.SQL.format(table=table, cutoff=self.CUTOFF), params))
+
+        # Too few candidates carry meaningful weight, so draw from the whole table
+        if len(activities) < count:
+            activities = list(NPSThingToDo.objects.raw(self.SQL.format(table=table, cutoff=""), params))
+
+        return activities
+
+
+class CollaborativeRecommender(IndexedDistanceRecommender):
+    """Mixes item-item collaborative scores from a user's votes with the distance prior.
+
+    Each nearby candidate gets log-weight -LAMBDA * d + BETA * score, where score sums the
+    precomputed cosine similarity between the candidate and the items the user liked,
+    saved, or (negatively) downvoted. Users without votes get the plain distance prior.
+    """
+
+    BETA = 2.0  # Strength of the collaborative score relative to distance
+    personalized = True
+
+    def recommend(self, latitude: float, longitude: float, exclude=None, user=None) -> Optional[NPSThingToDo]:
+        """Recommend an activity near the user, nudged towards items like ones they voted up."""
+        activities = self.recommend_many(count=1, latitude=latitude, longitude=longitude, exclude=exclude, user=user)
+        return activities[0] if activities else None
+
+    def recommend_many(self, count: int, latitude: float, longitude: float, exclude=None, user=None) -> list[NPSThingToDo]:
+        """Recommend ``count`` distinct activities mixing collaborative scores and distance."""
+        scores = {}
+        if user is not None:
+            affinities = {
+                activity_id: value
+                for (_, activity_id), value in load_interactions(user_ids=[user.id]).items()
+            }
+            scores = get_item_neighbors().scores_for(affinities)
+
+        candidates = self.candidates(latitude, longitude, exclude)
+        if not scores or len(candidates) < count:
+            return super().recommend_many(count=count, latitude=latitude, longitude=longitude, exclude=exclude)
+
+        ids = gumbel_top_k(
+            [activity_id for activity_id, _ in candidates],
+            [
+                -self.LAMBDA * distance + self.BETA * scores.get(activity_id, 0.0)
+                for activity_id, distance in candidates
+            ],
+            count,
+        )
+        return fetch_in_order(ids)
+
+
+class SimilarActivityRecommender(BaseRecommender):
+    """Recommender that returns activities whose title and description read like a given one.
+
+    Neighbours come from the precomputed content index (see build_content_index), so a
+    call is a lookup plus one fetch of the chosen rows.
+    """
+
+    def recommend(self, activity_id: int, exclude=None) -> Optional[NPSThingToDo]:
+        """Returns the single most similar activity."""
+        activities = self.recommend_many(count=1, activity_id=activity_id, exclude=exclude)
+        return activities[0] if activities else None
+
+    def recommend_many(self, count: int, activity_id: int, exclude=None) -> list[NPSThingToDo]:
+        """Returns up to ``count`` activities most similar to ``activity_id``, best first."""
+        index = get_content_index()
+        if index is None:
+            return []
+
+        ids = [
+            neighbor_id for neighbor_id, _ in index.similar(activity_id)
+            if not exclude or neighbor_id not in exclude
+        ]
+        record_candidates(len(ids))
+        activities = NPSThingToDo.objects.filter(passes_qc=True).in_bulk(ids[:count])
+        return [activities[i] for i in ids[:count] if i in activities]
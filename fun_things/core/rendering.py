@@ -0,0 +1,76 @@
+import orjson
+from django.http import HttpResponse
+
+# Read-side fields of NPSThingToDoSerializer / NPSThingToDoCardSerializer, in output order
+CARD_COLUMNS = ("id", "title", "url", "image_url", "favorites_count", "thumbs_up_count", "thumbs_down_count")
+
+
+def render_location(location, address=None):
+    """NPSThingToDoSerializer.get_location for a Point (or None)."""
+    if location:
+        return {"latitude": location.y, "longitude": location.x, "address": address}
+    return None
+
+
+def render_activity(activity) -> dict:
+    """What NPSThingToDoSerializer(activity).data holds, without DRF's per-field machinery."""
+    return {
+        "id": activity.id,
+        "title": activity.title,
+        "url": activity.url,
+        "image_url": activity.image_url,
+        "favorites_count": activity.favorites_count,
+        "thumbs_up_count": activity.thumbs_up_count,
+        "thumbs_down_count": activity.thumbs_down_count,
+        "description": activity.description,
+        "location": render_location(activity.location, getattr(activity, "address", None)),
+    }
+
+
+def render_activity_card(activity) -> dict:
+    """What NPSThingToDoCardSerializer(activity).data holds; never touches the description."""
+    return {
+        "id": activity.id,
+        "title": activity.title,
+        "url": activity.url,
+        "image_url": activity.image_url,
+        "favorites_count": activity.favorites_count,
+        "thumbs_up_count": activity.thumbs_up_count,
+        "thumbs_down_count": activity.thumbs_down_count,
+        "location": render_location(activity.location, getattr(activity, "address", None)),
+    }
+
+
+def row_columns(card=False) -> tuple:
+    """values_list() columns for render_activity_row; location is last, as in the serializers."""
+    return (*CARD_COLUMNS, "location") if card else (*CARD_COLUMNS, "description", "location")
+
+
+def render_activity_row(columns, values) -> dict:
+    row = dict(zip(columns, values))
+    row["location"] = render_location(row["location"])
+    return row
+
+
+def render_activity_rows(queryset, card=False) -> list[dict]:
+    """Renders a queryset from values_list() tuples, skipping model instantiation entirely."""
+    columns = row_columns(card)
+    return [render_activity_row(columns, values) for values in queryset.values_list(*columns)]
+
+
+async def arender_activity_rows(queryset, card=False) -> list[dict]:
+    """render_activity_rows using the async ORM."""
+    columns = row_columns(card)
+    return [render_activity_row(columns, values) async for values in queryset.values_list(*columns)]
+
+
+def encode_json(data) -> bytes:
+    return orjson.dumps(data)
+
+
+class FastJsonResponse(HttpResponse):
+    """JsonResponse encoded with orjson; data may be any JSON-serializable value."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=encode_json(data), **kwargs)
@@ -7,9 +7,9 @@ from django.contrib.gis.geos import Point
 from .models import NPSThingToDo
 
 class NPSThingToDoSerializer(serializers.ModelSerializer):
-    favorites_count = serializers.IntegerField(source="favorites.count", read_only=True)
-    thumbs_up_count = serializers.IntegerField(source="thumbs_up.count", read_only=True)
-    thumbs_down_count = serializers.IntegerField(source="thumbs_down.count", read_only=True)
+    favorites_count = serializers.IntegerField(read_only=True)
+    thumbs_up_count = serializers.IntegerField(read_only=True)
+    thumbs_down_count = serializers.IntegerField(read_only=True)
     location = serializers.SerializerMethodField()
     location_input = serializers.JSONField(write_only=True, required=False)
 
@@ -42,6 +42,17 @@ class NPSThingToDoSerializer(serializers.ModelSerializer):
         return super().to_internal_value(data)
 
 
+class NPSThingToDoCardSerializer(NPSThingToDoSerializer):
+    """List-card projection: everything but the description, for querysets that defer it."""
+
+    class Meta(NPSThingToDoSerializer.Meta):
+        fields = [
+            "id", "title", "url", "image_url",
+            "favorites_count", "thumbs_up_count", "thumbs_down_count",
+            "location",
+        ]
+
+
 class CustomUserSerializer(serializers.ModelSerializer):
     
     class Meta:
@@ -0,0 +1,127 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from fun_things.core.authentication import forget_user
+from fun_things.core.caches import activity_details, eligible_ids, tile_candidates, user_exclusions
+from fun_things.core.collaborative import neighbor_updates
+from fun_things.core.models import CustomUser, NPSThingToDo
+from fun_things.core.recommenders import TileCachedDistanceRecommender
+from fun_things.core.spatial import ActivityIndex
+
+
+def refresh_after_bulk_write():
+    """Drops every in-process cache derived from activities.
+
+    bulk_create and queryset updates skip post_save/post_delete, so code that writes
+    activities in bulk calls this instead.
+    """
+    ActivityIndex.invalidate()
+    eligible_ids.invalidate()
+    tile_candidates.clear()
+    activity_details.clear()
+
+
+@receiver(post_save, sender=NPSThingToDo)
+@receiver(post_delete, sender=NPSThingToDo)
+def refresh_activity_index(sender, instance, **kwargs):
+    """Marks the spatial index stale when an activity is created, edited, or removed."""
+    ActivityIndex.invalidate()
+
+
+@receiver(post_save, sender=NPSThingToDo)
+@receiver(post_delete, sender=NPSThingToDo)
+def invalidate_tile_candidates(sender, instance, **kwargs):
+    """Drops cached tile candidates for cells within reach of a changed activity.
+
+    A moved activity also leaves the cells around its previous location, which is the
+    one it was loaded with (see NPSThingToDo.from_db) or last saved at.
+    """
+    locations = [instance.location]
+    previous = getattr(instance, "_loaded_location", None)
+    if previous is not None and previous != instance.location:
+        locations.append(previous)
+    for location in locations:
+        if location is not None:
+            tile_candidates.invalidate_near(location.y, location.x, TileCachedDistanceRecommender.influence_radius())
+    instance._loaded_location = instance.location
+
+
+@receiver(post_save, sender=NPSThingToDo)
+@receiver(post_delete, sender=NPSThingToDo)
+def invalidate_activity_details(sender, instance, **kwargs):
+    """Drops an activity's cached details response once the change is committed."""
+    activity_id = instance.id
+    transaction.on_commit(lambda: activity_details.pop(activity_id))
+
+
+@receiver(post_save, sender=NPSThingToDo)
+def update_eligible_ids(sender, instance, **kwargs):
+    """Keeps the RandomRecommender id array in step with an activity's QC status."""
+    if instance.passes_qc:
+        eligible_ids.add(instance.id)
+    else:
+        eligible_ids.discard(instance.id)
+
+
+@receiver(post_delete, sender=NPSThingToDo)
+def remove_eligible_id(sender, instance, **kwargs):
+    """Drops a deleted activity from the RandomRecommender id array."""
+    eligible_ids.discard(instance.id)
+
+
+@receiver(m2m_changed, sender=CustomUser.thumbs_up.through)
+@receiver(m2m_changed, sender=CustomUser.thumbs_down.through)
+@receiver(m2m_changed, sender=CustomUser.saved_activities.through)
+def update_item_neighbors(sender, instance, action, reverse, pk_set, **kwargs):
+    """Recomputes the collaborative-filtering rows of items whose votes changed."""
+    if action not in ("post_add", "post_remove") or not pk_set:
+        return
+    activity_ids = {instance.pk} if reverse else set(pk_set)
+    transaction.on_commit(lambda: neighbor_updates.schedule(activity_ids))
+
+
+@receiver(m2m_changed, sender=CustomUser.thumbs_up.through)
+@receiver(m2m_changed, sender=CustomUser.thumbs_down.through)
+@receiver(m2m_changed, sender=CustomUser.saved_activities.through)
+def invalidate_counted_activity_details(sender, instance, action, reverse, pk_set, **kwargs):
+    """Drops cached details of activities whose vote or favorite counts changed."""
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        activity_ids = {instance.pk}
+    elif action == "post_clear":
+        # pk_set is None after clear(), so there is no telling which activities changed
+        transaction.on_commit(activity_details.clear)
+        return
+    else:
+        activity_ids = set(pk_set or ())
+
+    def forget():
+        for activity_id in activity_ids:
+            activity_details.pop(activity_id)
+
+    transaction.on_commit(forget)
+
+
+@receiver(m2m_changed, sender=CustomUser.thumbs_down.through)
+def update_user_exclusions(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keeps cached per-user exclusion sets in step with thumbs_down."""
+    if action not in ("post_add", "post_remove") or not pk_set:
+        return
+    pairs = [(user_id, instance.pk) for user_id in pk_set] if reverse else [(instance.pk, pk) for pk in pk_set]
+    for user_id, activity_id in pairs:
+        exclusions = user_exclusions.peek(user_id)
+        if exclusions is None:
+            continue
+        if action == "post_add":
+            exclusions.downvoted.add(activity_id)
+        else:
+            exclusions.downvoted.discard(activity_id)
+
+
+@receiver(post_delete, sender=CustomUser)
+def forget_deleted_user(sender, instance, **kwargs):
+    """Stops resolving a deleted user's Firebase uid to their old id."""
+    if instance.firebase_id:
+        forget_user(instance.firebase_id)
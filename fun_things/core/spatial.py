@@ -0,0 +1,186 @@
+import math
+import threading
+import time
+from array import array
+
+EARTH_RADIUS_M = 6371008.8  # Mean earth radius in meters
+
+
+def to_unit_vector(latitude: float, longitude: float) -> tuple[float, float, float]:
+    """Converts lat/lon in degrees to a point on the unit sphere."""
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat))
+
+
+def chord_for_distance(meters: float) -> float:
+    """Returns the unit-sphere chord length spanning a great-circle distance in meters."""
+    angle = min(meters / EARTH_RADIUS_M, math.pi)
+    return 2 * math.sin(angle / 2)
+
+
+def distance_for_chord(chord: float) -> float:
+    """Returns the great-circle distance in meters spanned by a unit-sphere chord."""
+    return 2 * EARTH_RADIUS_M * math.asin(min(chord / 2, 1.0))
+
+
+class KDTree:
+    """Static 3-d tree over unit-sphere points, stored implicitly in flat arrays.
+
+    Each subrange [lo, hi) keeps its splitting point at the middle index and splits on
+    axis ``depth % 3``, so no node objects are allocated.
+    """
+
+    def __init__(self, ids, points):
+        order = list(range(len(ids)))
+        self._build(order, points, 0, len(order), 0)
+
+        self.ids = array("q", (ids[i] for i in order))
+        self.coords = array("d")
+        for i in order:
+            self.coords.extend(points[i])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _build(self, order, points, lo, hi, depth):
+        """Sorts order[lo:hi] so the median on the current axis sits in the middle."""
+        if hi - lo <= 1:
+            return
+        axis = depth % 3
+        order[lo:hi] = sorted(order[lo:hi], key=lambda i: points[i][axis])
+        mid = (lo + hi) // 2
+        self._build(order, points, lo, mid, depth + 1)
+        self._build(order, points, mid + 1, hi, depth + 1)
+
+    def query_radius(self, point, radius: float) -> list[tuple[int, float]]:
+        """Returns (id, chord length) for every point within ``radius`` of ``point``."""
+        results = []
+        radius_sq = radius * radius
+        coords = self.coords
+        stack = [(0, len(self.ids), 0)]
+
+        while stack:
+            lo, hi, depth = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            base = mid * 3
+            dx = coords[base] - point[0]
+            dy = coords[base + 1] - point[1]
+            dz = coords[base + 2] - point[2]
+            dist_sq = dx * dx + dy * dy + dz * dz
+            if dist_sq <= radius_sq:
+                results.append((self.ids[mid], math.sqrt(dist_sq)))
+
+            # Only descend into halves the query ball can reach
+            diff = point[depth % 3] - coords[base + depth % 3]
+            if diff - radius <= 0:
+                stack.append((lo, mid, depth + 1))
+            if diff + radius >= 0:
+                stack.append((mid + 1, hi, depth + 1))
+
+        return results
+
+
+class ActivityIndex:
+    """Process-wide KD-tree over QC'd activity locations, rebuilt lazily after changes.
+
+    Signals only fire in the process that made the change, so the tree is also rebuilt
+    once it is MAX_AGE seconds old to pick up writes from other processes.
+    """
+
+    MAX_AGE = 600
+    _tree = None
+    _built_at = 0.0
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls) -> KDTree:
+        """Returns the current tree, building it from the database if it is stale."""
+        with cls._lock:
+            if not cls.is_built():
+                cls._tree = cls.build()
+                cls._built_at = time.monotonic()
+            return cls._tree
+
+    @classmethod
+    def is_built(cls) -> bool:
+        """Returns whether a lookup right now would be served without a rebuild."""
+        return cls._tree is not None and time.monotonic() - cls._built_at < cls.MAX_AGE
+
+    @classmethod
+    def invalidate(cls):
+        """Marks the tree stale so the next lookup rebuilds it."""
+        cls._tree = None
+
+    @staticmethod
+    def build() -> KDTree:
+        """Loads (id, location) for every QC'd activity and builds a tree from them."""
+        from fun_things.core.models import NPSThingToDo
+
+        ids = []
+        points = []
+        rows = (
+            NPSThingToDo.objects
+            .filter(location__isnull=False, passes_qc=True)
+            .values_list("id", "location")
+        )
+        for activity_id, location in rows.iterator():
+            ids.append(activity_id)
+            points.append(to_unit_vector(location.y, location.x))
+        return KDTree(ids, points)
+
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(latitude: float, longitude: float, precision: int) -> str:
+    """Encodes a location as a geohash cell of ``precision`` characters."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+
+    while len(chars) < precision:
+        target, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if target >= mid:
+            value = (value << 1) | 1
+            bounds[0] = mid
+        else:
+            value <<= 1
+            bounds[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def geohash_bounds(cell: str) -> tuple[float, float, float, float]:
+    """Returns (min_lat, min_lon, max_lat, max_lon) of a geohash cell."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in cell:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bounds = lon_range if even else lat_range
+            mid = (bounds[0] + bounds[1]) / 2
+            if value >> shift & 1:
+                bounds[0] = mid
+            else:
+                bounds[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in meters between two lat/lon points."""
+    return distance_for_chord(math.dist(to_unit_vector(lat1, lon1), to_unit_vector(lat2, lon2)))
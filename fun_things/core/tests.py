@@ -1,3 +1,1116 @@
-from django.test import TestCase
+import asyncio
+import io
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from collections import Counter
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import orjson
+
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import Point
+from django.core.management import call_command
+from django.http import JsonResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from fun_things.core import metrics
+from fun_things.core.authentication import resolve_user_id, user_ids, verified_tokens, verify_id_token
+from fun_things.core.caches import (
+    EligibleIdCache,
+    IdBitmap,
+    TileCandidates,
+    UserExclusions,
+    activity_details,
+    eligible_ids,
+    tile_candidates,
+    user_exclusions,
+)
+from fun_things.core.collaborative import build_interaction_matrix, compute_item_neighbors
+from fun_things.core.content import ContentIndex, activity_text, get_content_index, vectorize
+from fun_things.core.events import EventBuffer, interaction_event_buffer
+from fun_things.core.management.commands.load_nps_dump import (
+    UNREWRITTEN_HASH,
+    CopyStream,
+    copy_value,
+    iter_json_array,
+)
+from fun_things.core.models import CustomUser, InteractionEvent, NPSThingToDo
+from fun_things.core.preferences import apply_preferences
+from fun_things.core.metrics import record_candidates
+from fun_things.core.recommenders import (
+    BaseRecommender,
+    DistanceRecommender,
+    PostGISDistanceRecommender,
+    RandomRecommender,
+    SimilarActivityRecommender,
+    TileCachedDistanceRecommender,
+    gumbel_top_k,
+)
+from fun_things.core.rendering import render_activity, render_activity_card, render_activity_rows
+from fun_things.core.serializers import NPSThingToDoCardSerializer, NPSThingToDoSerializer
+from fun_things.core.spatial import (
+    ActivityIndex,
+    KDTree,
+    chord_for_distance,
+    distance_for_chord,
+    geohash,
+    geohash_bounds,
+    haversine,
+    to_unit_vector,
+)
+from fun_things.core.utils import NPSScraper, RewriteCache
+from fun_things.core.views import MAX_ACTIVITY_BATCH
+
+
+class PostGISDistanceRecommenderTests(TestCase):
+    """Checks the in-database draw against the distribution DistanceRecommender samples from."""
+
+    LATITUDE = 40.0
+    LONGITUDE = -100.0
+    DRAWS = 3000
+    # Chi-square critical value for 4 degrees of freedom at p = 0.001
+    CRITICAL_VALUE = 18.47
+
+    @classmethod
+    def setUpTestData(cls):
+        # Activities due north of the user at roughly 0, 100, 200, 400 and 800 km
+        for i, offset in enumerate([0.0, 0.9, 1.8, 3.6, 7.2]):
+            NPSThingToDo.objects.create(
+                nps_id=f"test-{i}",
+                title=f"Activity {i}",
+                location=Point(cls.LONGITUDE, cls.LATITUDE + offset, srid=4326),
+                passes_qc=True,
+            )
+        NPSThingToDo.objects.create(
+            nps_id="test-no-qc",
+            title="Failed QC",
+            location=Point(cls.LONGITUDE, cls.LATITUDE, srid=4326),
+            passes_qc=False,
+        )
+
+    def expected_probabilities(self):
+        user_location = Point(self.LONGITUDE, self.LATITUDE, srid=4326)
+        activities = NPSThingToDo.objects.filter(passes_qc=True).annotate(
+            distance=Distance("location", user_location)
+        )
+        weights = {a.id: math.exp(-DistanceRecommender.LAMBDA * a.distance.m) for a in activities}
+        total = sum(weights.values())
+        return {activity_id: w / total for activity_id, w in weights.items()}
+
+    def chi_square(self, recommender):
+        counts = Counter(
+            recommender.recommend(latitude=self.LATITUDE, longitude=self.LONGITUDE).id
+            for _ in range(self.DRAWS)
+        )
+        expected = self.expected_probabilities()
+        self.assertLessEqual(set(counts), set(expected))
+        return sum(
+            (counts[activity_id] - self.DRAWS * p) ** 2 / (self.DRAWS * p)
+            for activity_id, p in expected.items()
+        )
+
+    def test_matches_exponential_decay_distribution(self):
+        self.assertLess(self.chi_square(PostGISDistanceRecommender()), self.CRITICAL_VALUE)
+
+    def test_python_recommender_matches_same_distribution(self):
+        self.assertLess(self.chi_square(DistanceRecommender()), self.CRITICAL_VALUE)
+
+    def test_draw_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            PostGISDistanceRecommender().recommend(latitude=self.LATITUDE, longitude=self.LONGITUDE)
+
+
+class AsyncScraperTests(SimpleTestCase):
+    """Runs the concurrent fetch path against an in-process fake of the NPS API."""
+
+    TOTAL = 230
+
+    def fake_nps(self, request):
+        start = int(request.url.params["start"])
+        self.calls[start] = self.calls.get(start, 0) + 1
+        # Page 100 is rate limited twice and page 150 fails once before succeeding
+        if start == 100 and self.calls[start] < 3:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        if start == 150 and self.calls[start] < 2:
+            return httpx.Response(503)
+        count = min(50, self.TOTAL - start)
+        return httpx.Response(200, json={
+            "total": str(self.TOTAL),
+            "data": [{"id": f"thing-{start + i}"} for i in range(count)],
+        })
+
+    def test_fetches_every_page_once_despite_retries(self):
+        self.calls = {}
+        stored = []
+        scraper = NPSScraper(
+            base_url="http://nps.test/api/v1", requests_per_hour=3600 * 1000, burst=100,
+            rewrite_cache=RewriteCache(":memory:"),
+        )
+        scraper.BASE_BACKOFF = 0.001
+
+        with mock.patch.object(scraper, "store_page", lambda things: stored.extend(t["id"] for t in things)):
+            asyncio.run(scraper.store_things_to_do_async(
+                batch_size=50, concurrency=4, transport=httpx.MockTransport(self.fake_nps)
+            ))
+
+        self.assertEqual(sorted(stored), sorted(f"thing-{i}" for i in range(self.TOTAL)))
+        self.assertEqual(self.calls, {0: 1, 50: 1, 100: 3, 150: 2, 200: 1})
+
+
+class StubChatClient:
+    """Stands in for the OpenAI client, upper-casing the prompt's description."""
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, max_tokens):
+        with self.lock:
+            self.calls += 1
+        original = messages[-1]["content"].split("---")[1].strip()
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=original.upper()))])
+
+
+class RewriteCacheTests(SimpleTestCase):
+    """Checks that rewrites run in parallel, keep their order, and are never paid for twice."""
+
+    def make_scraper(self, client, path):
+        return NPSScraper(llm_client=client, rewrite_cache=RewriteCache(path), llm_requests_per_minute=60000)
+
+    def test_rewrites_are_cached_across_runs(self):
+        texts = [f"description {i}" for i in range(20)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "rewrites.sqlite3")
+
+            first = StubChatClient()
+            self.assertEqual(self.make_scraper(first, path).rewrite_descriptions(texts), [t.upper() for t in texts])
+            self.assertEqual(first.calls, len(texts))
+
+            second = StubChatClient()
+            self.assertEqual(self.make_scraper(second, path).rewrite_descriptions(texts), [t.upper() for t in texts])
+            self.assertEqual(second.calls, 0)
+
+
+class IncrementalSyncTests(TestCase):
+    """Runs sync_things_to_do against a fake catalog that changes between runs."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # Keeps the checkpoint and ContentIndex.append away from the real RECOMMENDER_DATA_DIR
+        settings_override = override_settings(
+            SYNC_CHECKPOINT_PATH=os.path.join(self.tmp.name, "checkpoint.json"),
+            RECOMMENDER_DATA_DIR=self.tmp.name,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.catalog = [
+            {"id": f"thing-{i}", "title": f"Thing {i}", "longDescription": f"about {i}",
+             "latitude": "40.0", "longitude": str(-100.0 - i)}
+            for i in range(5)
+        ]
+        self.fail_at = None
+
+    def fake_get(self, limit=50, start=0):
+        if start == self.fail_at:
+            return [], len(self.catalog)
+        return self.catalog[start:start + limit], len(self.catalog)
+
+    def sync(self, client):
+        scraper = NPSScraper(llm_client=client, rewrite_cache=RewriteCache(":memory:"), llm_requests_per_minute=60000)
+        with mock.patch.object(scraper, "get_things_to_do", self.fake_get):
+            return scraper.sync_things_to_do(batch_size=2)
+
+    def test_only_changed_items_are_rewritten(self):
+        first = StubChatClient()
+        self.assertEqual(self.sync(first)["inserted"], 5)
+        self.assertEqual(first.calls, 5)
+
+        self.catalog[1]["longDescription"] = "new text"
+        second = StubChatClient()
+        stats = self.sync(second)
+        self.assertEqual((stats["updated"], stats["unchanged"]), (1, 4))
+        self.assertEqual(second.calls, 1)
+        self.assertEqual(NPSThingToDo.objects.get(nps_id="thing-1").description, "NEW TEXT")
+
+    def test_disappeared_items_fail_qc(self):
+        submitted = NPSThingToDo.objects.create(nps_id=None, title="User submitted", passes_qc=True)
+        self.sync(StubChatClient())
+        missing = self.catalog.pop(3)
+        self.assertEqual(self.sync(StubChatClient())["disappeared"], 1)
+        self.assertFalse(NPSThingToDo.objects.get(nps_id="thing-3").passes_qc)
+        self.assertIsNotNone(NPSThingToDo.objects.get(nps_id="thing-3").disappeared_at)
+        self.assertEqual(NPSThingToDo.objects.filter(nps_id__isnull=False, passes_qc=True).count(), 4)
+        submitted.refresh_from_db()
+        self.assertTrue(submitted.passes_qc)
+
+        # An unchanged item that comes back passes QC again without a rewrite
+        self.catalog.insert(3, missing)
+        client = StubChatClient()
+        stats = self.sync(client)
+        self.assertEqual((stats["unchanged"], stats["disappeared"], client.calls), (5, 0, 0))
+        self.assertTrue(NPSThingToDo.objects.get(nps_id="thing-3").passes_qc)
+        self.assertIsNone(NPSThingToDo.objects.get(nps_id="thing-3").disappeared_at)
+
+    def test_sync_keeps_qc_rejections(self):
+        self.sync(StubChatClient())
+        NPSThingToDo.objects.filter(nps_id__in=["thing-1", "thing-2"]).update(passes_qc=False)
+
+        # Neither an unchanged nor a changed item is re-enabled by the next sync
+        self.catalog[2]["longDescription"] = "new text"
+        stats = self.sync(StubChatClient())
+        self.assertEqual((stats["updated"], stats["unchanged"], stats["disappeared"]), (1, 4, 0))
+        self.assertEqual(
+            set(NPSThingToDo.objects.filter(passes_qc=False).values_list("nps_id", flat=True)), {"thing-1", "thing-2"}
+        )
+
+        # A rejected item that disappears and comes back stays rejected too
+        missing = self.catalog.pop(1)
+        self.assertEqual(self.sync(StubChatClient())["disappeared"], 0)
+        self.catalog.insert(1, missing)
+        self.sync(StubChatClient())
+        self.assertFalse(NPSThingToDo.objects.get(nps_id="thing-1").passes_qc)
+
+    def test_interrupted_sync_resumes_from_checkpoint(self):
+        self.fail_at = 2
+        stats = self.sync(StubChatClient())
+        self.assertEqual((stats["inserted"], stats["disappeared"]), (2, 0))
+
+        self.fail_at = None
+        requested = []
+        get = self.fake_get
+        self.fake_get = lambda limit=50, start=0: requested.append(start) or get(limit, start)
+        stats = self.sync(StubChatClient())
+        self.assertEqual(requested, [2, 4])
+        self.assertEqual((stats["inserted"], stats["disappeared"]), (3, 0))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "checkpoint.json")))
+
+
+class AuthenticationCacheTests(TestCase):
+    """Repeat calls with the same token should skip both signature checks and the user lookup."""
+
+    def setUp(self):
+        verified_tokens.clear()
+        user_ids.clear()
+        self.user = CustomUser.objects.create(username="cached", firebase_id="uid-1")
+
+    def test_verified_tokens_are_reused_until_exp(self):
+        decoded = {"uid": "uid-1", "exp": time.time() + 3600}
+        with mock.patch("firebase_admin._apps", {"[DEFAULT]": object()}), \
+                mock.patch("firebase_admin.auth.verify_id_token", return_value=decoded) as verify:
+            self.assertEqual(verify_id_token("token"), decoded)
+            self.assertEqual(verify_id_token("token"), decoded)
+            self.assertEqual(verify.call_count, 1)
+
+            expired = {"uid": "uid-1", "exp": time.time() - 1}
+            verify.return_value = expired
+            verify_id_token("expired")
+            verify_id_token("expired")
+            self.assertEqual(verify.call_count, 3)
+
+    def test_user_ids_are_resolved_once(self):
+        self.assertEqual(resolve_user_id("uid-1"), (self.user.id, False))
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_user_id("uid-1"), (self.user.id, False))
+        self.assertEqual(resolve_user_id("missing"), (None, False))
+
+        self.user.delete()
+        self.assertEqual(resolve_user_id("uid-1"), (None, False))
+
+
+class ActivityListTests(TestCase):
+    """User activity lists should cost the same number of queries however long they are."""
+
+    def setUp(self):
+        user_ids.clear()
+        self.user = CustomUser.objects.create(username="lister", firebase_id="uid-lists")
+        self.activities = NPSThingToDo.objects.bulk_create(
+            [NPSThingToDo(nps_id=f"list-{i}", title=f"List {i}", description="long text") for i in range(12)]
+        )
+        self.user.saved_activities.add(*self.activities)
+        self.user.thumbs_up.add(self.activities[0])
+        # Direct m2m writes bypass the counters, so recount them as the periodic job would
+        call_command("reconcile_activity_counts", stdout=io.StringIO())
+        patcher = mock.patch("fun_things.core.authentication.verify_id_token", return_value={"uid": "uid-lists"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_favorites(self, **params):
+        response = self.client.get("/core/get-user-favorites/", params, HTTP_AUTHORIZATION="Bearer token")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_counts_come_from_one_query(self):
+        self.get_favorites()  # Resolves and caches the user id
+        with self.assertNumQueries(1):
+            favorites = self.get_favorites()["favorites"]
+        self.assertEqual(len(favorites), 12)
+        counts = {f["id"]: (f["favorites_count"], f["thumbs_up_count"], f["thumbs_down_count"]) for f in favorites}
+        self.assertEqual(counts[self.activities[0].id], (1, 1, 0))
+        self.assertEqual(counts[self.activities[1].id], (1, 0, 0))
+
+    def test_cursor_pages_cover_the_list_once(self):
+        self.get_favorites()
+        seen = []
+        params = {"limit": 5, "view": "card"}
+        while True:
+            with self.assertNumQueries(1):
+                page = self.get_favorites(**params)
+            self.assertTrue(all("description" not in f for f in page["favorites"]))
+            seen.extend(f["id"] for f in page["favorites"])
+            if page["next_cursor"] is None:
+                break
+            params["cursor"] = page["next_cursor"]
+        self.assertEqual(seen, sorted((a.id for a in self.activities), reverse=True))
+
+
+class ActivityCounterTests(TestCase):
+    """update_preference keeps the counter columns equal to the m2m rows."""
+
+    def setUp(self):
+        user_ids.clear()
+        self.user = CustomUser.objects.create(username="voter", firebase_id="uid-votes")
+        self.activity = NPSThingToDo.objects.create(nps_id="counted", title="Counted")
+        patcher = mock.patch("fun_things.core.authentication.verify_id_token", return_value={"uid": "uid-votes"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def act(self, action):
+        response = self.client.post(
+            "/core/update-preference/", {"activity_id": self.activity.id, "action": action},
+            content_type="application/json", HTTP_AUTHORIZATION="Bearer token",
+        )
+        self.assertEqual(response.status_code, 200)
+        activity = response.json()["activity"]
+        return activity["favorites_count"], activity["thumbs_up_count"], activity["thumbs_down_count"]
+
+    def test_counters_follow_preferences(self):
+        self.assertEqual(self.act("upvote"), (0, 1, 0))
+        self.assertEqual(self.act("upvote"), (0, 1, 0))
+        self.assertEqual(self.act("downvote"), (0, 0, 1))
+        self.assertEqual(self.act("favorite"), (1, 0, 1))
+        self.assertEqual(self.act("favorite"), (0, 0, 1))
+
+    def test_counter_drifted_to_zero_stays_at_zero(self):
+        # Direct m2m write: the row exists but its counter was never incremented
+        self.user.thumbs_up.add(self.activity)
+        self.assertEqual(self.act("downvote"), (0, 0, 1))
+
+    def test_reconcile_fixes_drift(self):
+        self.user.thumbs_up.add(self.activity)
+        NPSThingToDo.objects.filter(id=self.activity.id).update(favorites_count=7)
+        out = io.StringIO()
+        call_command("reconcile_activity_counts", stdout=out)
+        self.assertIn("Fixed 1 activities", out.getvalue())
+        self.activity.refresh_from_db()
+        self.assertEqual(
+            (self.activity.favorites_count, self.activity.thumbs_up_count, self.activity.thumbs_down_count), (0, 1, 0)
+        )
+
+    def test_batch_applies_last_write_per_activity(self):
+        other = NPSThingToDo.objects.create(nps_id="counted-2", title="Counted 2")
+        self.user.thumbs_down.add(other)
+        NPSThingToDo.objects.filter(id=other.id).update(thumbs_down_count=1)
+        operations = [
+            {"activity_id": self.activity.id, "action": "upvote"},
+            {"activity_id": self.activity.id, "action": "favorite"},
+            {"activity_id": self.activity.id, "action": "downvote"},
+            {"activity_id": other.id, "action": "favorite"},
+            {"activity_id": other.id, "action": "favorite"},
+            {"activity_id": other.id, "action": "upvote"},
+        ]
+        response = self.client.post(
+            "/core/update-preferences/", {"operations": operations},
+            content_type="application/json", HTTP_AUTHORIZATION="Bearer token",
+        )
+        self.assertEqual(response.status_code, 200)
+        results = {r["activity_id"]: r for r in response.json()["results"]}
+        self.assertEqual((results[self.activity.id]["favorited"], results[self.activity.id]["vote"]), (True, "down"))
+        self.assertEqual((results[other.id]["favorited"], results[other.id]["vote"]), (False, "up"))
+        self.assertEqual(results[other.id]["activity"]["thumbs_up_count"], 1)
+        self.assertEqual(results[other.id]["activity"]["thumbs_down_count"], 0)
+        self.assertEqual(set(self.user.thumbs_down.values_list("id", flat=True)), {self.activity.id})
+        self.assertEqual(set(self.user.thumbs_up.values_list("id", flat=True)), {other.id})
+
+        out = io.StringIO()
+        call_command("reconcile_activity_counts", "--dry-run", stdout=out)
+        self.assertIn("Found 0 activities", out.getvalue())
+
+    def test_batch_with_unknown_activity_changes_nothing(self):
+        response = self.client.post(
+            "/core/update-preferences/",
+            {"operations": [{"activity_id": self.activity.id, "action": "upvote"}, {"activity_id": 10 ** 9, "action": "upvote"}]},
+            content_type="application/json", HTTP_AUTHORIZATION="Bearer token",
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(self.user.thumbs_up.exists())
+
+
+class InteractionEventTests(TestCase):
+    """Events are buffered in memory and written in batches."""
+
+    def test_flush_writes_batches_and_overflow_drops_oldest(self):
+        buffer = EventBuffer(flush_size=2, flush_interval=None, max_buffer=3)
+        buffer.record(InteractionEvent.IMPRESSION, None, [1, 2])
+        buffer.record(InteractionEvent.SKIP, 7, [3, 4])
+        self.assertEqual(len(buffer), 3)
+        self.assertFalse(InteractionEvent.objects.exists())
+
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(
+            list(InteractionEvent.objects.order_by("id").values_list("event_type", "user_id", "activity_id")),
+            [("impression", None, 2), ("skip", 7, 3), ("skip", 7, 4)],
+        )
+
+    def test_failed_flush_is_logged_and_dropped(self):
+        buffer = EventBuffer(flush_size=10, flush_interval=None)
+        buffer.record(InteractionEvent.IMPRESSION, None, [1, 2])
+        with mock.patch.object(InteractionEvent.objects, "bulk_create", side_effect=RuntimeError("db down")), \
+                self.assertLogs("fun_things.core.events", "ERROR") as logs:
+            self.assertEqual(buffer.flush(), 0)
+        self.assertIn("Failed to write 2 interaction events", logs.output[0])
+        self.assertEqual(len(buffer), 0)
+
+    def test_impressions_reach_the_shared_buffer_without_a_writer_thread(self):
+        activity = NPSThingToDo.objects.create(
+            nps_id="impressed", title="Impressed", location=Point(-100.0, 40.0, srid=4326), passes_qc=True
+        )
+        interaction_event_buffer.flush()
+        response = self.client.get("/core/get-activity/", {"latitude": 40.0, "longitude": -100.0})
+        self.assertEqual(response.json()["id"], activity.id)
+
+        self.assertIsNone(interaction_event_buffer._thread)
+        self.assertFalse(InteractionEvent.objects.filter(activity_id=activity.id).exists())
+        interaction_event_buffer.flush()
+        self.assertEqual(
+            list(InteractionEvent.objects.filter(activity_id=activity.id).values_list("event_type", "user_id")),
+            [("impression", None)],
+        )
+
+    def test_preference_changes_are_recorded_on_commit(self):
+        user = CustomUser.objects.create(username="eventful", firebase_id="uid-events")
+        activity = NPSThingToDo.objects.create(nps_id="evented", title="Evented")
+        user.thumbs_down.add(activity)
+        with mock.patch("fun_things.core.preferences.record_events") as record_events:
+            with self.captureOnCommitCallbacks(execute=True):
+                apply_preferences(user, [
+                    {"activity_id": activity.id, "action": "favorite"},
+                    {"activity_id": activity.id, "action": "upvote"},
+                ])
+        self.assertEqual(
+            sorted(call.args for call in record_events.call_args_list),
+            [("favorite", user.id, [activity.id]), ("upvote", user.id, [activity.id])],
+        )
+
+
+class ActivityDetailsCacheTests(TestCase):
+    """Activity details are served from cached bytes and revalidated with their ETag."""
+
+    def setUp(self):
+        activity_details.clear()
+        self.activity = NPSThingToDo.objects.create(nps_id="detailed", title="Detailed")
+        self.url = f"/core/get-activity-details/{self.activity.id}/"
+
+    def test_repeat_views_skip_the_database(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()["title"], "Detailed")
+        self.assertIn("max-age=", first["Cache-Control"])
+        self.assertIn("Last-Modified", first)
+
+        with self.assertNumQueries(0):
+            again = self.client.get(self.url)
+            revalidated = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.content, first.content)
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.content, b"")
+
+    def test_save_invalidates_cached_details(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.activity.title = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.activity.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["title"], "Renamed")
+
+
+class FastRenderingTests(TestCase):
+    """The plain-function renderers must produce exactly what the DRF serializers do."""
+
+    def setUp(self):
+        NPSThingToDo.objects.bulk_create([
+            NPSThingToDo(
+                nps_id="golden-1", title="Café “Rim” Walk", description="Views <b>&</b> ünïcode\n",
+                url="https://www.nps.gov/thingstodo/rim.htm", image_url="https://www.nps.gov/rim.jpg",
+                location=Point(-112.1129, 36.0544), favorites_count=3, thumbs_up_count=2, thumbs_down_count=1,
+            ),
+            NPSThingToDo(nps_id="golden-2", title="No location", description=None, url=None, image_url=None),
+            NPSThingToDo(nps_id="golden-3", title="", description="", location=Point(0, 0)),
+        ])
+        self.queryset = NPSThingToDo.objects.order_by("id")
+
+    def test_instances_render_byte_identically(self):
+        for activity in self.queryset:
+            self.assertEqual(orjson.dumps(render_activity(activity)), orjson.dumps(NPSThingToDoSerializer(activity).data))
+            self.assertEqual(
+                orjson.dumps(render_activity_card(activity)), orjson.dumps(NPSThingToDoCardSerializer(activity).data)
+            )
+
+    def test_rows_render_byte_identically(self):
+        activities = list(self.queryset)
+        self.assertEqual(
+            orjson.dumps(render_activity_rows(self.queryset)),
+            orjson.dumps(NPSThingToDoSerializer(activities, many=True).data),
+        )
+        self.assertEqual(
+            orjson.dumps(render_activity_rows(self.queryset, card=True)),
+            orjson.dumps(NPSThingToDoCardSerializer(activities, many=True).data),
+        )
+
+    def test_encoders_agree_on_the_document(self):
+        # orjson writes compact UTF-8 where the stdlib adds spaces and \u escapes; the parsed JSON must match
+        activities = list(self.queryset)
+        stdlib = JsonResponse(NPSThingToDoSerializer(activities, many=True).data, safe=False).content
+        self.assertEqual(orjson.loads(orjson.dumps([render_activity(a) for a in activities])), orjson.loads(stdlib))
+
+
+class AsyncViewTests(TestCase):
+    """Async views verify tokens in a worker thread and read through the async ORM."""
+
+    def setUp(self):
+        verified_tokens.clear()
+        user_ids.clear()
+        self.user = CustomUser.objects.create(username="async", firebase_id="uid-async")
+        self.activity = NPSThingToDo.objects.create(nps_id="async-1", title="Async")
+        self.user.saved_activities.add(self.activity)
+
+    async def test_token_verification_runs_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        verified_in = []
+
+        def verify(token):
+            verified_in.append(threading.get_ident())
+            return {"uid": "uid-async"}
+
+        with mock.patch("fun_things.core.authentication.verify_id_token", side_effect=verify):
+            response = await self.async_client.get(
+                "/core/get-user-favorites/", {"view": "card"}, headers={"Authorization": "Bearer token"}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([f["id"] for f in response.json()["favorites"]], [self.activity.id])
+        self.assertEqual(len(verified_in), 1)
+        self.assertNotEqual(verified_in[0], loop_thread)
+
+    async def test_missing_token_is_rejected(self):
+        response = await self.async_client.post("/core/update-preference/", {}, content_type="application/json")
+        self.assertEqual(response.status_code, 401)
+
+
+class KDTreeTests(SimpleTestCase):
+    """query_radius must return exactly the points a brute-force haversine scan finds."""
+
+    def test_query_radius_matches_brute_force(self):
+        rng = random.Random(1)
+        locations = [(rng.uniform(-89, 89), rng.uniform(-180, 180)) for _ in range(2000)]
+        # Clusters make many points sit near the split planes
+        locations += [(44.4 + rng.gauss(0, 0.5), -110.6 + rng.gauss(0, 0.5)) for _ in range(500)]
+        tree = KDTree(list(range(len(locations))), [to_unit_vector(lat, lon) for lat, lon in locations])
+        self.assertEqual(len(tree), len(locations))
+
+        for latitude, longitude, meters in [(44.4, -110.6, 50_000), (0, 179.9, 1_000_000), (-89, 0, 3_000_000)]:
+            found = dict(tree.query_radius(to_unit_vector(latitude, longitude), chord_for_distance(meters)))
+            expected = {
+                i for i, (lat, lon) in enumerate(locations)
+                if haversine(latitude, longitude, lat, lon) <= meters * (1 - 1e-9)
+            }
+            self.assertLessEqual(expected, set(found))
+            for i, chord in found.items():
+                distance = haversine(latitude, longitude, *locations[i])
+                self.assertLessEqual(distance, meters * (1 + 1e-9))
+                self.assertAlmostEqual(distance_for_chord(chord), distance, places=3)
+
+    def test_empty_tree(self):
+        self.assertEqual(KDTree([], []).query_radius(to_unit_vector(0, 0), 1.0), [])
+
+
+class EligibleIdCacheTests(TestCase):
+    """The id array tracks QC'd activities through add/discard and model signals."""
+
+    def setUp(self):
+        self.activities = [
+            NPSThingToDo.objects.create(nps_id=f"eligible-{i}", title=f"Eligible {i}", passes_qc=i % 4 != 0)
+            for i in range(12)
+        ]
+        self.qc_ids = {a.id for a in self.activities if a.passes_qc}
+
+    def test_add_discard_and_sample(self):
+        cache = EligibleIdCache()
+        self.assertEqual(len(cache), len(self.qc_ids))
+        sample = cache.sample(5)
+        self.assertEqual(len(set(sample)), 5)
+        self.assertLessEqual(set(sample), self.qc_ids)
+        self.assertEqual(set(cache.sample(100)), self.qc_ids)
+
+        removed = sorted(self.qc_ids)[0]
+        cache.discard(removed)
+        cache.discard(removed)
+        cache.add(10 ** 9)
+        cache.add(10 ** 9)
+        self.assertEqual(set(cache.sample(100)), self.qc_ids - {removed} | {10 ** 9})
+
+    def test_save_updates_shared_cache(self):
+        eligible_ids.invalidate()
+        self.assertEqual(set(eligible_ids.sample(100)), self.qc_ids)
+
+        failed, passed = self.activities[1], self.activities[0]
+        failed.passes_qc = False
+        failed.save()
+        passed.passes_qc = True
+        passed.save()
+        self.assertEqual(set(eligible_ids.sample(100)), self.qc_ids - {failed.id} | {passed.id})
+
+        passed_id = passed.id
+        passed.delete()
+        self.assertNotIn(passed_id, eligible_ids.sample(100))
+
+
+class GumbelTopKTests(SimpleTestCase):
+    """gumbel_top_k draws distinct ids, favouring the heavier weights."""
+
+    def test_draws_are_distinct(self):
+        ids = list(range(20))
+        for k in (1, 5, 20, 50):
+            drawn = gumbel_top_k(ids, [0.0] * len(ids), k)
+            self.assertEqual(len(drawn), min(k, len(ids)))
+            self.assertEqual(len(set(drawn)), len(drawn))
+            self.assertLessEqual(set(drawn), set(ids))
+
+    def test_draws_follow_the_weights(self):
+        random.seed(4)
+        # Id 0 carries 8x the weight of each other id, so it is first ~8/11 of the time
+        log_weights = [math.log(8), 0.0, 0.0, 0.0]
+        firsts = Counter(gumbel_top_k(range(4), log_weights, 1)[0] for _ in range(4000))
+        self.assertAlmostEqual(firsts[0] / 4000, 8 / 11, delta=0.03)
+        self.assertGreater(min(firsts[i] for i in (1, 2, 3)), 0)
+
+
+class ActivityBatchTests(TestCase):
+    """?count= returns a queue of distinct recommendations, clamped to MAX_ACTIVITY_BATCH."""
+
+    def setUp(self):
+        for i in range(MAX_ACTIVITY_BATCH + 10):
+            NPSThingToDo.objects.create(
+                nps_id=f"batch-{i}",
+                title=f"Batch {i}",
+                location=Point(-100.0, 40.0 + i * 0.01, srid=4326),
+                passes_qc=True,
+            )
+
+    def get_activities(self, count):
+        response = self.client.get("/core/get-activity/", {"latitude": 40.0, "longitude": -100.0, "count": count})
+        self.assertEqual(response.status_code, 200)
+        return [activity["id"] for activity in response.json()["activities"]]
+
+    def test_count_is_clamped(self):
+        self.assertEqual(len(self.get_activities(5)), 5)
+        self.assertEqual(len(self.get_activities(0)), 1)
+        self.assertEqual(len(self.get_activities(-3)), 1)
+        activities = self.get_activities(1000)
+        self.assertEqual(len(activities), MAX_ACTIVITY_BATCH)
+        self.assertEqual(len(set(activities)), MAX_ACTIVITY_BATCH)
+
+
+@override_settings(ACTIVITY_RECOMMENDER="fun_things.core.recommenders.CollaborativeRecommender")
+class CollaborativeViewTests(TestCase):
+    """get_activity hands the signed-in user to personalised recommenders."""
+
+    def setUp(self):
+        user_ids.clear()
+        verified_tokens.clear()
+        ActivityIndex.invalidate()
+        self.activities = [
+            NPSThingToDo.objects.create(
+                nps_id=f"collab-{i}",
+                title=f"Collab {i}",
+                location=Point(-100.0, 40.0, srid=4326),
+                passes_qc=True,
+            )
+            for i in range(8)
+        ]
+        self.liked, self.neighbor = self.activities[:2]
+        self.user = CustomUser.objects.create(username="collab", firebase_id="uid-collab")
+        self.user.thumbs_up.add(self.liked)
+        other = CustomUser.objects.create(username="collab-other", firebase_id="uid-collab-other")
+        other.thumbs_up.add(self.liked, self.neighbor)
+        self.neighbors = compute_item_neighbors(*build_interaction_matrix(), top_n=10)
+
+    def test_neighbor_of_liked_item_ranks_higher(self):
+        shown = Counter()
+        with mock.patch("fun_things.core.authentication.verify_id_token", return_value={"uid": "uid-collab"}), \
+                mock.patch("fun_things.core.recommenders.get_item_neighbors", return_value=self.neighbors):
+            for _ in range(300):
+                response = self.client.get(
+                    "/core/get-activity/",
+                    {"latitude": 40.0, "longitude": -100.0},
+                    headers={"Authorization": "Bearer token"},
+                )
+                shown[response.json()["id"]] += 1
+                user_exclusions.get(self.user.id).clear_impressions()
+
+        # The neighbour carries ~exp(BETA / sqrt(2)) = 4x the weight of the unrelated items
+        others = [shown[activity.id] for activity in self.activities[2:]]
+        self.assertGreater(shown[self.neighbor.id], 2 * max(others))
+
+
+class ExclusionTests(TestCase):
+    """Downvotes and recent impressions are skipped via compact per-user sets."""
+
+    def test_id_bitmap_membership_and_iteration(self):
+        # A sparse container, one past ARRAY_LIMIT (stored as a bitmap) and a far-off id
+        ids = {3, 70000} | set(range(1 << 16, (1 << 16) + IdBitmap.ARRAY_LIMIT + 1)) | {5 << 32}
+        bitmap = IdBitmap(sorted(ids, reverse=True))
+        self.assertEqual(len(bitmap), len(ids))
+        self.assertEqual(list(bitmap), sorted(ids))
+        self.assertIn(70000, bitmap)
+        self.assertNotIn(4, bitmap)
+        self.assertNotIn((1 << 16) + IdBitmap.ARRAY_LIMIT + 1, bitmap)
+
+        for value in (3, 70000, 5 << 32):
+            bitmap.discard(value)
+            bitmap.discard(value)
+            self.assertNotIn(value, bitmap)
+        bitmap.add(3)
+        bitmap.add(3)
+        self.assertEqual(len(bitmap), len(ids) - 2)
+
+    def test_user_exclusions(self):
+        exclusions = UserExclusions(downvoted=[1, 2], max_impressions=3)
+        exclusions.record_impressions([2, 3, 4])
+        exclusions.record_impressions([3, 5, 6])
+        self.assertEqual(list(exclusions.recent), [3, 5, 6])
+        self.assertEqual(list(exclusions), [1, 2, 3, 5, 6])
+        self.assertIn(1, exclusions)
+        self.assertNotIn(4, exclusions)
+
+        exclusions.clear_impressions()
+        self.assertEqual(list(exclusions), [1, 2])
+        self.assertEqual(len(exclusions), 2)
+
+    def test_random_sample_skips_exclusions(self):
+        activities = [
+            NPSThingToDo.objects.create(nps_id=f"random-{i}", title=f"Random {i}", passes_qc=True)
+            for i in range(20)
+        ]
+        eligible_ids.invalidate()
+        allowed = {activity.id for activity in activities[:3]}
+        exclude = UserExclusions(downvoted=[activity.id for activity in activities[3:]])
+        for _ in range(20):
+            sampled = RandomRecommender()._sample(2, exclude)
+            self.assertEqual(len(set(sampled)), 2)
+            self.assertLessEqual(set(sampled), allowed)
+        self.assertEqual(set(RandomRecommender()._sample(10, exclude)), allowed)
+
+    def test_get_activity_skips_downvotes_and_recent_impressions(self):
+        user_ids.clear()
+        verified_tokens.clear()
+        activities = [
+            NPSThingToDo.objects.create(
+                nps_id=f"excluded-{i}",
+                title=f"Excluded {i}",
+                location=Point(-100.0, 40.0, srid=4326),
+                passes_qc=True,
+            )
+            for i in range(3)
+        ]
+        user = CustomUser.objects.create(username="excluded", firebase_id="uid-excluded")
+        user.thumbs_down.add(activities[0])
+
+        def get_activity():
+            response = self.client.get(
+                "/core/get-activity/", {"latitude": 40.0, "longitude": -100.0},
+                headers={"Authorization": "Bearer token"},
+            )
+            return response.json()["id"]
+
+        with mock.patch("fun_things.core.authentication.verify_id_token", return_value={"uid": "uid-excluded"}):
+            shown = [get_activity(), get_activity()]
+            self.assertEqual(set(shown), {activities[1].id, activities[2].id})
+            # Everything nearby has been shown, so impressions reset but the downvote holds
+            self.assertIn(get_activity(), shown)
+
+
+class TileCacheTests(TestCase):
+    """Geohash cells key the tile cache, and changes drop every cell they could affect."""
+
+    def setUp(self):
+        tile_candidates.clear()
+
+    def cache(self, latitude, longitude):
+        cell = geohash(latitude, longitude, TileCachedDistanceRecommender.GEOHASH_PRECISION)
+        tile_candidates.set(cell, TileCandidates(cell, [], []))
+        return cell
+
+    def test_geohash_encodes_and_bounds_cells(self):
+        self.assertEqual(geohash(57.64911, 10.40744, 11), "u4pruydqqvj")
+        self.assertEqual(geohash(57.64911, 10.40744, 5), "u4pru")
+        for latitude, longitude in [(57.64911, 10.40744), (-33.8688, 151.2093), (0.0, 0.0), (89.9, -179.9)]:
+            for precision in (1, 5, 9):
+                min_lat, min_lon, max_lat, max_lon = geohash_bounds(geohash(latitude, longitude, precision))
+                self.assertTrue(min_lat <= latitude <= max_lat and min_lon <= longitude <= max_lon)
+
+    def test_invalidate_near_drops_only_cells_in_reach(self):
+        radius = TileCachedDistanceRecommender.influence_radius()
+        near, far = self.cache(40.0, -100.0), self.cache(-33.8688, 151.2093)
+        tile_candidates.invalidate_near(41.0, -101.0, radius)
+        self.assertIsNone(tile_candidates.get(near))
+        self.assertIsNotNone(tile_candidates.get(far))
+
+    def test_moving_an_activity_invalidates_old_and_new_cells(self):
+        activity = NPSThingToDo.objects.create(
+            nps_id="moving", title="Moving", location=Point(-100.0, 40.0, srid=4326), passes_qc=True
+        )
+        old, new, unrelated = self.cache(40.0, -100.0), self.cache(-33.8688, 151.2093), self.cache(50.0, 10.0)
+
+        activity = NPSThingToDo.objects.get(id=activity.id)
+        activity.location = Point(151.2093, -33.8688, srid=4326)
+        activity.save()
+        self.assertIsNone(tile_candidates.get(old))
+        self.assertIsNone(tile_candidates.get(new))
+        self.assertIsNotNone(tile_candidates.get(unrelated))
+
+
+class MetricsTests(TestCase):
+    """Recommender metrics render as Prometheus text and count nested calls once."""
+
+    def test_render_histogram_and_counter(self):
+        histogram = metrics.Histogram("test_seconds", "Test histogram.", ("method",), (0.1, 1.0))
+        histogram.observe(0.05, "recommend")
+        histogram.observe(0.5, "recommend")
+        histogram.observe(5.0, "recommend")
+        counter = metrics.Counter("test_total", "Test counter.", ("cache", "result"))
+        counter.inc("tiles", "hit")
+        counter.inc("tiles", "hit", amount=2)
+
+        self.assertEqual(histogram.render(), [
+            "# HELP test_seconds Test histogram.",
+            "# TYPE test_seconds histogram",
+            'test_seconds_bucket{method="recommend",le="0.1"} 1',
+            'test_seconds_bucket{method="recommend",le="1.0"} 2',
+            'test_seconds_bucket{method="recommend",le="+Inf"} 3',
+            'test_seconds_sum{method="recommend"} 5.55',
+            'test_seconds_count{method="recommend"} 3',
+        ])
+        self.assertEqual(counter.render(), [
+            "# HELP test_total Test counter.",
+            "# TYPE test_total counter",
+            'test_total{cache="tiles",result="hit"} 3',
+        ])
+
+        rendered = self.client.get("/core/metrics/").content.decode()
+        for metric in metrics.METRICS:
+            self.assertIn(f"# TYPE {metric.name} ", rendered)
+
+    def test_nested_calls_are_recorded_once(self):
+        class MetricsInnerRecommender(BaseRecommender):
+            def recommend(self):
+                record_candidates(7)
+                return NPSThingToDo.objects.first()
+
+        class MetricsOuterRecommender(MetricsInnerRecommender):
+            def recommend(self):
+                NPSThingToDo.objects.exists()
+                return super().recommend()
+
+        MetricsOuterRecommender().recommend()
+        key = ("MetricsOuterRecommender", "recommend")
+        self.assertEqual(metrics.call_duration._series[key][-1], 1)
+        self.assertEqual(metrics.query_count._series[key][-2], 2)
+        self.assertEqual(metrics.candidate_count._series[key][-2], 7)
+        self.assertNotIn(("MetricsInnerRecommender", "recommend"), metrics.call_duration._series)
+
+
+class CreateActivityTests(TestCase):
+    """User submissions have no NPS id, so they are stored with a NULL nps_id."""
+
+    def test_users_can_submit_several_activities(self):
+        user_ids.clear()
+        verified_tokens.clear()
+        user = CustomUser.objects.create(username="submitter", firebase_id="uid-submitter")
+
+        with mock.patch("fun_things.core.authentication.verify_id_token", return_value={"uid": "uid-submitter"}):
+            for title in ("Picnic spot", "Swimming hole"):
+                response = self.client.post(
+                    "/core/create-activity/", {"title": title, "description": "Found it myself"},
+                    content_type="application/json", headers={"Authorization": "Bearer token"},
+                )
+                self.assertEqual(response.status_code, 201)
+
+        submitted = user.submitted_activities.order_by("id")
+        self.assertEqual([activity.title for activity in submitted], ["Picnic spot", "Swimming hole"])
+        self.assertEqual([activity.nps_id for activity in submitted], [None, None])
+
+
+class DumpParsingTests(SimpleTestCase):
+    """load_nps_dump streams the item array out of either dump layout and escapes COPY text."""
+
+    items = [{"id": f"dump-{i}", "title": f"Dump {i}", "longDescription": "x" * i} for i in range(30)]
+
+    def parse(self, text):
+        # A tiny read size puts chunk boundaries inside keys, strings and numbers
+        for read_size in (1, 7, 1 << 16):
+            with mock.patch("fun_things.core.management.commands.load_nps_dump.READ_SIZE", read_size):
+                yield list(iter_json_array(io.StringIO(text)))
+
+    def test_bare_array(self):
+        for parsed in self.parse(orjson.dumps(self.items).decode()):
+            self.assertEqual(parsed, self.items)
+        for parsed in self.parse(" [ ] "):
+            self.assertEqual(parsed, [])
+
+    def test_wrapped_object(self):
+        text = orjson.dumps({"total": "30", "limit": 1.5e3, "start": 0, "data": self.items}).decode()
+        for parsed in self.parse(text):
+            self.assertEqual(parsed, self.items)
+
+    def test_skips_arrays_before_the_data_key(self):
+        text = orjson.dumps({
+            "errors": [{"id": "not-an-item"}],
+            "meta": {"data": [1, 2]},
+            "data": self.items,
+            "after": [3],
+        }).decode()
+        for parsed in self.parse(text):
+            self.assertEqual(parsed, self.items)
+        for parsed in self.parse('{"total": 0, "errors": []}'):
+            self.assertEqual(parsed, [])
+
+    def test_copy_value_escapes_text_format(self):
+        self.assertEqual(copy_value(None), "\\N")
+        self.assertEqual(copy_value(1.5), "1.5")
+        self.assertEqual(copy_value("a\\b\tc\nd\re"), "a\\\\b\\tc\\nd\\re")
+        self.assertEqual(copy_value("\\N"), "\\\\N")
+
+    def test_copy_stream_reads_lines_in_any_size(self):
+        lines = [f"{i}\tline {i}\n" for i in range(50)]
+        stream = CopyStream(iter(lines))
+        chunks = []
+        while chunk := stream.read(13):
+            self.assertLessEqual(len(chunk), 13)
+            chunks.append(chunk)
+        self.assertEqual("".join(chunks), "".join(lines))
+
+        stream = CopyStream(iter(lines))
+        self.assertEqual(stream.read(5), lines[0][:5])
+        self.assertEqual(stream.read(), "".join(lines)[5:])
+        self.assertEqual(stream.read(), "")
+
+
+class LoadNPSDumpTests(TestCase):
+    """Dump rows skip the LLM rewrite, so they are stored so the next sync rewrites them."""
+
+    def test_loaded_rows_are_left_for_the_sync_to_rewrite(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "dump.json")
+        with open(path, "wb") as f:
+            f.write(orjson.dumps({"total": 2, "data": [
+                {"id": "dump-1", "title": "One", "longDescription": "first", "latitude": "40", "longitude": "-100"},
+                {"id": "dump-2", "title": "Two", "longDescription": "second\twith\\tabs"},
+            ]}))
+
+        call_command("load_nps_dump", path, stdout=io.StringIO())
+        rows = {activity.nps_id: activity for activity in NPSThingToDo.objects.all()}
+        self.assertEqual(set(rows), {"dump-1", "dump-2"})
+        # clean_description collapses the tab; the backslash survives the COPY escaping
+        self.assertEqual(rows["dump-2"].description, "second with\\tabs")
+        self.assertTrue(all(row.content_hash == UNREWRITTEN_HASH for row in rows.values()))
+
+
+class ContentIndexTests(TestCase):
+    """Precomputed neighbours match a brute-force cosine scan, before and after an append."""
+
+    TOP_K = 3
+    WORDS = [
+        "bear lake hike", "bear river hike", "museum history tour", "art museum tour",
+        "kayak the lake", "river kayak trip", "canyon rim hike", "history walk",
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        settings_override = override_settings(RECOMMENDER_DATA_DIR=self.tmp.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        user_ids.clear()
+        verified_tokens.clear()
+
+        self.activities = [
+            NPSThingToDo.objects.create(
+                nps_id=f"content-{i}", title=words.title(), description=f"A {words} for everyone", passes_qc=True
+            )
+            for i, words in enumerate(self.WORDS)
+        ]
+
+    def assert_matches_brute_force(self, index):
+        activities = [a for a in NPSThingToDo.objects.filter(passes_qc=True).order_by("id")]
+        vectors = vectorize([activity_text(a.title, a.description) for a in activities], index.idf)
+        for row, activity in enumerate(activities):
+            similarities = vectors @ vectors[row]
+            similarities[row] = -float("inf")
+            expected = sorted(similarities.tolist(), reverse=True)[:self.TOP_K]
+            similar = index.similar(activity.id)
+            self.assertNotIn(activity.id, [neighbor_id for neighbor_id, _ in similar])
+            # Compare scores so ties between equally similar activities can't flip the test
+            for (neighbor_id, score), best in zip(similar, expected):
+                self.assertAlmostEqual(score, best, places=5)
+                column = next(i for i, a in enumerate(activities) if a.id == neighbor_id)
+                self.assertAlmostEqual(score, float(similarities[column]), places=5)
+
+    def test_build_and_append_match_brute_force(self):
+        late = self.activities[-2:]
+        NPSThingToDo.objects.filter(id__in=[a.id for a in late]).update(passes_qc=False)
+        self.assertEqual(ContentIndex.build(self.TOP_K, chunk_size=3), len(self.activities) - 2)
+        self.assert_matches_brute_force(get_content_index())
+
+        NPSThingToDo.objects.filter(id__in=[a.id for a in late]).update(passes_qc=True)
+        self.assertEqual(ContentIndex.append([a.id for a in late]), 2)
+        self.assertEqual(ContentIndex.append([a.id for a in late]), 0)
+        index = get_content_index()
+        self.assertEqual(len(index.ids), len(self.activities))
+        self.assert_matches_brute_force(index)
+        self.assertFalse([name for name in os.listdir(self.tmp.name) if name.endswith(".tmp")])
+
+    def test_similar_activities_endpoint(self):
+        ContentIndex.build(self.TOP_K)
+        source, *_ = self.activities
+        similar = [neighbor_id for neighbor_id, _ in get_content_index().similar(source.id)]
+        self.assertEqual(
+            [a.id for a in SimilarActivityRecommender().recommend_many(count=self.TOP_K, activity_id=source.id)],
+            similar,
+        )
+
+        url = f"/core/get-similar-activities/{source.id}/"
+        response = self.client.get(url, {"count": 2})
+        self.assertEqual([a["id"] for a in response.json()["activities"]], similar[:2])
+
+        # Activities that fail QC and the signed-in user's downvotes are left out
+        NPSThingToDo.objects.filter(id=similar[0]).update(passes_qc=False)
+        user = CustomUser.objects.create(username="similar", firebase_id="uid-similar")
+        user.thumbs_down.add(similar[1])
+        with mock.patch("fun_things.core.authentication.verify_id_token", return_value={"uid": "uid-similar"}):
+            response = self.client.get(url, headers={"Authorization": "Bearer token"})
+        self.assertEqual([a["id"] for a in response.json()["activities"]], similar[2:])
+
+        missing = NPSThingToDo.objects.order_by("-id").first().id + 1
+        self.assertEqual(self.client.get(f"/core/get-similar-activities/{missing}/").status_code, 404)
@@ -1,50 +1,182 @@
 import os
-import requests
-import openai
 import re
-from dotenv import load_dotenv
-from tqdm import tqdm
-from django.db.utils import IntegrityError
-from django.contrib.gis.geos import Point
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 import time
 import sys
+import asyncio
+import random
+import threading
+import hashlib
+import json
+from datetime import datetime
+import sqlite3
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
 
-# Load environment variables
-load_dotenv()
-NPS_API_KEY = os.getenv("NPS_API_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+from django.conf import settings
 
-import django
-django.setup()
+# Bump whenever the rewrite prompt or model changes so cached rewrites are redone
+PROMPT_VERSION = 1
+
+class TokenBucket:
+    """Rate limiter allowing ``rate`` calls per second on average with bursts of ``capacity``.
+
+    Callers reserve a token up front; when the bucket is empty the reservation goes into
+    debt and the caller sleeps until its token would have been refilled, so waiters are
+    served in arrival order. Safe to share between threads and coroutines.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return how many seconds to wait before using it."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        time.sleep(self.reserve())
+
+    async def acquire_async(self):
+        await asyncio.sleep(self.reserve())
+
+
+class RewriteCache:
+    """Persistent content-addressed cache of LLM description rewrites, stored in SQLite.
+
+    Keys are the SHA-256 of the prompt version and the original text, so an unchanged
+    description is never sent to the model twice, across runs and processes.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS rewrites (key TEXT PRIMARY KEY, rewritten TEXT NOT NULL)"
+        )
+        self.connection.commit()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(original_text):
+        return hashlib.sha256(f"{PROMPT_VERSION}\0{original_text}".encode()).hexdigest()
+
+    def get(self, original_text):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT rewritten FROM rewrites WHERE key = ?", (self.key(original_text),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, original_text, rewritten):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO rewrites (key, rewritten) VALUES (?, ?)",
+                (self.key(original_text), rewritten),
+            )
+            self.connection.commit()
 
-from fun_things.core.models import NPSThingToDo
 
 class NPSScraper:
     """Scraper to fetch and store 'things to do' from the NPS API."""
 
     BASE_URL = "https://developer.nps.gov/api/v1"
+    REQUESTS_PER_HOUR = 1000  # NPS API key quota
+    MAX_RETRIES = 5
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    BASE_BACKOFF = 1.0  # Seconds
+    MAX_BACKOFF = 60.0
+    REWRITE_WORKERS = 8
+    WRITE_BATCH_SIZE = 500  # Rows per bulk upsert transaction
+    # Fields overwritten when an item's content hash changes; QC status is left alone
+    UPSERT_FIELDS = [
+        "title", "description", "url", "image_url", "location", "content_hash", "last_seen_at", "updated_at",
+    ]
+    # Rows stored before content hashes existed get these refreshed without a new rewrite
+    BACKFILL_FIELDS = ["title", "url", "image_url", "location", "content_hash", "last_seen_at", "updated_at"]
+    LLM_REQUESTS_PER_MINUTE = 60
+
+    def __init__(self, base_url=None, requests_per_hour=REQUESTS_PER_HOUR, burst=10,
+                 llm_client=None, rewrite_cache=None, rewrite_workers=REWRITE_WORKERS,
+                 llm_requests_per_minute=LLM_REQUESTS_PER_MINUTE):
+        self.base_url = base_url or self.BASE_URL
+        self.headers = {"X-Api-Key": os.getenv("NPS_API_KEY")}
+        self.rate_limiter = TokenBucket(requests_per_hour / 3600, burst)
+
+        # Anything exposing chat.completions.create works, e.g. a stub in tests
+        self._llm_client = llm_client
+        self.rewrite_cache = rewrite_cache or RewriteCache(settings.REWRITE_CACHE_PATH)
+        self.rewrite_workers = rewrite_workers
+        self.llm_rate_limiter = TokenBucket(llm_requests_per_minute / 60, rewrite_workers)
+
+        self.existing_hashes = None  # nps_id -> content_hash of stored rows, loaded once per sync
+        self.disappeared_ids = None  # nps_ids mark_disappeared hid, loaded alongside existing_hashes
+        self.sync_started_at = None
+        self.stats = Counter()
+
+    @property
+    def llm_client(self):
+        """The chat-completions client, importing openai on first use."""
+        if self._llm_client is None:
+            import openai
 
-    def __init__(self):
-        self.headers = {"X-Api-Key": NPS_API_KEY}
-        openai.api_key = OPENAI_API_KEY
+            openai.api_key = os.getenv("OPENAI_API_KEY")
+            self._llm_client = openai
+        return self._llm_client
 
     def get_things_to_do(self, limit=50, start=0):
-        """Fetch 'things to do' from the NPS API with pagination support."""
-        url = f"{self.BASE_URL}/thingstodo"
+        """Fetch 'things to do' from the NPS API with pagination support.
+
+        Retries like ``get_things_to_do_async``; returns ([], 0) once retries run out.
+        """
+        import requests
+
+        url = f"{self.base_url}/thingstodo"
         params = {
             "limit": limit,
             "start": start
         }
-        response = requests.get(url, headers=self.headers, params=params)
-        
-        if response.status_code == 200:
-            data = response.json()
-            # Ensure total is converted to int
-            total = int(data.get("total", 0))
-            return data.get("data", []), total
-        else:
-            print(f"Error fetching things to do: {response.status_code} - {response.text}")
-            return [], 0
+
+        for attempt in range(self.MAX_RETRIES + 1):
+            self.rate_limiter.acquire()
+            retry_after = 0.0
+            try:
+                response = requests.get(url, headers=self.headers, params=params, timeout=30)
+            except requests.RequestException as e:
+                print(f"Error fetching things to do (start: {start}): {e}")
+            else:
+                if response.status_code == 200:
+                    data = response.json()
+                    # Ensure total is converted to int
+                    total = int(data.get("total", 0))
+                    return data.get("data", []), total
+                if response.status_code not in self.RETRY_STATUSES:
+                    print(f"Error fetching things to do: {response.status_code} - {response.text}")
+                    return [], 0
+                try:
+                    retry_after = float(response.headers.get("Retry-After", 0))
+                except ValueError:
+                    pass
+                print(f"Retrying start={start} after HTTP {response.status_code}")
+
+            if attempt < self.MAX_RETRIES:
+                backoff = random.uniform(0, min(self.MAX_BACKOFF, self.BASE_BACKOFF * 2 ** attempt))
+                time.sleep(max(backoff, retry_after))
+
+        print(f"Giving up on things to do (start: {start}) after {self.MAX_RETRIES} retries")
+        return [], 0
 
     def clean_description(self, text):
         """Cleans up unwanted characters from descriptions."""
@@ -56,10 +188,14 @@ class NPSScraper:
         return text
 
     def rewrite_description(self, original_text):
-        """Use GPT-4 to improve the description formatting."""
+        """Use GPT-4 to improve the description formatting, reusing cached rewrites."""
         if not original_text:
             return "No description available."
 
+        cached = self.rewrite_cache.get(original_text)
+        if cached is not None:
+            return cached
+
         prompt = f"""
         Here is a description of an activity:
         ---
@@ -76,7 +212,8 @@ class NPSScraper:
         """
 
         try:
-            response = openai.chat.completions.create(
+            self.llm_rate_limiter.acquire()
+            response = self.llm_client.chat.completions.create(
                 model="gpt-4",
                 messages=[
                     {"role": "system", "content": "You are an expert copywriter."},
@@ -84,14 +221,250 @@ class NPSScraper:
                 ],
                 max_tokens=500
             )
-            return response.choices[0].message.content.strip()
+            rewritten = response.choices[0].message.content.strip()
+            self.rewrite_cache.set(original_text, rewritten)
+            return rewritten
         except Exception as e:
             print(f"Error rewriting description: {e}")
             return original_text  # Fallback to original
-        
 
-    def store_things_to_do(self, batch_size=50):
-        """Fetch and store all 'things to do' with pagination support."""
+    def rewrite_descriptions(self, original_texts):
+        """Rewrite many descriptions on a bounded thread pool, preserving order."""
+        with ThreadPoolExecutor(max_workers=self.rewrite_workers) as pool:
+            return list(pool.map(self.rewrite_description, original_texts))
+
+    def parse_location(self, thing):
+        """Convert an NPS item's latitude and longitude to a Point, or None if missing or invalid."""
+        from django.contrib.gis.geos import Point
+
+        latitude = thing.get("latitude")
+        longitude = thing.get("longitude")
+
+        if latitude and longitude:
+            try:
+                return Point(float(longitude), float(latitude))  # Longitude first in GEOS Point
+            except ValueError:
+                print(f"Invalid lat/lon for {thing.get('title')}")
+        return None
+
+    def content_hash(self, thing):
+        """Hash the NPS fields we store so unchanged items can be skipped on later syncs."""
+        fields = {
+            key: thing.get(key)
+            for key in ("id", "title", "longDescription", "url", "latitude", "longitude")
+        }
+        fields["image_url"] = (thing.get("images") or [{}])[0].get("url", "")
+        return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+    def build_activity(self, thing, description):
+        """Build an unsaved NPSThingToDo from an NPS API item."""
+        from fun_things.core.models import NPSThingToDo
+
+        return NPSThingToDo(
+            nps_id=str(thing.get("id")),
+            title=thing.get("title", "Unknown"),
+            description=description,
+            url=thing.get("url", ""),
+            image_url=(thing.get("images") or [{}])[0].get("url", ""),
+            location=self.parse_location(thing),  # Store as PointField
+            passes_qc=True,
+            content_hash=self.content_hash(thing),
+            last_seen_at=self.sync_started_at,
+        )
+
+    def upsert(self, objects, update_fields):
+        """Write objects with bulk_create(update_conflicts=True) in WRITE_BATCH_SIZE transactions."""
+        from fun_things.core.models import NPSThingToDo
+
+        for start in range(0, len(objects), self.WRITE_BATCH_SIZE):
+            with transaction.atomic():
+                NPSThingToDo.objects.bulk_create(
+                    objects[start:start + self.WRITE_BATCH_SIZE],
+                    update_conflicts=True,
+                    unique_fields=["nps_id"],
+                    update_fields=update_fields,
+                )
+
+    def store_page(self, things_to_do):
+        """Upsert one page of 'things to do' from the NPS API.
+
+        Items are compared to the stored content hash: new and changed items get an LLM
+        rewrite and are written in full, unchanged ones only have ``last_seen_at`` bumped.
+        Items an earlier sync marked as disappeared pass QC again; other QC verdicts are kept.
+        Returns the page's inserted/updated/unchanged/skipped counts.
+        """
+        from fun_things.core.content import ContentIndex
+        from fun_things.core.models import NPSThingToDo
+        from fun_things.core.signals import refresh_after_bulk_write
+
+        if self.existing_hashes is None:
+            self.existing_hashes = dict(
+                NPSThingToDo.objects.filter(nps_id__isnull=False).values_list("nps_id", "content_hash")
+            )
+            self.disappeared_ids = set(
+                NPSThingToDo.objects.filter(disappeared_at__isnull=False).values_list("nps_id", flat=True)
+            )
+        if self.sync_started_at is None:
+            self.sync_started_at = timezone.now()
+
+        stats = Counter()
+        seen = set()
+        rewrite_things = []
+        backfill_things = []
+        unchanged_ids = []
+        inserted_ids = set()
+        for thing in things_to_do:
+            thing_id = thing.get("id")
+
+            if not thing_id or str(thing_id) in seen:
+                print(f"Skipping due to missing or repeated ID for {thing.get('title')}")
+                stats["skipped"] += 1
+                continue
+            seen.add(str(thing_id))
+
+            nps_id = str(thing_id)
+            if nps_id not in self.existing_hashes:
+                rewrite_things.append(thing)
+                inserted_ids.add(nps_id)
+                stats["inserted"] += 1
+            elif self.existing_hashes[nps_id] is None:
+                backfill_things.append(thing)
+                stats["updated"] += 1
+            elif self.existing_hashes[nps_id] != self.content_hash(thing):
+                rewrite_things.append(thing)
+                stats["updated"] += 1
+            else:
+                unchanged_ids.append(nps_id)
+                stats["unchanged"] += 1
+
+        # Rewrites are the slow part, so run the whole page's in parallel up front
+        better_descriptions = self.rewrite_descriptions(
+            [thing.get("longDescription", "") for thing in rewrite_things]
+        )
+        rewritten = [
+            self.build_activity(thing, self.clean_description(description))
+            for thing, description in zip(rewrite_things, better_descriptions)
+        ]
+        # Descriptions aren't in BACKFILL_FIELDS, so none is needed here
+        backfilled = [self.build_activity(thing, None) for thing in backfill_things]
+
+        self.upsert(rewritten, self.UPSERT_FIELDS)
+        self.upsert(backfilled, self.BACKFILL_FIELDS)
+        if unchanged_ids:
+            NPSThingToDo.objects.filter(nps_id__in=unchanged_ids).update(last_seen_at=self.sync_started_at)
+        revived_ids = []
+        if seen & self.disappeared_ids:
+            revived = NPSThingToDo.objects.filter(nps_id__in=seen & self.disappeared_ids, disappeared_at__isnull=False)
+            revived_ids = list(revived.values_list("id", flat=True))
+            revived.update(passes_qc=True, disappeared_at=None, updated_at=timezone.now())
+            self.disappeared_ids -= seen
+
+        self.existing_hashes.update((obj.nps_id, obj.content_hash) for obj in rewritten + backfilled)
+        self.stats.update(stats)
+        print(
+            f"Inserted {stats['inserted']}, updated {stats['updated']}, "
+            f"unchanged {stats['unchanged']}, skipped {stats['skipped']}"
+        )
+
+        if rewritten or backfilled or revived_ids:
+            # Bulk writes skip model signals, so refresh derived caches explicitly
+            refresh_after_bulk_write()
+            # Extend the "more like this" vectors without rebuilding the matrix; changed
+            # items keep their old vector until the next full build_content_index
+            new_ids = [obj.id for obj in rewritten if obj.id is not None and obj.nps_id in inserted_ids]
+            ContentIndex.append(new_ids + revived_ids)
+        return stats
+
+    def load_checkpoint(self):
+        """Return the saved incremental sync checkpoint, or None if the last sync finished."""
+        try:
+            with open(settings.SYNC_CHECKPOINT_PATH) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save_checkpoint(self, next_start):
+        """Atomically record the next page to fetch and when this sync started."""
+        path = settings.SYNC_CHECKPOINT_PATH
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"started_at": self.sync_started_at.isoformat(), "next_start": next_start}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def mark_disappeared(self):
+        """Fail QC for NPS items the just-finished sync never saw, so stale rows stop being served.
+
+        ``disappeared_at`` records why, so store_page only revives these rows and never
+        ones QC rejected. User-submitted activities have no nps_id and never come from the
+        API, so they are left alone.
+        """
+        from fun_things.core.models import NPSThingToDo
+        from fun_things.core.signals import refresh_after_bulk_write
+
+        stale = NPSThingToDo.objects.filter(nps_id__isnull=False, passes_qc=True).filter(
+            Q(last_seen_at__isnull=True) | Q(last_seen_at__lt=self.sync_started_at)
+        )
+        now = timezone.now()
+        removed = stale.update(passes_qc=False, disappeared_at=now, updated_at=now)
+        if removed:
+            refresh_after_bulk_write()
+        return removed
+
+    def sync_things_to_do(self, batch_size=50):
+        """Incrementally sync 'things to do', resuming an interrupted run from its checkpoint.
+
+        The checkpoint is written after every stored page. Only once the last page is
+        stored are items missing from the API marked as failing QC and the checkpoint
+        removed; a run that stops early leaves everything else untouched.
+        """
+        self.existing_hashes = None
+        self.stats = Counter()
+
+        checkpoint = self.load_checkpoint()
+        if checkpoint and checkpoint.get("next_start", 0) % batch_size == 0:
+            self.sync_started_at = datetime.fromisoformat(checkpoint["started_at"])
+            start = checkpoint["next_start"]
+            print(f"Resuming sync started at {self.sync_started_at} from {start}")
+        else:
+            self.sync_started_at = timezone.now()
+            start = 0
+
+        total_items = None
+        while total_items is None or start < total_items:
+            print(f'Fetching things to do (start: {start})...')
+            things_to_do, total_items = self.get_things_to_do(limit=batch_size, start=start)
+
+            if not things_to_do:
+                if start < total_items or (start > 0 and not total_items):
+                    # A failed or short page: keep the checkpoint and retry on the next run
+                    print(f"Stopping sync at {start}; rerun to resume")
+                    return self.stats
+                break
+
+            self.store_page(things_to_do)
+            start += batch_size
+            self.save_checkpoint(start)
+
+        if total_items:
+            self.stats["disappeared"] = self.mark_disappeared()
+            print(f"Marked {self.stats['disappeared']} items that disappeared upstream as failing QC")
+        if os.path.exists(settings.SYNC_CHECKPOINT_PATH):
+            os.remove(settings.SYNC_CHECKPOINT_PATH)
+        return self.stats
+
+    def store_things_to_do(self, batch_size=50, concurrency=1):
+        """Fetch and store all 'things to do' with pagination support.
+
+        With ``concurrency`` above 1, pages are fetched in parallel by
+        ``store_things_to_do_async``.
+        """
+        self.existing_hashes = None
+        self.sync_started_at = timezone.now()
+        self.stats = Counter()
+        if concurrency > 1:
+            asyncio.run(self.store_things_to_do_async(batch_size, concurrency))
+            return self.stats
+
         start = 0
         total_items = None
         
@@ -103,54 +476,92 @@ class NPSScraper:
                 break
                 
             print(f'Found {len(things_to_do)} things to do (Total: {total_items})')
+            self.store_page(things_to_do)
+                
+            start += batch_size
 
-            for thing in tqdm(things_to_do, total=len(things_to_do)):
-                thing_id = thing.get("id")
+        return self.stats
 
-                if not thing_id:
-                    print(f"Skipping due to missing ID for {thing.get('title')}")
-                    continue
+    async def get_things_to_do_async(self, client, limit=50, start=0):
+        """Fetch one page of 'things to do', retrying 429s, 5xxs and transport errors.
 
-                if NPSThingToDo.objects.filter(nps_id=str(thing_id)).exists():
-                    print(f"Skipping existing thing to do: {thing.get('title')}")
-                    continue
+        Every attempt waits on the shared token bucket first. Retries back off
+        exponentially with full jitter, and never sooner than a Retry-After header asks.
+        """
+        import httpx
 
-                original_description = thing.get("longDescription", "")
-                better_description = self.rewrite_description(original_description)
-                better_description = self.clean_description(better_description)
+        params = {"limit": limit, "start": start}
 
-                # Convert latitude and longitude to a PointField
-                latitude = thing.get("latitude")
-                longitude = thing.get("longitude")
-                location = None
+        for attempt in range(self.MAX_RETRIES + 1):
+            await self.rate_limiter.acquire_async()
+            retry_after = 0.0
+            try:
+                response = await client.get("/thingstodo", params=params)
+            except httpx.TransportError as e:
+                print(f"Error fetching things to do (start: {start}): {e}")
+            else:
+                if response.status_code == 200:
+                    data = response.json()
+                    return data.get("data", []), int(data.get("total", 0))
+                if response.status_code not in self.RETRY_STATUSES:
+                    print(f"Error fetching things to do: {response.status_code} - {response.text}")
+                    return [], 0
+                try:
+                    retry_after = float(response.headers.get("Retry-After", 0))
+                except ValueError:
+                    pass
+                print(f"Retrying start={start} after HTTP {response.status_code}")
 
-                if latitude and longitude:
-                    try:
-                        latitude = float(latitude)
-                        longitude = float(longitude)
-                        location = Point(longitude, latitude)  # Longitude first in GEOS Point
-                    except ValueError:
-                        print(f"Invalid lat/lon for {thing.get('title')}")
+            if attempt < self.MAX_RETRIES:
+                backoff = random.uniform(0, min(self.MAX_BACKOFF, self.BASE_BACKOFF * 2 ** attempt))
+                await asyncio.sleep(max(backoff, retry_after))
 
-                try:
-                    obj = NPSThingToDo.objects.create(
-                        nps_id=str(thing_id),
-                        title=thing.get("title", "Unknown"),
-                        description=better_description,
-                        url=thing.get("url", ""),
-                        image_url=thing.get("images", [{}])[0].get("url", ""),
-                        location=location,  # Store as PointField
-                        passes_qc=True
-                    )
-                    print(f"Added new thing to do: {thing.get('title')}")
-                except IntegrityError as e:
-                    print(f"Skipped duplicate thing to do: {thing.get('title')} (Error: {e})")
-                
-            start += batch_size
-            
-            # Optional: Add a small delay to be nice to the API
-            time.sleep(1)
+        print(f"Giving up on things to do (start: {start}) after {self.MAX_RETRIES} retries")
+        return [], 0
+
+    async def store_things_to_do_async(self, batch_size=50, concurrency=8, **client_kwargs):
+        """Fetch pages concurrently over one pooled connection and store them as they arrive.
+
+        The first page reveals ``total``; the remaining pages are then requested at once,
+        with at most ``concurrency`` in flight. Storing runs in a worker thread because the
+        ORM is synchronous. ``client_kwargs`` are passed to ``httpx.AsyncClient`` (tests
+        use this to inject a transport).
+        """
+        import httpx
+
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        headers = {name: value for name, value in self.headers.items() if value}
+        async with httpx.AsyncClient(
+            base_url=self.base_url, headers=headers, limits=limits, timeout=30, **client_kwargs
+        ) as client:
+            print('Fetching things to do (start: 0)...')
+            things_to_do, total_items = await self.get_things_to_do_async(client, batch_size, 0)
+            if not things_to_do:
+                return
+            print(f'Found {total_items} things to do, fetching {concurrency} pages at a time')
+            await sync_to_async(self.store_page)(things_to_do)
+
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def fetch(start):
+                async with semaphore:
+                    return await self.get_things_to_do_async(client, batch_size, start)
+
+            tasks = [asyncio.create_task(fetch(start)) for start in range(batch_size, total_items, batch_size)]
+            for task in asyncio.as_completed(tasks):
+                things_to_do, _ = await task
+                if things_to_do:
+                    await sync_to_async(self.store_page)(things_to_do)
 
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+    import django
+
+    load_dotenv()
+    django.setup()
+
     scraper = NPSScraper()
-    scraper.store_things_to_do()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "sync":
+        scraper.sync_things_to_do()
+    else:
+        scraper.store_things_to_do(concurrency=int(sys.argv[1]) if len(sys.argv) > 1 else 1)
\ No newline at end of file
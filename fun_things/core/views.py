@@ -1,142 +1,155 @@
+import hashlib
 import random
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import get_user_model
-import firebase_admin
-from firebase_admin import auth, credentials
 import os
 import json
 
-from fun_things.core.models import NPSThingToDo, CustomUser
+from fun_things.core.models import NPSThingToDo, CustomUser, InteractionEvent
+from fun_things.core.events import record_events
 from fun_things.core.serializers import NPSThingToDoSerializer
-from fun_things.core.recommenders import DistanceRecommender
+from fun_things.core.rendering import FastJsonResponse, arender_activity_rows, encode_json, render_activity
+from fun_things.core.caches import CachedResponse, activity_details, user_exclusions
+from fun_things.core.recommenders import SimilarActivityRecommender
+from fun_things.core.metrics import render_metrics
+from fun_things.core.preferences import PreferenceError, apply_preferences
+from fun_things.core.authentication import (
+    aget_request_user,
+    bearer_token,
+    firebase_user_required,
+    get_request_user,
+    resolve_user_id,
+    verify_id_token,
+)
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 from django.conf import settings
+from django.utils.module_loading import import_string
 import urllib.parse
 
-# get the absolute path of the current file
-dir_path = os.path.dirname(os.path.realpath(__file__))
-FIREBASE_CREDENTIALS_PATH = os.path.join(dir_path, "fun-things-12caf-firebase-adminsdk-fbsvc-abf05155d3.json")
+User = get_user_model()  # Reference CustomUser
 
-# Initialize Firebase Admin SDK (only do this once in your project)
-if not firebase_admin._apps:
-    cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
-    firebase_admin.initialize_app(cred)
+MAX_ACTIVITY_BATCH = 50  # Upper bound on ?count= for get_activity
+MAX_PAGE_SIZE = 100  # Upper bound on ?limit= for paginated lists
+MAX_PREFERENCE_BATCH = 100  # Upper bound on operations per update_preferences call
+MAX_EVENT_BATCH = 100  # Upper bound on events per record_client_events call
+CLIENT_EVENT_TYPES = (InteractionEvent.SKIP,)  # Events only the frontend can observe
+ACTIVITY_DETAILS_MAX_AGE = 60  # Seconds a client may reuse activity details before revalidating
+
+
+async def list_activities(request, queryset):
+    """Renders a user's activity list from one values query, optionally paginated and projected.
+
+    ``?view=card`` drops the description. ``?limit=`` (or a ``?cursor=`` from a previous
+    response) pages through the list newest activity first; without either the whole
+    list is returned, as older clients expect. Returns (data, next_cursor).
+    """
+    card = request.GET.get("view") == "card"
+    queryset = queryset.order_by("-id")
+
+    limit = request.GET.get("limit")
+    cursor = request.GET.get("cursor")
+    next_cursor = None
+    if limit is not None or cursor is not None:
+        limit = min(max(int(limit or MAX_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+        if cursor:
+            queryset = queryset.filter(id__lt=int(cursor))
+        # One extra row tells us whether there is a next page
+        rows = await arender_activity_rows(queryset[:limit + 1], card)
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = str(rows[-1]["id"])
+    else:
+        rows = await arender_activity_rows(queryset, card)
+    return rows, next_cursor
 
-User = get_user_model()  # Reference CustomUser
 
 @csrf_exempt
-def get_user_favorites(request):
+@firebase_user_required
+async def get_user_favorites(request):
     """Returns a list of favorited activities for the authenticated user."""
-    
-    # Get the Authorization header and validate it
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return JsonResponse({"error": "Unauthorized"}, status=401)
-
-    token = auth_header.split("Bearer ")[1]
-
     try:
-        # Verify Firebase token and get user
-        decoded_token = auth.verify_id_token(token)
-        firebase_uid = decoded_token["uid"]
-        user = CustomUser.objects.get(firebase_id=firebase_uid)
-
-        # Ensure `saved_activities` is correctly referenced
-        if hasattr(user, "saved_activities"):
-            favorites_queryset = user.saved_activities.all()
-            favorites_data = NPSThingToDoSerializer(favorites_queryset, many=True).data
-            return JsonResponse({"favorites": favorites_data})
-        else:
-            return JsonResponse({"error": "User has no saved activities"}, status=404)
-
-    except CustomUser.DoesNotExist:
-        return JsonResponse({"error": "User not found"}, status=404)
+        favorites_data, next_cursor = await list_activities(request, request.user.saved_activities.all())
+        return FastJsonResponse({"favorites": favorites_data, "next_cursor": next_cursor})
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
 
 @csrf_exempt
-def get_user_created(request):
+@firebase_user_required
+async def get_user_created(request):
     """Returns a list of created activities for the authenticated user."""
     
     if request.method != "GET":
         return JsonResponse({"error": "Invalid request"}, status=400)
 
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return JsonResponse({"error": "Unauthorized"}, status=401)
-
-    token = auth_header.split("Bearer ")[1]
-
     try:
-        # Authenticate the user
-        decoded_token = auth.verify_id_token(token)
-        firebase_uid = decoded_token["uid"]
-        user = CustomUser.objects.get(firebase_id=firebase_uid)
-
         # Fetch user's created activities
-        created_activities = NPSThingToDoSerializer(user.submitted_activities.all(), many=True).data
+        created_activities, next_cursor = await list_activities(request, request.user.submitted_activities.all())
         
         # ✅ Fix the response key name
-        return JsonResponse({"created_activities": created_activities})
+        return FastJsonResponse({"created_activities": created_activities, "next_cursor": next_cursor})
 
-    except CustomUser.DoesNotExist:
-        return JsonResponse({"error": "User not found"}, status=404)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
 
 
 @csrf_exempt
-def update_preference(request):
+@firebase_user_required
+async def update_preference(request):
     """Updates user preferences for saved activities, thumbs up, or thumbs down."""
     if request.method != "POST":
         return JsonResponse({"error": "Invalid request"}, status=400)
 
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return JsonResponse({"error": "Unauthorized"}, status=401)
-
-    token = auth_header.split("Bearer ")[1]
-
     try:
-        decoded_token = auth.verify_id_token(token)
-        firebase_uid = decoded_token["uid"]
-        user = CustomUser.objects.get(firebase_id=firebase_uid)
-
         data = json.loads(request.body)
-        activity_id = data.get("activity_id")
         action = data.get("action")
+        results = await sync_to_async(apply_preferences)(
+            request.user, [{"activity_id": data.get("activity_id"), "action": action}]
+        )
+        favorited, vote, activity = next(iter(results.values()))
 
-        if not activity_id or action not in ["favorite", "upvote", "downvote"]:
-            return JsonResponse({"error": "Invalid request parameters"}, status=400)
+        if action == "favorite":
+            message = "Activity added to favorites" if favorited else "Activity removed from favorites"
+        else:
+            message = "Activity upvoted" if action == "upvote" else "Activity downvoted"
+        return FastJsonResponse({"message": message, "action": action, "activity": render_activity(activity)})
+    except PreferenceError as e:
+        return JsonResponse({"error": str(e)}, status=e.status)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
-        activity = NPSThingToDo.objects.get(id=activity_id)
+@csrf_exempt
+@firebase_user_required
+async def update_preferences(request):
+    """Applies an ordered list of {activity_id, action} operations in one transaction.
 
-        if action == "favorite":
-            if activity in user.saved_activities.all():
-                user.saved_activities.remove(activity)
-                message = "Activity removed from favorites"
-            else:
-                user.saved_activities.add(activity)
-                message = "Activity added to favorites"
-
-        elif action == "upvote":
-            user.thumbs_up.add(activity)
-            user.thumbs_down.remove(activity)
-            message = "Activity upvoted"
-
-        elif action == "downvote":
-            user.thumbs_down.add(activity)
-            user.thumbs_up.remove(activity)
-            message = "Activity downvoted"
-
-        user.save()
-        return JsonResponse({"message": message, "action": action, "activity": NPSThingToDoSerializer(activity).data})
-    except CustomUser.DoesNotExist:
-        return JsonResponse({"error": "User not found"}, status=404)
-    except NPSThingToDo.DoesNotExist:
-        return JsonResponse({"error": "Activity not found"}, status=404)
+    The last operation on an activity wins (favorite toggles). Returns each touched
+    activity's final favorite and vote state along with the activity.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request"}, status=400)
+
+    try:
+        operations = json.loads(request.body).get("operations")
+        if isinstance(operations, list) and len(operations) > MAX_PREFERENCE_BATCH:
+            return JsonResponse({"error": f"At most {MAX_PREFERENCE_BATCH} operations per batch"}, status=400)
+
+        results = await sync_to_async(apply_preferences)(request.user, operations)
+        return FastJsonResponse({"results": [
+            {
+                "activity_id": activity_id,
+                "favorited": favorited,
+                "vote": vote,
+                "activity": render_activity(activity),
+            }
+            for activity_id, (favorited, vote, activity) in results.items()
+        ]})
+    except PreferenceError as e:
+        return JsonResponse({"error": str(e)}, status=e.status)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
 
@@ -146,45 +159,66 @@ def register_or_login(request):
     if request.method != "POST":
         return JsonResponse({"error": "Invalid request"}, status=400)
 
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
+    token = bearer_token(request)
+    if token is None:
         return JsonResponse({"error": "Missing token"}, status=401)
 
-    token = auth_header.split("Bearer ")[1]
-
     try:
-        decoded_token = auth.verify_id_token(token)
-        firebase_uid = decoded_token["uid"]
-        user, created = CustomUser.objects.get_or_create(firebase_id=firebase_uid)
+        decoded_token = verify_id_token(token)
+        _, created = resolve_user_id(decoded_token["uid"], create=True)
         return JsonResponse({"message": "User authenticated", "new_user": created})
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=401)
 
-def get_activity(request):
-    """Returns a recommended 'thing to do' based on location."""
+async def get_activity(request):
+    """Returns a recommended 'thing to do' based on location.
+
+    Pass ``count`` to get a queue of that many distinct recommendations in one response.
+    Signed-in users are never shown activities they downvoted or were recently served.
+    """
     lat = float(request.GET.get("latitude"))
     lon = float(request.GET.get("longitude"))
-    recommender = DistanceRecommender()
-    activity = recommender.recommend(latitude=lat, longitude=lon)
-    return JsonResponse(NPSThingToDoSerializer(activity).data)
+    count = request.GET.get("count")
+    count = 1 if count is None else min(max(int(count), 1), MAX_ACTIVITY_BATCH)
+
+    user = await aget_request_user(request)
+    # Recommenders are synchronous (ORM, in-process indexes), so they run in a worker thread
+    activities = await sync_to_async(recommend_activities)(user, count, lat, lon)
+    record_events(InteractionEvent.IMPRESSION, user.id if user else None, [activity.id for activity in activities])
+
+    if request.GET.get("count") is None:
+        activity = activities[0] if activities else None
+        if activity is None:
+            return JsonResponse(NPSThingToDoSerializer(activity).data)
+        return FastJsonResponse(render_activity(activity))
+    return FastJsonResponse({"activities": [render_activity(activity) for activity in activities]})
+
+def recommend_activities(user, count, lat, lon):
+    """Runs the configured recommender, skipping and then remembering the user's exclusions."""
+    recommender = import_string(settings.ACTIVITY_RECOMMENDER)()
+    exclusions = user_exclusions.get(user.id) if user is not None else None
+    kwargs = {"user": user} if recommender.personalized else {}
+    activities = recommender.recommend_many(count=count, latitude=lat, longitude=lon, exclude=exclusions, **kwargs)
+
+    # The user has been shown everything nearby, so let recent impressions repeat
+    if not activities and exclusions is not None and exclusions.recent:
+        exclusions.clear_impressions()
+        activities = recommender.recommend_many(count=count, latitude=lat, longitude=lon, exclude=exclusions, **kwargs)
+
+    if exclusions is not None:
+        exclusions.record_impressions(activity.id for activity in activities)
+    return activities
 
 @csrf_exempt
+@firebase_user_required
 def create_activity(request):
     """Creates a new activity submitted by the user and associates it with their submitted activities."""
     if request.method != "POST":
         return JsonResponse({"error": "Invalid request"}, status=400)
 
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return JsonResponse({"error": "Unauthorized"}, status=401)
-
-    token = auth_header.split("Bearer ")[1]
+    user = request.user
 
     try:
-        decoded_token = auth.verify_id_token(token)
-        firebase_uid = decoded_token["uid"]
-        user = CustomUser.objects.get(firebase_id=firebase_uid)
-
         data = json.loads(request.body)
         serializer = NPSThingToDoSerializer(data=data)
 
@@ -195,29 +229,97 @@ def create_activity(request):
             activity = serializer.save()
             print('serializer saved')
             user.submitted_activities.add(activity)
-            user.save()
             return JsonResponse({"message": "Activity created successfully", "activity": serializer.data}, status=201)
         else:
             return JsonResponse({"error": serializer.errors}, status=400)
-    except CustomUser.DoesNotExist:
-        return JsonResponse({"error": "User not found"}, status=404)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
 
+async def cached_activity_details(activity_id):
+    """Returns the encoded details of an activity, querying and serializing it only on a cache miss."""
+    entry = activity_details.get(activity_id)
+    if entry is None:
+        activity = await NPSThingToDo.objects.aget(id=activity_id)
+        body = encode_json(render_activity(activity))
+        entry = CachedResponse(body, f'"{hashlib.sha1(body).hexdigest()}"', activity.updated_at.timestamp())
+        activity_details.set(activity_id, entry)
+    return entry
+
 @csrf_exempt
-def get_activity_details(request, activity_id):
-    """Returns details of a specific activity by ID."""
+async def get_activity_details(request, activity_id):
+    """Returns details of a specific activity by ID.
+
+    Served from pre-encoded bytes when cached, with an ETag and Last-Modified so a
+    client's repeat view is answered with a 304 and no body.
+    """
     if request.method != "GET":
         return JsonResponse({"error": "Invalid request"}, status=400)
 
     try:
-        activity = NPSThingToDo.objects.get(id=activity_id)
-        return JsonResponse(NPSThingToDoSerializer(activity).data)
+        entry = await cached_activity_details(activity_id)
+        user = await aget_request_user(request)
+        record_events(InteractionEvent.DETAIL_VIEW, user.id if user else None, [activity_id])
+
+        response = HttpResponse(entry.body, content_type="application/json")
+        response["ETag"] = entry.etag
+        response["Last-Modified"] = http_date(entry.last_modified)
+        patch_cache_control(response, public=True, max_age=ACTIVITY_DETAILS_MAX_AGE)
+        return get_conditional_response(
+            request, etag=entry.etag, last_modified=int(entry.last_modified), response=response
+        )
     except NPSThingToDo.DoesNotExist:
         return JsonResponse({"error": "Activity not found"}, status=404)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
 
+@csrf_exempt
+def record_client_events(request):
+    """Logs interactions only the client sees, e.g. ``{"events": [{"activity_id": 1, "event_type": "skip"}]}``.
+
+    Anonymous events are accepted; a valid Bearer token attributes them to the user.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request"}, status=400)
+
+    try:
+        events = json.loads(request.body).get("events")
+        if not isinstance(events, list) or not events or len(events) > MAX_EVENT_BATCH:
+            return JsonResponse({"error": f"Expected between 1 and {MAX_EVENT_BATCH} events"}, status=400)
+
+        by_type = {}
+        for event in events:
+            event_type = event.get("event_type")
+            if event_type not in CLIENT_EVENT_TYPES:
+                return JsonResponse({"error": f"Unsupported event type: {event_type}"}, status=400)
+            by_type.setdefault(event_type, []).append(int(event["activity_id"]))
+
+        user = get_request_user(request)
+        for event_type, activity_ids in by_type.items():
+            record_events(event_type, user.id if user else None, activity_ids)
+        return JsonResponse({"recorded": len(events)}, status=202)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+@csrf_exempt
+def get_similar_activities(request, activity_id):
+    """Returns activities whose descriptions are most similar to the given activity.
+
+    Signed-in users are never shown activities they downvoted.
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "Invalid request"}, status=400)
+
+    try:
+        if not NPSThingToDo.objects.filter(id=activity_id).exists():
+            return JsonResponse({"error": "Activity not found"}, status=404)
+        count = min(max(int(request.GET.get("count", 10)), 1), MAX_ACTIVITY_BATCH)
+        user = get_request_user(request)
+        exclude = user_exclusions.get(user.id).downvoted if user else None
+        activities = SimilarActivityRecommender().recommend_many(count=count, activity_id=activity_id, exclude=exclude)
+        return FastJsonResponse({"activities": [render_activity(activity) for activity in activities]})
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
 @csrf_exempt
 def upload_image(request):
     """Stores an uploaded image locally and returns a properly formatted URL."""
@@ -250,3 +352,7 @@ def upload_image(request):
 
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
+
+def metrics(request):
+    """Exposes this process's recommender metrics in Prometheus text format."""
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
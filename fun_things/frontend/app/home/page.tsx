@@ -1,6 +1,6 @@
 "use client";
 
-import { useState, useEffect, Suspense } from "react";
+import { useState, useEffect, useRef, Suspense } from "react";
 import axios from "axios";
 import ThingCard from "@/app/components/ThingCard";
 import FirebaseAuth from "@/app/components/FirebaseAuth";
@@ -17,6 +17,9 @@ interface Activity {
   description: string;
 }
 
+// Number of recommendations fetched per round trip to get-activity
+const ACTIVITY_BATCH_SIZE = 10;
+
 export default function HomePage() {
   return (
     <div className="min-h-screen flex flex-col items-center bg-gray-100 px-4 md:px-8 lg:px-12 py-6 relative">
@@ -41,6 +44,7 @@ function HomePageContent() {
   const searchParams = useSearchParams();
   const activityIdFromURL = searchParams.get("activity_id");
   const router = useRouter();
+  const activityQueue = useRef<Activity[]>([]);
 
   useEffect(() => {
     const unsubscribe = auth.onAuthStateChanged((user) => {
@@ -68,10 +72,26 @@ function HomePageContent() {
   const fetchActivity = async (isInitialFetch = false, activityId?: number) => {
     setInitialLoading(isInitialFetch);
     try {
-      const res = await axios.get<Activity>(
-        `http://127.0.0.1:8000/core/get-activity/?latitude=${latitude}&longitude=${longitude}`,
-      );
-      setActivity(res.data);
+      // Deep links load the shared activity itself; the browser revalidates it with its ETag
+      if (activityId !== undefined) {
+        const res = await axios.get<Activity>(
+          `http://127.0.0.1:8000/core/get-activity-details/${activityId}/`,
+        );
+        setActivity(res.data);
+        setInitialLoading(false);
+        return;
+      }
+      // Serve from the local queue and only hit the backend once it runs dry
+      if (activityQueue.current.length === 0) {
+        // Signed-in users get recommendations that skip what they've seen or downvoted
+        const token = await auth.currentUser?.getIdToken();
+        const res = await axios.get<{ activities: Activity[] }>(
+          `http://127.0.0.1:8000/core/get-activity/?latitude=${latitude}&longitude=${longitude}&count=${ACTIVITY_BATCH_SIZE}`,
+          token ? { headers: { Authorization: `Bearer ${token}` } } : undefined,
+        );
+        activityQueue.current = res.data.activities;
+      }
+      setActivity(activityQueue.current.shift() ?? null);
     } catch (error) {
       console.error("❌ Error fetching activity:", error);
     }
@@ -73,8 +73,11 @@ function HomePageContent() {
 
     setInitialLoading(isInitialFetch);
     try {
+      // Deep links load the shared activity itself; the browser revalidates it with its ETag
       const res = await axios.get<Activity>(
-        `http://127.0.0.1:8000/core/get-activity/?latitude=${latitude}&longitude=${longitude}`,
+        activityId !== undefined
+          ? `http://127.0.0.1:8000/core/get-activity-details/${activityId}/`
+          : `http://127.0.0.1:8000/core/get-activity/?latitude=${latitude}&longitude=${longitude}`,
       );
       setActivity(res.data);
     } catch (error) {
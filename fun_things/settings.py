@@ -48,6 +48,38 @@ SIMPLE_JWT = {
 
 AUTH_USER_MODEL = 'core.CustomUser'
 
+# Recommender used by get_activity. Alternatives to the full-table scan:
+# 'fun_things.core.recommenders.IndexedDistanceRecommender' samples from an
+# in-process spatial index, 'fun_things.core.recommenders.PostGISDistanceRecommender'
+# does the weighted draw inside PostgreSQL and returns a single row,
+# 'fun_things.core.recommenders.TileCachedDistanceRecommender' caches candidates
+# per ~5 km geohash cell.
+ACTIVITY_RECOMMENDER = 'fun_things.core.recommenders.DistanceRecommender'
+
+# Precomputed recommender artifacts (built by `python manage.py build_item_neighbors`
+# and `python manage.py build_content_index`)
+RECOMMENDER_DATA_DIR = os.path.join(BASE_DIR, "recommender_data")
+ITEM_NEIGHBORS_TOP_N = 50
+CONTENT_NEIGHBORS_TOP_K = 50
+# Votes update neighbour rows on a background thread this many seconds after the first
+# one in a burst (None updates inline on commit). Items with more voters than
+# ITEM_NEIGHBORS_MAX_USERS wait for the next batch build instead.
+ITEM_NEIGHBORS_UPDATE_DELAY = 1.0
+ITEM_NEIGHBORS_MAX_USERS = 1000
+
+# SQLite cache of LLM description rewrites used by NPSScraper
+REWRITE_CACHE_PATH = os.path.join(BASE_DIR, "recommender_data", "rewrite_cache.sqlite3")
+# Where an interrupted incremental NPS sync records the next page to fetch
+SYNC_CHECKPOINT_PATH = os.path.join(BASE_DIR, "recommender_data", "nps_sync_checkpoint.json")
+
+# Optional entry in CACHES shared across workers for per-cell recommendation
+# candidates. None keeps them in each process only.
+TILE_CACHE_ALIAS = None
+
+# Seconds between background writes of buffered InteractionEvents (see core.events).
+# None disables the writer thread, so events are only written by an explicit flush().
+INTERACTION_EVENT_FLUSH_INTERVAL = 1.0
+
 
 # Application definition
 
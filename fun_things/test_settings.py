@@ -0,0 +1,14 @@
+"""Settings for `python manage.py test`: background workers run inline, files go to a temp dir."""
+import tempfile
+
+from fun_things.settings import *  # noqa: F401,F403
+
+# Precomputed indexes, rewrite cache and sync checkpoint never touch the real data dir
+RECOMMENDER_DATA_DIR = tempfile.mkdtemp(prefix="fun-things-test-")
+REWRITE_CACHE_PATH = os.path.join(RECOMMENDER_DATA_DIR, "rewrite_cache.sqlite3")  # noqa: F405
+SYNC_CHECKPOINT_PATH = os.path.join(RECOMMENDER_DATA_DIR, "nps_sync_checkpoint.json")  # noqa: F405
+
+# Apply vote-driven neighbour updates on commit, inside the test's database connection
+ITEM_NEIGHBORS_UPDATE_DELAY = None
+# No writer thread: tests flush interaction events explicitly, inside their transaction
+INTERACTION_EVENT_FLUSH_INTERVAL = None
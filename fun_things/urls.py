@@ -22,9 +22,13 @@ from fun_things.core.views import (
     upload_image,
     register_or_login,
     update_preference,
+    update_preferences,
     get_user_favorites,
     get_user_created,
     get_activity_details,
+    get_similar_activities,
+    record_client_events,
+    metrics,
 )
 from django.conf import settings
 from django.conf.urls.static import static
@@ -36,9 +40,13 @@ urlpatterns = [
     path('core/upload-image/', upload_image, name='upload_image'),
     path('core/register-or-login/', register_or_login, name='register_or_login'),
     path('core/update-preference/', update_preference, name='update_preference'),
+    path('core/update-preferences/', update_preferences, name='update_preferences'),
     path('core/get-user-favorites/', get_user_favorites, name='get_user_favorites'),
     path('core/get-user-created/', get_user_created, name='get_user_created'),
     path('core/get-activity-details/<int:activity_id>/', get_activity_details, name='get_activity_details'),
+    path('core/get-similar-activities/<int:activity_id>/', get_similar_activities, name='get_similar_activities'),
+    path('core/record-events/', record_client_events, name='record_client_events'),
+    path('core/metrics/', metrics, name='metrics'),
 ]
 
 # ✅ Serve media files in development